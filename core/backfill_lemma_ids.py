@@ -0,0 +1,64 @@
+import argparse
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from tqdm import tqdm
+from db import database
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+BATCH_SIZE = 50_000
+
+PENDING = "id > :low AND id <= :high AND lemmas IS NOT NULL AND lemma_ids IS NULL"
+
+
+def _id_array(column: str) -> str:
+    """The JSONB string array column as lemma_vocabulary ids, in the same order."""
+    return (f"ARRAY(SELECT v.id FROM jsonb_array_elements_text({column}) WITH ORDINALITY AS e(token, position) "
+            f"JOIN lemma_vocabulary v ON v.token = e.token ORDER BY e.position)")
+
+
+def backfill_lemma_ids(clear_json: bool = False) -> int:
+    session = SessionLocal()
+    try:
+        clear = ", lemmas = NULL, words = NULL" if clear_json else ''
+        max_id = session.execute(text("SELECT coalesce(max(id), 0) FROM lemmatized_comments")).scalar()
+        updated = 0
+        for low in tqdm(range(0, max_id, BATCH_SIZE), desc='lemma ids', unit='batch'):
+            params = {'low': low, 'high': low + BATCH_SIZE}
+            # Committed before the UPDATE and in the byte order crud_utils.get_vocabulary_ids sorts by, so running
+            # lemmatization workers never wait on these vocabulary locks for long or take them in another order
+            session.execute(text(
+                "INSERT INTO lemma_vocabulary (token) "
+                "SELECT DISTINCT e.token COLLATE \"C\" FROM lemmatized_comments "
+                "CROSS JOIN LATERAL jsonb_array_elements_text(lemmas || coalesce(words, '[]'::jsonb)) AS e(token) "
+                f"WHERE {PENDING} "
+                "AND NOT EXISTS (SELECT 1 FROM lemma_vocabulary v WHERE v.token = e.token) "
+                "ORDER BY 1 "
+                "ON CONFLICT (token) DO NOTHING"
+            ), params)
+            session.commit()
+            updated += session.execute(text(
+                f"UPDATE lemmatized_comments SET lemma_ids = {_id_array('lemmas')}, "
+                f"word_ids = CASE WHEN words IS NULL THEN NULL ELSE {_id_array('words')} END{clear} "
+                f"WHERE {PENDING}"
+            ), params).rowcount
+            session.commit()
+        return updated
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill lemmatized_comments lemma_ids/word_ids from the stored JSON.')
+    parser.add_argument('--clear-json', action='store_true',
+                        help='set the lemmas/words JSON columns to NULL once their ids are backfilled')
+    args = parser.parse_args()
+
+    t_start = time.time()
+    print('Backfilling lemma id arrays...')
+    updated = backfill_lemma_ids(args.clear_json)
+    print(f'{updated} rows backfilled')
+    if args.clear_json:
+        print('The cleared JSON only frees disk space after VACUUM FULL lemmatized_comments (or pg_repack).')
+    print(f'Finished in {time.time() - t_start:.1f}s')
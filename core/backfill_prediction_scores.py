@@ -0,0 +1,74 @@
+import argparse
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from tqdm import tqdm
+from db import crud_utils, database
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+BATCH_SIZE = 50_000
+LABEL_SETS = ['ekman', 'normal']
+
+
+def stored_labels(session, name: str) -> list:
+    """Label order of a set: the recorded one, else the keys of the first stored prediction."""
+    labels = session.execute(
+        text("SELECT labels FROM prediction_label_sets WHERE name = :name"), {'name': name}
+    ).scalar()
+    if labels is None:
+        labels = session.execute(text(
+            f"SELECT array_agg(key) FROM (SELECT jsonb_object_keys({name}_prediction_json) AS key FROM "
+            f"(SELECT {name}_prediction_json FROM predicted_comments "
+            f"WHERE {name}_prediction_json IS NOT NULL LIMIT 1) first_row) keys"
+        )).scalar()
+    if labels is None:
+        return None
+    return crud_utils.get_prediction_label_order(session, name, labels)
+
+
+def backfill_label_set(session, name: str, clear_json: bool) -> int:
+    labels = stored_labels(session, name)
+    session.commit()
+    if labels is None:
+        print(f'[{name}] no stored predictions, nothing to backfill')
+        return 0
+    print(f'[{name}] label order: {", ".join(labels)}')
+
+    scores = ', '.join(f"CAST({name}_prediction_json ->> :label_{i} AS real)" for i in range(len(labels)))
+    clear = f", {name}_prediction_json = NULL" if clear_json else ''
+    params = {f'label_{i}': label for i, label in enumerate(labels)}
+    max_id = session.execute(text("SELECT coalesce(max(id), 0) FROM predicted_comments")).scalar()
+    updated = 0
+    for low in tqdm(range(0, max_id, BATCH_SIZE), desc=f'{name} scores', unit='batch'):
+        updated += session.execute(
+            text(f"UPDATE predicted_comments SET {name}_scores = ARRAY[{scores}]{clear} "
+                 f"WHERE id > :low AND id <= :high AND {name}_prediction_json IS NOT NULL AND {name}_scores IS NULL"),
+            {**params, 'low': low, 'high': low + BATCH_SIZE},
+        ).rowcount
+        session.commit()
+    return updated
+
+
+def backfill_prediction_scores(clear_json: bool = False):
+    session = SessionLocal()
+    try:
+        for name in LABEL_SETS:
+            updated = backfill_label_set(session, name, clear_json)
+            print(f'[{name}] {updated} rows backfilled')
+    finally:
+        session.close()
+    if clear_json:
+        print('The cleared JSON only frees disk space after VACUUM FULL predicted_comments (or pg_repack).')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill predicted_comments *_scores arrays from the stored JSON.')
+    parser.add_argument('--clear-json', action='store_true',
+                        help='set the *_prediction_json columns to NULL once their scores are backfilled')
+    args = parser.parse_args()
+
+    t_start = time.time()
+    print('Backfilling prediction score arrays...')
+    backfill_prediction_scores(args.clear_json)
+    print(f'Finished in {time.time() - t_start:.1f}s')
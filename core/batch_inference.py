@@ -0,0 +1,95 @@
+from typing import NamedTuple
+
+import numpy as np
+import torch
+
+from core.token_batching import MAX_LENGTH, plan_token_batches
+
+
+class EncodedBatch(NamedTuple):
+    indices: list  # positions of the batch's texts in the chunk they came from
+    lengths: list  # unpadded token count of each text
+    inputs: dict  # padded model inputs as int64 arrays: input_ids, attention_mask, token_type_ids
+
+
+def is_multi_label(config) -> bool:
+    return config.problem_type == 'multi_label_classification' or config.num_labels == 1
+
+
+def logits_to_scores(logits: np.ndarray, multi_label: bool) -> np.ndarray:
+    # Same post-processing the text-classification pipeline applies: sigmoid for multi-label heads, softmax otherwise
+    if multi_label:
+        return 1.0 / (1.0 + np.exp(-logits))
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def _pad(sequences: list, width: int, pad_value: int) -> np.ndarray:
+    padded = np.full((len(sequences), width), pad_value, dtype=np.int64)
+    for row, sequence in enumerate(sequences):
+        padded[row, :len(sequence)] = sequence
+    return padded
+
+
+def encode_chunk(tokenizer, texts: list, max_batch_tokens: int, max_batch_size: int,
+                 max_length=MAX_LENGTH, token_ids: list = None) -> list[EncodedBatch]:
+    """Tokenize a chunk once and split it into padded token-budget batches.
+
+    token_ids optionally gives each text's already stored input ids (see core.token_store), or None
+    for the texts that still have to be tokenized.
+    """
+    if not texts:
+        return []
+    input_ids = list(token_ids) if token_ids is not None else [None] * len(texts)
+    # Single-sequence inputs: stored texts get all-zero token type ids, as the tokenizer gives them
+    token_type_ids = [None if ids is None else np.zeros(len(ids), dtype=np.int64) for ids in input_ids]
+    missing = [i for i, ids in enumerate(input_ids) if ids is None]
+    if missing:
+        encoded = tokenizer([texts[i] for i in missing], truncation=True, max_length=max_length,
+                            return_token_type_ids=True)
+        for i, ids, type_ids in zip(missing, encoded['input_ids'], encoded['token_type_ids']):
+            input_ids[i] = ids
+            token_type_ids[i] = type_ids
+    lengths = [len(ids) for ids in input_ids]
+
+    batches = []
+    for indices in plan_token_batches(lengths, max_batch_tokens, max_batch_size):
+        batch_lengths = [lengths[i] for i in indices]
+        width = max(batch_lengths)
+        batches.append(EncodedBatch(indices, batch_lengths, {
+            'input_ids': _pad([input_ids[i] for i in indices], width, tokenizer.pad_token_id),
+            'attention_mask': _pad([[1] * length for length in batch_lengths], width, 0),
+            'token_type_ids': _pad([token_type_ids[i] for i in indices], width, 0),
+        }))
+    return batches
+
+
+def prediction_labels(pipeline) -> list:
+    if hasattr(pipeline, 'labels'):
+        return pipeline.labels
+    id2label = pipeline.model.config.id2label
+    return [id2label[i] for i in range(len(id2label))]
+
+
+def score_batch(pipeline, inputs: dict) -> np.ndarray:
+    """Label probabilities for one encoded batch, from either an ONNX classifier or a transformers pipeline."""
+    if hasattr(pipeline, 'run_encoded'):
+        return pipeline.run_encoded(inputs)
+
+    model = pipeline.model
+    feed = {
+        name: torch.from_numpy(array).to(model.device)
+        for name, array in inputs.items() if name in pipeline.tokenizer.model_input_names
+    }
+    with torch.inference_mode():
+        logits = model(**feed).logits.float().cpu().numpy()
+    return logits_to_scores(logits, is_multi_label(model.config))
+
+
+def format_predictions(scores: np.ndarray, labels: list) -> list:
+    """Per text, every label with its score from most to least likely, as the pipeline returns with top_k=None."""
+    results = []
+    for row in scores:
+        order = np.argsort(-row, kind='stable')
+        results.append([{'label': labels[i], 'score': float(row[i])} for i in order])
+    return results
@@ -1,14 +1,16 @@
-from collections import Counter
+import numpy as np
 from sqlalchemy.orm import sessionmaker
 from tqdm import tqdm
-from db import database, models
+from core import lemma_vocabulary
+from db import crud_utils, database, models
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
 
 BATCH_SIZE = 50_000
 
 
-def build_frequency_map(session, language: str) -> Counter:
+def build_frequency_map(session, language: str) -> np.ndarray:
+    """Occurrences of every lemma_vocabulary id among the language's lemmas."""
     total = (
         session.query(models.LemmatizedComment)
         .join(models.Comment, models.LemmatizedComment.comment_id == models.Comment.id)
@@ -17,20 +19,34 @@ def build_frequency_map(session, language: str) -> Counter:
     )
 
     query = (
-        session.query(models.LemmatizedComment.lemmas)
+        session.query(models.LemmatizedComment.lemma_ids)
         .join(models.Comment, models.LemmatizedComment.comment_id == models.Comment.id)
         .filter(models.Comment.comment_lang == language)
         .yield_per(BATCH_SIZE)
     )
 
-    counter: Counter = Counter()
+    counts = np.zeros(0, dtype=np.int64)
+    batch = []
     with tqdm(total=total, unit='comments', desc=f'frequency [{language}]') as pbar:
-        for (lemmas,) in query:
-            if lemmas:
-                counter.update(lemmas)
-            pbar.update(1)
+        for (lemma_ids,) in query:
+            batch.append(lemma_ids)
+            if len(batch) == BATCH_SIZE:
+                counts = _add_counts(counts, batch)
+                pbar.update(len(batch))
+                batch = []
+        counts = _add_counts(counts, batch)
+        pbar.update(len(batch))
 
-    return counter
+    return counts
+
+
+def _add_counts(counts: np.ndarray, lemma_id_arrays) -> np.ndarray:
+    lemma_ids, _ = lemma_vocabulary.flatten_ids(lemma_id_arrays)
+    batch_counts = np.bincount(lemma_ids)
+    if len(batch_counts) > len(counts):
+        counts = np.pad(counts, (0, len(batch_counts) - len(counts)))
+    counts[:len(batch_counts)] += batch_counts
+    return counts
 
 
 def calculate_frequencies():
@@ -43,10 +59,13 @@ def calculate_frequencies():
 
         freq_lv = build_frequency_map(session, 'lv')
         freq_ru = build_frequency_map(session, 'ru')
+        # Words that never occurred in a lemma are not in the vocabulary, and get frequency 0
+        vocabulary = crud_utils.find_vocabulary_ids(session, [kw.word.lower() for kw in keywords])
 
         for kw in keywords:
             freq_map = freq_ru if kw.language == 'ru' else freq_lv
-            kw.frequency = freq_map[kw.word.lower()]
+            vocabulary_id = vocabulary.get(kw.word.lower(), len(freq_map))
+            kw.frequency = int(freq_map[vocabulary_id]) if vocabulary_id < len(freq_map) else 0
 
         session.commit()
         print(f'Updated frequency for {len(keywords)} keywords.')
@@ -1,8 +1,10 @@
 import time
+import numpy as np
 import pandas as pd
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import cast, Date, extract
 from tqdm import tqdm
+from core import lemma_vocabulary
 from db import database, models
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
@@ -11,17 +13,19 @@ SUPPORTED_LANGUAGES = ['lv', 'ru']
 WEBSITES = ['tvnet', 'delfi', 'apollo']
 
 
-def _score_lemmas(aggressive_weights, lemmas):
-    if not lemmas:
-        return 0, 0.0
-    count = 0
-    wsum = 0.0
-    for lemma in lemmas:
-        w = aggressive_weights.get(lemma)
-        if w is not None:
-            count += 1
-            wsum += w
-    return count, wsum
+def score_comments(aggressive_weights, lemma_id_arrays):
+    """Aggressive lemma count and weight sum of every comment, from one flat array of all their lemma ids.
+
+    bincount adds each comment's weights in lemma order, so the sums are the same floats as adding them up
+    comment by comment.
+    """
+    lemma_ids, lengths = lemma_vocabulary.flatten_ids(lemma_id_arrays)
+    weights = lemma_vocabulary.lookup(aggressive_weights, lemma_ids, np.nan)
+    hits = ~np.isnan(weights)
+    rows = lemma_vocabulary.owners(lengths)[hits]
+    counts = np.bincount(rows, minlength=len(lengths))
+    weight_sums = np.bincount(rows, weights=weights[hits], minlength=len(lengths))
+    return counts, weight_sums
 
 
 def _make_records(grouped, scope_name, lang, already_processed):
@@ -46,14 +50,52 @@ def _make_records(grouped, scope_name, lang, already_processed):
     return records
 
 
-def calculate_aggressiveness():
+def aggregate_month(df, lang, already_processed):
+    """Records of every (date, website) and (date, 'all') of a month of scored comments not processed yet."""
+    agg = dict(
+        total_word_count=('lemma_count', 'sum'),
+        aggressive_word_count=('agg_count', 'sum'),
+        aggressive_word_weight_sum=('agg_weight', 'sum'),
+    )
+
+    records = []
+    website_groupbys = []
+
+    for website in WEBSITES:
+        scope_df = df[df['website'] == website]
+        if scope_df.empty:
+            continue
+        grouped = scope_df.groupby('comment_date').agg(**agg).reset_index()
+        website_groupbys.append(grouped)
+        records.extend(_make_records(grouped, website, lang, already_processed))
+
+    # 'all' summed from already-computed per-website groupbys — avoids a second pass through df
+    if website_groupbys:
+        all_grouped = (
+            pd.concat(website_groupbys)
+            .groupby('comment_date', as_index=False)[
+                ['total_word_count', 'aggressive_word_count', 'aggressive_word_weight_sum']
+            ]
+            .sum()
+        )
+        records.extend(_make_records(all_grouped, 'all', lang, already_processed))
+    return records
+
+
+def calculate_aggressiveness(dates=None):
+    """Fill missing days; with dates given, recompute only those days (their existing rows are replaced)."""
     session = SessionLocal()
     try:
-        aggressive_weights = {
-            row.word: row.weight
-            for row in session.query(models.AggressiveKeyword).all()
-        }
-        print(f'Loaded {len(aggressive_weights)} aggressive keywords')
+        if dates:
+            session.query(models.AggressivenessByDay).filter(
+                cast(models.AggressivenessByDay.date, Date).in_(dates)
+            ).delete(synchronize_session=False)
+            session.commit()
+        affected_months = {(date.year, date.month) for date in dates} if dates else None
+
+        # Indexed by lemma_vocabulary id, NaN for lemmas that are not aggressive keywords
+        aggressive_weights = lemma_vocabulary.keyword_weights(session)
+        print(f'Loaded {np.count_nonzero(~np.isnan(aggressive_weights))} aggressive keywords found in the lemma vocabulary')
 
         already_processed = {
             (row[0], row[1], row[2]) for row in session.query(
@@ -64,8 +106,6 @@ def calculate_aggressiveness():
         }
         print(f'Already processed (date, lang, website) triples: {len(already_processed)}')
 
-        scorer = lambda lemmas: pd.Series(_score_lemmas(aggressive_weights, lemmas))
-
         for lang in SUPPORTED_LANGUAGES:
             months = (
                 session.query(
@@ -78,13 +118,15 @@ def calculate_aggressiveness():
                 .order_by('year', 'month')
                 .all()
             )
+            if affected_months is not None:
+                months = [(year, month) for year, month in months if (int(year), int(month)) in affected_months]
 
             tqdm.write(f'\nLanguage: {lang} — {len(months)} months to process')
 
             for year, month in tqdm(months, desc=f'{lang}'):
                 rows = (
                     session.query(
-                        models.LemmatizedComment.lemmas,
+                        models.LemmatizedComment.lemma_ids,
                         models.LemmatizedComment.lemma_count,
                         cast(models.Comment.timestamp, Date).label('comment_date'),
                         models.Comment.website,
@@ -98,40 +140,13 @@ def calculate_aggressiveness():
                     .all()
                 )
 
-                df = pd.DataFrame(rows, columns=['lemmas', 'lemma_count', 'comment_date', 'website'])
+                df = pd.DataFrame(rows, columns=['lemma_ids', 'lemma_count', 'comment_date', 'website'])
                 df['comment_date'] = pd.to_datetime(df['comment_date']).dt.date
 
                 # Score every comment once for the whole month
-                df[['agg_count', 'agg_weight']] = df['lemmas'].apply(scorer)
-
-                agg = dict(
-                    total_word_count=('lemma_count', 'sum'),
-                    aggressive_word_count=('agg_count', 'sum'),
-                    aggressive_word_weight_sum=('agg_weight', 'sum'),
-                )
-
-                records = []
-                website_groupbys = []
-
-                for website in WEBSITES:
-                    scope_df = df[df['website'] == website]
-                    if scope_df.empty:
-                        continue
-                    grouped = scope_df.groupby('comment_date').agg(**agg).reset_index()
-                    website_groupbys.append(grouped)
-                    records.extend(_make_records(grouped, website, lang, already_processed))
-
-                # 'all' summed from already-computed per-website groupbys — avoids a second pass through df
-                if website_groupbys:
-                    all_grouped = (
-                        pd.concat(website_groupbys)
-                        .groupby('comment_date', as_index=False)[
-                            ['total_word_count', 'aggressive_word_count', 'aggressive_word_weight_sum']
-                        ]
-                        .sum()
-                    )
-                    records.extend(_make_records(all_grouped, 'all', lang, already_processed))
+                df['agg_count'], df['agg_weight'] = score_comments(aggressive_weights, df['lemma_ids'])
 
+                records = aggregate_month(df, lang, already_processed)
                 if records:
                     session.bulk_insert_mappings(models.AggressivenessByDay, records)
                 session.commit()
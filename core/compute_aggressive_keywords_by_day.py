@@ -1,13 +1,14 @@
 import time
-from collections import defaultdict
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import func
+from sqlalchemy import Date, cast, func
 from sqlalchemy.orm import sessionmaker
 from tqdm import tqdm
 
-from db import database, models
+from core import lemma_vocabulary
+from db import crud_utils, database, models
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
 
@@ -33,14 +34,59 @@ def _month_chunk_range(month_chunk):
     return start, end
 
 
-def compute_aggressive_keywords_by_day():
+def _keyword_matches(df, aggressive_weights):
+    """One row per aggressive lemma in df's comments: its row in df, lemma id, weight and word form id (-1 if
+    the comment has no word forms), from flat arrays of all the comments' ids."""
+    lemma_ids, lemma_lengths = lemma_vocabulary.flatten_ids(df['lemma_ids'])
+    weights = lemma_vocabulary.lookup(aggressive_weights, lemma_ids, np.nan)
+    hits = np.flatnonzero(~np.isnan(weights))
+    rows = lemma_vocabulary.owners(lemma_lengths)[hits]
+    positions = hits - lemma_vocabulary.offsets(lemma_lengths)[rows]
+
+    # word_ids[i] is the surface form of lemma_ids[i]
+    word_ids, word_lengths = lemma_vocabulary.flatten_ids(df['word_ids'])
+    has_form = positions < word_lengths[rows]
+    form_ids = np.full(len(hits), -1, dtype=np.int64)
+    form_ids[has_form] = word_ids[lemma_vocabulary.offsets(word_lengths)[rows[has_form]] + positions[has_form]]
+    return pd.DataFrame({
+        'lemma_id': lemma_ids[hits],
+        'weight': weights[hits],
+        'form_id': form_ids,
+        'article_id': df['article_id'].to_numpy()[rows],
+        'website': df['website'].to_numpy()[rows],
+        'comment_date': df['comment_date'].to_numpy()[rows],
+    })
+
+
+def _keywords_json(matches, tokens):
+    keywords_json = {}
+    for lemma_id, group in matches.groupby('lemma_id', sort=False):
+        forms = group.loc[group['form_id'] >= 0, 'form_id'].value_counts(sort=False)
+        article_ids = sorted({int(article_id) for article_id in group['article_id']})
+        keywords_json[tokens[lemma_id]] = {
+            'count': len(group),
+            'weight_sum': float(group['weight'].sum()),
+            'forms': {tokens[form_id]: int(count) for form_id, count in forms.items()},
+            'article_ids': article_ids,
+            'article_count': len(article_ids),
+        }
+    return keywords_json
+
+
+def compute_aggressive_keywords_by_day(dates=None):
+    """Fill missing days; with dates given, recompute only those days (their existing rows are replaced)."""
     session = SessionLocal()
     try:
-        aggressive_keywords = {
-            row.word: row.weight
-            for row in session.query(models.AggressiveKeyword).all()
-        }
-        print(f'Loaded {len(aggressive_keywords)} aggressive keywords')
+        if dates:
+            session.query(models.AggressiveKeywordsByDay).filter(
+                cast(models.AggressiveKeywordsByDay.date, Date).in_(dates)
+            ).delete(synchronize_session=False)
+            session.commit()
+        affected_months = {(date.year, date.month) for date in dates} if dates else None
+
+        # Indexed by lemma_vocabulary id, NaN for lemmas that are not aggressive keywords
+        aggressive_weights = lemma_vocabulary.keyword_weights(session)
+        print(f'Loaded {np.count_nonzero(~np.isnan(aggressive_weights))} aggressive keywords found in the lemma vocabulary')
 
         already_processed = {
             (row[0], row[1], row[2]) for row in session.query(
@@ -66,6 +112,8 @@ def compute_aggressive_keywords_by_day():
 
             months = list(_iter_months(min_ts.year, min_ts.month, max_ts.year, max_ts.month))
             chunks = [months[i:i + CHUNK_MONTHS] for i in range(0, len(months), CHUNK_MONTHS)]
+            if affected_months is not None:
+                chunks = [chunk for chunk in chunks if any(month in affected_months for month in chunk)]
             print(f'\n[{lang}] {len(months)} months → {len(chunks)} chunks of {CHUNK_MONTHS} month(s)')
 
             for month_chunk in tqdm(chunks, desc=f'[{lang}]', unit='month'):
@@ -73,8 +121,8 @@ def compute_aggressive_keywords_by_day():
 
                 rows = (
                     session.query(
-                        models.LemmatizedComment.lemmas,
-                        models.LemmatizedComment.words,
+                        models.LemmatizedComment.lemma_ids,
+                        models.LemmatizedComment.word_ids,
                         models.LemmatizedComment.lemma_count,
                         models.Comment.timestamp,
                         models.Comment.website,
@@ -89,12 +137,22 @@ def compute_aggressive_keywords_by_day():
                     .all()
                 )
 
-                df = pd.DataFrame(rows, columns=['lemmas', 'words', 'lemma_count', 'timestamp', 'website', 'article_id'])
+                df = pd.DataFrame(rows, columns=['lemma_ids', 'word_ids', 'lemma_count', 'timestamp', 'website',
+                                                 'article_id'])
                 df['comment_date'] = pd.to_datetime(df['timestamp']).dt.date
 
+                # Find the month's aggressive lemmas once, and decode only their ids
+                matches = _keyword_matches(df, aggressive_weights)
+                tokens = crud_utils.get_vocabulary_tokens(
+                    session, np.union1d(matches['lemma_id'], matches['form_id'][matches['form_id'] >= 0]).tolist()
+                )
+
                 # Group once to avoid repeated boolean masking per scope/date
                 site_date_dfs = dict(tuple(df.groupby(['website', 'comment_date'])))
                 all_date_dfs = dict(tuple(df.groupby('comment_date')))
+                site_date_matches = dict(tuple(matches.groupby(['website', 'comment_date'])))
+                all_date_matches = dict(tuple(matches.groupby('comment_date')))
+                no_matches = matches.iloc[:0]
                 chunk_dates = sorted(df['comment_date'].unique())
 
                 for scope_name in WEBSITES + ['all']:
@@ -114,37 +172,12 @@ def compute_aggressive_keywords_by_day():
                         if total_word_count == 0:
                             continue
 
-                        keyword_counts = defaultdict(lambda: {
-                            'count': 0,
-                            'weight_sum': 0.0,
-                            'forms': defaultdict(int),
-                            'article_ids': set(),
-                        })
-
-                        for lemmas, words, article_id in zip(day_df['lemmas'], day_df['words'], day_df['article_id']):
-                            if not lemmas:
-                                continue
-                            words = words or []
-                            for i, lemma in enumerate(lemmas):
-                                w = aggressive_keywords.get(lemma)
-                                if w is not None:
-                                    kc = keyword_counts[lemma]
-                                    kc['count'] += 1
-                                    kc['weight_sum'] += w
-                                    kc['article_ids'].add(int(article_id))
-                                    if i < len(words):
-                                        kc['forms'][words[i]] += 1
-
-                        keywords_json = {
-                            word: {
-                                'count': v['count'],
-                                'weight_sum': v['weight_sum'],
-                                'forms': dict(v['forms']),
-                                'article_ids': list(v['article_ids']),
-                                'article_count': len(v['article_ids']),
-                            }
-                            for word, v in keyword_counts.items()
-                        }
+                        day_matches = (
+                            all_date_matches.get(date, no_matches)
+                            if scope_name == 'all'
+                            else site_date_matches.get((scope_name, date), no_matches)
+                        )
+                        keywords_json = _keywords_json(day_matches, tokens)
 
                         session.add(models.AggressiveKeywordsByDay(
                             date=date,
@@ -1,14 +1,16 @@
-import csv
-import gzip
+import argparse
+import multiprocessing
 import os
-import re
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
-import math
-import pandas as pd
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from tqdm import tqdm
 
+from core.language_detection import determine_text_language_batch
+from core.tsv_reader import TsvReader, file_content_hash, peak_rss_mb
 from db import crud_utils, database
 from path_config import data_path
 
@@ -17,184 +19,407 @@ new_delfi_data = data_path('delfi-new')
 old_delfi_data = data_path('delfi')
 apollo_data = data_path('apollo')
 tvnet_data = data_path('tvnet')
+delfi_v3_data = data_path('v3/delfi')
 years_to_process = ['2020', '2021', '2022', '2023', '2024']
 CHUNK_SIZE = 100_000
+ARTICLE_DTYPES = {'region': str, 'article_id': 'Int64', 'headline': str, 'pub_timestamp': str, 'url': str}
+COMMENT_DTYPES = {'region': str, 'article_id': 'Int64', 'user_nickname': str, 'encoded_ip': str,
+                  'timestamp': str, 'comment_text': str}
+
+# Per-file byte progress bars; turned off in pool workers where they would interleave
+show_file_progress = True
+# Pool workers report every file here before and after importing it
+file_states = None
 
 # Session placeholder
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
 session = SessionLocal()
 
-processed_article_file_list = crud_utils.get_processed_article_files(session)
-processed_comment_file_list = crud_utils.get_processed_comment_files(session)
+import_manifest = {}
+# Files logged as imported before the manifest existed; adopted into it instead of being re-imported
+legacy_imported_files = set()
+
+
+def reload_import_state():
+    global import_manifest, legacy_imported_files
+    import_manifest = crud_utils.get_import_manifest(session)
+    legacy_imported_files = set(crud_utils.get_processed_article_files(session) +
+                                crud_utils.get_processed_comment_files(session))
 
-_CYRILLIC = re.compile(r'[Ѐ-ӿ]')
-_LATIN    = re.compile(r'[A-Za-zĀ-žā-ž]')
-_REGION_LANG = {'rus': 'ru', 'lat': 'lv'}
 
-def determine_text_language(text_str, region=None):
-    cyrillic = len(_CYRILLIC.findall(text_str))
-    latin    = len(_LATIN.findall(text_str))
-    total    = cyrillic + latin
-    if total == 0:
-        return _REGION_LANG.get(region, 'lv')
-    return 'ru' if cyrillic / total > 0.85 else _REGION_LANG.get(region, 'lv')
+reload_import_state()
 
+IMPORT_ACTIONS = ('new', 'changed')
 
-def log_import(tracking_table, base_filename, status, notes, website):
+def log_import(tracking_table, base_filename, status, notes, website, reader=None):
+    metrics = {'mb_per_sec': reader.mb_per_sec, 'peak_rss_mb': peak_rss_mb()} if reader else {}
     if tracking_table == 'log_articles_imports':
-        crud_utils.create_log_articles_import(session, base_filename, status, notes, website)
+        crud_utils.create_log_articles_import(session, base_filename, status, notes, website, **metrics)
     elif tracking_table == 'log_comments_imports':
-        crud_utils.create_log_comments_import(session, base_filename, status, notes, website)
+        crud_utils.create_log_comments_import(session, base_filename, status, notes, website, **metrics)
 
 
-def process_directory(directory, website):
-    global processed_article_file_list, processed_comment_file_list
-    excluded_files = processed_article_file_list + processed_comment_file_list
-    sorted_filenames = sorted(os.listdir(directory))
-
-    for filename in sorted_filenames:
-        if filename in excluded_files:
-            continue
+def list_import_files(directory):
+    file_paths = []
+    for filename in sorted(os.listdir(directory)):
         if filename.endswith('.txt') or filename.endswith('.txt.gz'):
             if any(year in filename for year in years_to_process):
-                process_file(os.path.join(directory, filename), website)
+                file_paths.append(os.path.join(directory, filename))
+    return file_paths
 
 
-def get_base_filename(file_path):
-    return os.path.basename(file_path)
+def manifest_key(file_path):
+    return os.path.relpath(os.path.abspath(file_path), data_path())
+
+
+def plan_file(file_path):
+    """Classify a file against the manifest and return (action, content hash if already known).
+
+    new / changed files are imported; unchanged ones are skipped on size+mtime alone; touched files
+    (new size or mtime, same content hash) and adopted legacy files are skipped and only recorded.
+    """
+    entry = import_manifest.get(manifest_key(file_path))
+    if entry is None:
+        if get_base_filename(file_path) in legacy_imported_files:
+            return 'adopted', None
+        return 'new', None
+    stat = os.stat(file_path)
+    if entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+        return 'unchanged', entry.content_hash
+    content_hash = file_content_hash(file_path)
+    if content_hash == entry.content_hash:
+        return 'touched', content_hash
+    return 'changed', content_hash
+
+
+def record_manifest(file_path, website, content_hash=None):
+    stat = os.stat(file_path)
+    crud_utils.record_import_manifest(session, manifest_key(file_path), website, stat.st_size, stat.st_mtime,
+                                      content_hash or file_content_hash(file_path))
+
+
+def skip_file(file_path, website, action, content_hash):
+    if action in ('adopted', 'touched'):
+        record_manifest(file_path, website, content_hash)
+        session.commit()
+
+
+def plan_directories(directories):
+    return [
+        (file_path, website, *plan_file(file_path))
+        for directory, website in directories
+        for file_path in list_import_files(directory)
+    ]
+
+
+def print_import_plan(directories, single_files=()):
+    plan = [(file_path, website, *plan_file(file_path)) for file_path, website in single_files
+            if os.path.exists(file_path)]
+    plan += plan_directories(directories)
+    for file_path, website, action, _ in plan:
+        print(f"{action:<10} {website:<7} {file_path}")
+    counts = {action: sum(1 for entry in plan if entry[2] == action)
+              for action in ('new', 'changed', 'unchanged', 'touched', 'adopted')}
+    print(', '.join(f"{count} {action}" for action, count in counts.items()))
+
+
+def process_directory(directory, website):
+    for file_path, website, action, content_hash in plan_directories([(directory, website)]):
+        if action in IMPORT_ACTIONS:
+            process_file(file_path, website)
+        else:
+            skip_file(file_path, website, action, content_hash)
+
+
+def init_import_worker(state_queue):
+    # Forked workers must not touch the parent's pooled connections; give each one its own engine
+    global session, show_file_progress, file_states
+    show_file_progress = False
+    file_states = state_queue
+    database.engine.dispose(close=False)
+    worker_engine = create_engine(database.SQLALCHEMY_DATABASE_URL, pool_size=1, max_overflow=0)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)()
 
 
-def create_df_from_file(file_path, columns):
+def import_file_worker(file_path, website):
+    # SimpleQueue writes synchronously, so the state is reported even if this worker is killed right after.
+    # 'finished' also covers files whose result is lost when another worker breaks the pool.
+    file_states.put((file_path, 'started'))
     try:
-        if file_path.endswith('.gz'):
-            with gzip.open(file_path, 'rt', encoding='utf-8') as file:
-                df = pd.read_csv(file, sep='\t', header=None, on_bad_lines='skip', quoting=csv.QUOTE_NONE)
+        process_file(file_path, website)
+    finally:
+        file_states.put((file_path, 'finished'))
+    return file_path
+
+
+def drain_file_states(state_queue, states):
+    # Read as files finish, so the queue's pipe never fills up and blocks the workers
+    while not state_queue.empty():
+        file_path, state = state_queue.get()
+        states[file_path] = state
+
+
+def log_broken_pool(phase, broken_files, states):
+    """A dead worker broke the pool: log the files that were being imported, leave the rest for the next run."""
+    interrupted = [(file_path, website) for file_path, website in broken_files if states.get(file_path) == 'started']
+    for file_path, website in interrupted:
+        print(f"Worker died while importing file {file_path}")
+        log_import(get_tracking_table(file_path), get_base_filename(file_path), "Failed",
+                   "Worker process died during import", website)
+    not_started = sum(1 for file_path, _ in broken_files if file_path not in states)
+    print(f"{phase} import aborted: a worker process died. {not_started} files were not started "
+          f"and are imported by the next run.")
+
+
+def process_directories_parallel(directories, workers):
+    """Import (directory, website) pairs on a process pool: all article files first, then all comment files."""
+    files = []
+    for file_path, website, action, content_hash in plan_directories(directories):
+        if action in IMPORT_ACTIONS:
+            files.append((file_path, website))
         else:
-            df = pd.read_csv(file_path, sep='\t', header=None, on_bad_lines='skip', quoting=csv.QUOTE_NONE)
-    except Exception as e:
-        raise e
+            skip_file(file_path, website, action, content_hash)
+    article_files = [(file_path, website) for file_path, website in files if is_article_file(file_path)]
+    comment_files = [(file_path, website) for file_path, website in files if not is_article_file(file_path)]
+
+    # Return the parent's connection to the pool before forking so workers never inherit a checked-out one
+    session.close()
+
+    state_queue = multiprocessing.SimpleQueue()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_import_worker,
+                             initargs=(state_queue,)) as executor:
+        # Comments reference articles, so the comment phase only starts once every article file is loaded
+        for phase, phase_files in (('Articles', article_files), ('Comments', comment_files)):
+            futures = {
+                executor.submit(import_file_worker, file_path, website): (file_path, website)
+                for file_path, website in phase_files
+            }
+            states = {}
+            broken_files = []
+            for future in tqdm(as_completed(futures), total=len(futures), desc=phase, unit='file'):
+                file_path, website = futures[future]
+                drain_file_states(state_queue, states)
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    # Raised for every unfinished file, whether or not a worker had started it
+                    broken_files.append((file_path, website))
+                except Exception as e:
+                    # The worker logs its own result; only errors outside process_file are recorded here
+                    print(f"Worker failed on file {file_path}: {e}")
+                    log_import(get_tracking_table(file_path), get_base_filename(file_path), "Failed", str(e), website)
+            if broken_files:
+                # The pool cannot take more work, and comments need every article file loaded
+                drain_file_states(state_queue, states)
+                log_broken_pool(phase, broken_files, states)
+                return
+
+
+def format_throughput(rows, reader):
+    seconds = reader.elapsed
+    rate = rows / seconds if seconds > 0 else 0.0
+    return (f"{rows} rows in {seconds:.1f}s ({rate:,.0f} rows/s, {reader.mb_per_sec:.1f} MB/s, "
+            f"peak RSS {peak_rss_mb():.0f} MB)")
 
-    df.columns = columns
 
-    return df
+def get_base_filename(file_path):
+    return os.path.basename(file_path)
 
 
 def process_comment_file(file_path, website):
     tracking_table = 'log_comments_imports'
-    columns = ['region', 'article_id', 'user_nickname', 'encoded_ip', 'timestamp', 'comment_text']
     filename = get_base_filename(file_path)
+    reader = TsvReader(file_path, COMMENT_DTYPES, CHUNK_SIZE, desc=filename, progress=show_file_progress)
 
     try:
-        df = create_df_from_file(file_path, columns)
-
-        df['comment_text'] = df['comment_text'].astype(str)
-        df['comment_lang'] = df.apply(lambda row: determine_text_language(row['comment_text'], row['region']), axis=1)
-        df['website'] = website
-
-        crud_utils.bulk_insert_comments(df, session)
-
-        print(f"Data from {file_path} has been inserted into comments")
-        log_import(tracking_table, filename, "Success", "File imported successfully.", website)
+        rows = 0
+        for chunk in reader:
+            chunk['comment_text'] = chunk['comment_text'].astype(str)
+            chunk['comment_lang'] = determine_text_language_batch(chunk['comment_text'], chunk['region'])
+            chunk['website'] = website
+            # The whole file stays one transaction, committed together with its log row
+            rows += crud_utils.copy_insert_comments(chunk, session, commit=False)
+
+        throughput = format_throughput(rows, reader)
+        print(f"Data from {file_path} has been inserted into comments: {throughput}")
+        record_manifest(file_path, website, reader.content_hash)
+        log_import(tracking_table, filename, "Success", f"File imported successfully. {throughput}", website, reader)
     except Exception as e:
         session.rollback()
         print(f"Error processing file {file_path}: {e}")
-        log_import(tracking_table, filename, "Failed", str(e), website)
+        log_import(tracking_table, filename, "Failed", str(e), website, reader)
 
 
 def process_article_file(file_path, website):
     tracking_table = 'log_articles_imports'
-    columns = ['region', 'article_id', 'headline', 'pub_timestamp', 'url']
     filename = get_base_filename(file_path)
+    reader = TsvReader(file_path, ARTICLE_DTYPES, CHUNK_SIZE, desc=filename, progress=show_file_progress)
 
     try:
-        df = create_df_from_file(file_path, columns)
-
-        headline_lang_column = df.apply(lambda row: determine_text_language(row['headline'], row['region']), axis=1)
-        df.insert(3, 'headline_lang', headline_lang_column)
+        rows = 0
+        for chunk in reader:
+            headline_lang_column = determine_text_language_batch(chunk['headline'], chunk['region'])
+            chunk.insert(3, 'headline_lang', headline_lang_column)
 
-        df = df.drop_duplicates(subset='article_id')
+            chunk = chunk.drop_duplicates(subset='article_id')
 
-        df['website'] = website
+            chunk['website'] = website
 
-        crud_utils.bulk_insert_articles(df, session)
+            rows += crud_utils.copy_insert_articles(chunk, session, commit=False)
 
-        print(f"Data from {file_path} has been inserted into articles")
-        log_import(tracking_table, filename, "Success", "File imported successfully.", website)
+        throughput = format_throughput(rows, reader)
+        print(f"Data from {file_path} has been inserted into articles: {throughput}")
+        record_manifest(file_path, website, reader.content_hash)
+        log_import(tracking_table, filename, "Success", f"File imported successfully. {throughput}", website, reader)
     except Exception as e:
         session.rollback()
         print(f"Error processing file {file_path}: {e}")
-        log_import(tracking_table, filename, "Failed", str(e), website)
+        log_import(tracking_table, filename, "Failed", str(e), website, reader)
+
+
+def is_article_file(file_path):
+    return 'meta' in get_base_filename(file_path)
+
+
+def get_tracking_table(file_path):
+    return 'log_articles_imports' if is_article_file(file_path) else 'log_comments_imports'
 
 
 def process_file(file_path, website):
-    if 'meta' in file_path:
+    if is_article_file(file_path):
         process_article_file(file_path, website)
     else:
         process_comment_file(file_path, website)
 
 
+def get_resume_point(tracking_table, filename):
+    """Return (next chunk index, byte offset to seek to, rows already committed) from the file's checkpoints."""
+    checkpoints = crud_utils.get_import_checkpoints(session, tracking_table, filename)
+    if not checkpoints:
+        return 0, 0, 0
+    last = checkpoints[-1]
+    if last.byte_offset is None:
+        raise ValueError(f"Checkpoints for {filename} have no byte offset; "
+                         f"delete them to re-import the file from scratch")
+    return last.chunk_index + 1, last.byte_offset, sum(checkpoint.row_count for checkpoint in checkpoints)
+
+
+def open_checkpointed_reader(tracking_table, filename, file_path, dtypes, desc):
+    chunk_index, byte_offset, resumed_rows = get_resume_point(tracking_table, filename)
+    if chunk_index:
+        print(f"Resuming {filename} from chunk {chunk_index} at byte {byte_offset} "
+              f"({resumed_rows} rows already committed)")
+    reader = TsvReader(file_path, dtypes, CHUNK_SIZE, start_offset=byte_offset, desc=desc,
+                       progress=show_file_progress)
+    return reader, chunk_index
+
+
+def start_checkpointed_import(tracking_table, file_path):
+    """Return True if the v3 file must be (re)imported; checkpoints left from an older version of it are dropped."""
+    filename = get_base_filename(file_path)
+    action, content_hash = plan_file(file_path)
+    if action not in IMPORT_ACTIONS:
+        print(f"Skipping already processed file: {filename} ({action})")
+        skip_file(file_path, 'delfi', action, content_hash)
+        return False
+    if action == 'changed':
+        crud_utils.delete_import_checkpoints(session, tracking_table, filename)
+        session.commit()
+    return True
+
+
+def finish_checkpointed_import(tracking_table, file_path, notes, reader):
+    # Dropping the checkpoints, recording the manifest and writing the success log row happen in one commit
+    filename = get_base_filename(file_path)
+    crud_utils.delete_import_checkpoints(session, tracking_table, filename)
+    record_manifest(file_path, 'delfi', reader.content_hash)
+    log_import(tracking_table, filename, "Success", notes, 'delfi', reader)
+
+
 def parse_delfi_v3_articles(file_path):
     tracking_table = 'log_articles_imports'
-    columns = ['region', 'article_id', 'headline', 'pub_timestamp', 'url']
     filename = get_base_filename(file_path)
 
-    if filename in crud_utils.get_processed_article_files(session, 'delfi'):
-        print(f"Skipping already processed file: {filename}")
+    if not start_checkpointed_import(tracking_table, file_path):
         return
 
+    reader = None
     try:
-        total_lines = sum(1 for _ in open(file_path, encoding='utf-8'))
-        total_chunks = math.ceil(total_lines / CHUNK_SIZE)
-        chunks = pd.read_csv(file_path, sep='\t', header=None, names=columns,
-                             on_bad_lines='skip', quoting=csv.QUOTE_NONE, chunksize=CHUNK_SIZE)
-        for chunk in tqdm(chunks, total=total_chunks, desc='Articles', unit='chunk'):
-            chunk['headline_lang'] = chunk.apply(lambda row: determine_text_language(row['headline'], row['region']), axis=1)
+        rows = 0
+        reader, chunk_index = open_checkpointed_reader(tracking_table, filename, file_path, ARTICLE_DTYPES, 'Articles')
+        for chunk in reader:
+            chunk['headline_lang'] = determine_text_language_batch(chunk['headline'], chunk['region'])
             chunk['website'] = 'delfi'
-            crud_utils.bulk_insert_articles(chunk, session)
-
-        print(f"Data from {file_path} has been inserted into articles")
-        log_import(tracking_table, filename, "Success", "File imported successfully.", 'delfi')
+            chunk_rows = crud_utils.copy_insert_articles(chunk, session, commit=False)
+            crud_utils.create_import_checkpoint(session, tracking_table, filename, chunk_index, CHUNK_SIZE,
+                                                chunk_rows, reader.offset)
+            chunk_index += 1
+            rows += chunk_rows
+
+        throughput = format_throughput(rows, reader)
+        print(f"Data from {file_path} has been inserted into articles: {throughput}")
+        finish_checkpointed_import(tracking_table, file_path, f"File imported successfully. {throughput}", reader)
     except Exception as e:
         session.rollback()
         print(f"Error processing file {file_path}: {e}")
-        log_import(tracking_table, filename, "Failed", str(e), 'delfi')
+        log_import(tracking_table, filename, "Failed", str(e), 'delfi', reader)
 
 
 def parse_delfi_v3_comments(file_path):
     tracking_table = 'log_comments_imports'
-    columns = ['region', 'article_id', 'user_nickname', 'encoded_ip', 'timestamp', 'comment_text']
     filename = get_base_filename(file_path)
 
-    if filename in crud_utils.get_processed_comment_files(session, 'delfi'):
-        print(f"Skipping already processed file: {filename}")
+    if not start_checkpointed_import(tracking_table, file_path):
         return
 
+    reader = None
     try:
-        total_lines = sum(1 for _ in open(file_path, encoding='utf-8'))
-        total_chunks = math.ceil(total_lines / CHUNK_SIZE)
-        chunks = pd.read_csv(file_path, sep='\t', header=None, names=columns,
-                             on_bad_lines='skip', quoting=csv.QUOTE_NONE, chunksize=CHUNK_SIZE)
-        for chunk in tqdm(chunks, total=total_chunks, desc='Comments', unit='chunk'):
+        rows = 0
+        reader, chunk_index = open_checkpointed_reader(tracking_table, filename, file_path, COMMENT_DTYPES, 'Comments')
+        for chunk in reader:
             chunk['comment_text'] = chunk['comment_text'].astype(str)
-            chunk['comment_lang'] = chunk.apply(lambda row: determine_text_language(row['comment_text'], row['region']), axis=1)
+            chunk['comment_lang'] = determine_text_language_batch(chunk['comment_text'], chunk['region'])
             chunk['website'] = 'delfi'
-            crud_utils.bulk_insert_comments(chunk, session)
-
-        print(f"Data from {file_path} has been inserted into comments")
-        log_import(tracking_table, filename, "Success", "File imported successfully.", 'delfi')
+            # Rows and checkpoint commit together, so a restart never re-inserts a committed chunk
+            chunk_rows = crud_utils.copy_insert_comments(chunk, session, commit=False)
+            crud_utils.create_import_checkpoint(session, tracking_table, filename, chunk_index, CHUNK_SIZE,
+                                                chunk_rows, reader.offset)
+            chunk_index += 1
+            rows += chunk_rows
+
+        throughput = format_throughput(rows, reader)
+        print(f"Data from {file_path} has been inserted into comments: {throughput}")
+        finish_checkpointed_import(tracking_table, file_path, f"File imported successfully. {throughput}", reader)
     except Exception as e:
         session.rollback()
         print(f"Error processing file {file_path}: {e}")
-        log_import(tracking_table, filename, "Failed", str(e), 'delfi')
+        log_import(tracking_table, filename, "Failed", str(e), 'delfi', reader)
 
 
 # Processing data with CUDA for 2023.01.01.-2024.04.08. took 692 seconds
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import articles and comments into the database.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes for tvnet/apollo files (1 imports sequentially)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print which files would be imported or skipped and exit')
+    args = parser.parse_args()
+
+    delfi_v3 = delfi_v3_data
+    if args.dry_run:
+        print_import_plan(
+            [(tvnet_data, 'tvnet'), (apollo_data, 'apollo')],
+            [(os.path.join(delfi_v3, 'articles-meta.txt'), 'delfi'), (os.path.join(delfi_v3, 'comments-meta.txt'), 'delfi')],
+        )
+        raise SystemExit(0)
+
     start_time = time.time()
-    delfi_v3 = data_path('v3/delfi')
     parse_delfi_v3_articles(os.path.join(delfi_v3, 'articles-meta.txt'))
     parse_delfi_v3_comments(os.path.join(delfi_v3, 'comments-meta.txt'))
-    process_directory(tvnet_data, 'tvnet')
-    process_directory(apollo_data, 'apollo')
+    if args.workers > 1:
+        process_directories_parallel([(tvnet_data, 'tvnet'), (apollo_data, 'apollo')], args.workers)
+    else:
+        process_directory(tvnet_data, 'tvnet')
+        process_directory(apollo_data, 'apollo')
     end_time = time.time()
     print(f"Processing new data took {end_time - start_time} seconds")
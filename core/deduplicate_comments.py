@@ -0,0 +1,97 @@
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from tqdm import tqdm
+from db import database
+from db.crud_utils import COMMENT_NATURAL_KEY_SQL
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+BATCH_SIZE = 50_000
+# Tables holding per-comment results that must go before the duplicate comment itself
+DOWNSTREAM_TABLES = ['predicted_comments', 'lemmatized_comments', 'comment_work_queue', 'comment_tokens']
+
+
+def backfill_natural_keys(session):
+    max_id = session.execute(text("SELECT coalesce(max(id), 0) FROM comments")).scalar()
+    for low in tqdm(range(0, max_id, BATCH_SIZE), desc='natural keys', unit='batch'):
+        session.execute(
+            text(f"UPDATE comments SET natural_key = {COMMENT_NATURAL_KEY_SQL} "
+                 f"WHERE id > :low AND id <= :high AND natural_key IS NULL"),
+            {'low': low, 'high': low + BATCH_SIZE},
+        )
+        session.commit()
+
+
+def collect_duplicates(session) -> int:
+    # Keep one comment per key, preferring one that is already predicted, then the oldest id
+    session.execute(text("DROP TABLE IF EXISTS comment_duplicates"))
+    session.execute(text("""
+        CREATE UNLOGGED TABLE comment_duplicates AS
+        SELECT id FROM (
+            SELECT c.id, row_number() OVER (
+                PARTITION BY c.natural_key
+                ORDER BY EXISTS (SELECT 1 FROM predicted_comments p WHERE p.comment_id = c.id) DESC, c.id
+            ) AS rank
+            FROM comments c
+            WHERE c.natural_key IN (
+                SELECT natural_key FROM comments GROUP BY natural_key HAVING count(*) > 1
+            )
+        ) ranked
+        WHERE rank > 1
+    """))
+    session.execute(text("CREATE INDEX ON comment_duplicates (id)"))
+    session.commit()
+    return session.execute(text("SELECT count(*) FROM comment_duplicates")).scalar()
+
+
+def delete_duplicates(session, total: int):
+    last_id = 0
+    with tqdm(total=total, desc='duplicates', unit='comment') as progress:
+        while True:
+            ids = session.execute(
+                text("SELECT id FROM comment_duplicates WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {'last_id': last_id, 'limit': BATCH_SIZE},
+            ).scalars().all()
+            if not ids:
+                break
+            for table in DOWNSTREAM_TABLES:
+                session.execute(text(f"DELETE FROM {table} WHERE comment_id = ANY(:ids)"), {'ids': ids})
+            session.execute(text("DELETE FROM comments WHERE id = ANY(:ids)"), {'ids': ids})
+            session.commit()
+            last_id = ids[-1]
+            progress.update(len(ids))
+    session.execute(text("DROP TABLE comment_duplicates"))
+    session.commit()
+
+
+def create_natural_key_index():
+    # CONCURRENTLY cannot run inside a transaction block
+    with database.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_comments_natural_key ON comments (natural_key)"
+        ))
+
+
+def deduplicate_comments():
+    session = SessionLocal()
+    try:
+        print('Backfilling natural keys...')
+        backfill_natural_keys(session)
+        total = collect_duplicates(session)
+        print(f'Duplicate comments to remove: {total}')
+        delete_duplicates(session, total)
+    finally:
+        session.close()
+    print('Creating unique index on comments.natural_key...')
+    create_natural_key_index()
+    if total:
+        print('Aggregates (aggressiveness_by_day, aggressive_keywords_by_day, emotion_keywords_by_day) '
+              'still include the removed duplicates: truncate and rerun the aggregation scripts.')
+
+
+if __name__ == '__main__':
+    t_start = time.time()
+    print('Deduplicating comments...')
+    deduplicate_comments()
+    print(f'Finished in {time.time() - t_start:.1f}s')
@@ -5,7 +5,7 @@ from sqlalchemy import cast, Date
 from sklearn.feature_extraction.text import CountVectorizer
 from tqdm import tqdm
 from db import database
-from core import load_model
+from core import lemma_vocabulary, load_model
 from db import models
 import pandas as pd
 
@@ -14,7 +14,14 @@ session = SessionLocal()
 supported_languages = ['lv', 'ru']
 
 
-def extract_keywords_from_comments():
+def extract_keywords_from_comments(dates=None):
+    """Fill missing days; with dates given, re-extract only those days (their existing rows are replaced)."""
+    if dates:
+        session.query(models.EmotionKeywordsByDay).filter(
+            cast(models.EmotionKeywordsByDay.date, Date).in_(dates)
+        ).delete(synchronize_session=False)
+        session.commit()
+
     processed = {
         (row[0], row[1], row[2])
         for row in session.query(
@@ -33,24 +40,25 @@ def extract_keywords_from_comments():
             models.PredictedComment.ekman_prediction_emotion != '',
         ).distinct().all()
     )
-
-    kb_lvbert_ekman = load_model.get_keybert_model_by_language_and_prediction_type('lv', 'ekman')
-    kb_rubert_ekman = load_model.get_keybert_model_by_language_and_prediction_type('ru', 'ekman')
+    if dates:
+        wanted_dates = set(dates)
+        all_dates = [date for date in all_dates if date in wanted_dates]
 
     lv_stopwords = load_model.get_stopwords('lv')
     ru_stopwords = load_model.get_stopwords('ru')
 
+    # KeyBERT models are fetched from the model registry on every use, so it can evict them under memory pressure
     prediction_configurations = [
-        ('ekman', 'lv', kb_lvbert_ekman, lv_stopwords),
-        ('ekman', 'ru', kb_rubert_ekman, ru_stopwords),
+        ('ekman', 'lv', lv_stopwords),
+        ('ekman', 'ru', ru_stopwords),
     ]
 
     for date in tqdm(all_dates, desc='dates', unit='day'):
-        if all((date, lang, pred_type) in processed for pred_type, lang, _, _ in prediction_configurations):
+        if all((date, lang, pred_type) in processed for pred_type, lang, _ in prediction_configurations):
             continue
 
         rows = session.query(
-            models.LemmatizedComment.lemmas,
+            models.LemmatizedComment.lemma_ids,
             models.PredictedComment.text_lang,
             models.PredictedComment.ekman_prediction_emotion,
         ).join(
@@ -63,10 +71,10 @@ def extract_keywords_from_comments():
             models.PredictedComment.ekman_prediction_emotion != '',
         ).all()
 
-        date_df = pd.DataFrame(rows, columns=['lemmas', 'text_lang', 'ekman_emotion'])
-        date_df['lemma_text'] = date_df['lemmas'].apply(lambda l: ' '.join(l) if l else '')
+        date_df = pd.DataFrame(rows, columns=['lemma_ids', 'text_lang', 'ekman_emotion'])
+        date_df['lemma_text'] = [' '.join(lemmas) for lemmas in lemma_vocabulary.decode_rows(session, date_df['lemma_ids'])]
 
-        for prediction_type, lang, kb_model, stopword_list in prediction_configurations:
+        for prediction_type, lang, stopword_list in prediction_configurations:
             if (date, lang, prediction_type) in processed:
                 continue
 
@@ -89,7 +97,9 @@ def extract_keywords_from_comments():
                 max_features=5000,
             )
 
-            all_keywords = kb_model.extract_keywords(docs, vectorizer=vectorizer, top_n=30)
+            all_keywords = load_model.get_keybert_model_by_language_and_prediction_type(
+                lang, prediction_type
+            ).extract_keywords(docs, vectorizer=vectorizer, top_n=30)
             keywords_dict = dict(zip(emotions, all_keywords))
 
             session.add(models.EmotionKeywordsByDay(
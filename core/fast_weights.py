@@ -0,0 +1,95 @@
+import json
+import os
+
+import torch
+from sentence_transformers import models as st_models
+from transformers import AutoConfig, AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+from transformers.modeling_utils import no_init_weights
+
+from path_config import models_path
+
+WEIGHTS_FILENAME = 'weights.pt'
+METADATA_FILENAME = 'fast.json'
+
+
+def fast_model_dir(model_name: str) -> str:
+    return models_path(os.path.join('fast', model_name.replace('/', '--')))
+
+
+def has_fast_weights(model_name: str) -> bool:
+    return os.path.exists(os.path.join(fast_model_dir(model_name), WEIGHTS_FILENAME))
+
+
+def _model_class(config):
+    if any(name.endswith('ForSequenceClassification') for name in config.architectures or []):
+        return AutoModelForSequenceClassification
+    return AutoModel
+
+
+def _non_persistent_buffers(model) -> dict:
+    # Buffers such as BertEmbeddings.position_ids are left out of state_dict() but needed to run
+    persistent = set(model.state_dict())
+    return {name: buffer for name, buffer in model.named_buffers() if name not in persistent}
+
+
+def save_fast_weights(model_name: str, cache_dir: str = None, overwrite: bool = False) -> str:
+    """Save a downloaded checkpoint as config, tokenizer and a plain torch state dict that load_fast_model can mmap."""
+    directory = fast_model_dir(model_name)
+    if os.path.exists(os.path.join(directory, WEIGHTS_FILENAME)) and not overwrite:
+        return directory
+    cache_dir = cache_dir or models_path()
+    config = AutoConfig.from_pretrained(model_name, local_files_only=True, cache_dir=cache_dir)
+    model_class = _model_class(config)
+    model = model_class.from_pretrained(model_name, local_files_only=True, cache_dir=cache_dir)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True, cache_dir=cache_dir)
+
+    os.makedirs(directory, exist_ok=True)
+    model.config.save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    # Contiguous copies, so every tensor maps straight onto its own region of the file
+    torch.save({
+        'state_dict': {name: tensor.contiguous() for name, tensor in model.state_dict().items()},
+        'buffers': _non_persistent_buffers(model),
+    }, os.path.join(directory, WEIGHTS_FILENAME))
+    with open(os.path.join(directory, METADATA_FILENAME), 'w') as f:
+        json.dump({'model_name': model_name, 'model_class': model_class.__name__,
+                   'torch': torch.__version__}, f, indent=2)
+    print(f'Saved mmap-able weights of {model_name} to {directory}')
+    return directory
+
+
+def load_fast_model(model_name: str, base_model: bool = False, **config_overrides):
+    """Build the model on the meta device and assign it the memory-mapped tensors of the saved state dict.
+
+    Nothing is copied: parameters stay backed by the page cache, so start-up does not read the whole
+    file and processes loading the same model share its weight pages. With base_model the bare
+    encoder (what AutoModel returns) of a classification checkpoint is returned instead.
+    """
+    directory = fast_model_dir(model_name)
+    config = AutoConfig.from_pretrained(directory, **config_overrides)
+    # Random initialization is skipped: on the meta device it costs about a second and is overwritten anyway
+    with torch.device('meta'), no_init_weights():
+        model = _model_class(config).from_config(config)
+    saved = torch.load(os.path.join(directory, WEIGHTS_FILENAME), mmap=True, weights_only=True)
+    model.load_state_dict(saved['state_dict'], assign=True)
+    for name, buffer in saved['buffers'].items():
+        module_name, _, buffer_name = name.rpartition('.')
+        model.get_submodule(module_name).register_buffer(buffer_name, buffer, persistent=False)
+    model.tie_weights()
+    model.eval()
+    return model.base_model if base_model else model
+
+
+def load_fast_tokenizer(model_name: str):
+    return AutoTokenizer.from_pretrained(fast_model_dir(model_name))
+
+
+class FastTransformer(st_models.Transformer):
+    """sentence-transformers Transformer module whose encoder comes from load_fast_model."""
+
+    def __init__(self, model_name: str, **kwargs):
+        self.fast_model_name = model_name
+        super().__init__(fast_model_dir(model_name), **kwargs)
+
+    def _load_model(self, model_name_or_path, config, cache_dir, backend, is_peft_model, **model_args):
+        self.auto_model = load_fast_model(self.fast_model_name, base_model=True)
@@ -0,0 +1,144 @@
+import argparse
+import os
+import time
+
+from core import data_import
+from core.calculate_aggressiveness_by_day import calculate_aggressiveness
+from core.compute_aggressive_keywords_by_day import compute_aggressive_keywords_by_day
+from core.extract_keywords_by_day import extract_keywords_from_comments
+from core.lemmatize_comments import lemmatize_comments
+from core.predict_comments import BACKENDS, process_comments
+from db import crud_utils
+
+POLL_INTERVAL = 300
+SETTLE_SECONDS = 60  # files modified more recently may still be being copied in
+MAX_FILES_PER_CYCLE = 20
+MAX_ACTIVE_CONNECTIONS = 20  # pause while the database has more active connections than this
+CAPACITY_POLL_SECONDS = 10
+
+WATCHED_DIRECTORIES = [(data_import.tvnet_data, 'tvnet'), (data_import.apollo_data, 'apollo')]
+V3_FILES = {
+    os.path.join(data_import.delfi_v3_data, 'articles-meta.txt'): data_import.parse_delfi_v3_articles,
+    os.path.join(data_import.delfi_v3_data, 'comments-meta.txt'): data_import.parse_delfi_v3_comments,
+}
+
+# Models stay loaded between cycles in core.model_registry
+
+
+def wait_for_capacity(max_active_connections):
+    # Backpressure: the web app shares the database, so ingestion yields whenever it is busy
+    session = data_import.session
+    while True:
+        active = crud_utils.get_active_connection_count(session)
+        session.close()
+        if active < max_active_connections:
+            return
+        print(f'Database busy ({active} active connections), pausing ingestion...')
+        time.sleep(CAPACITY_POLL_SECONDS)
+
+
+def find_pending_files(max_files):
+    """Return up to max_files settled (file_path, website) pairs that are new or changed, article files first."""
+    data_import.reload_import_state()
+    settled_before = time.time() - SETTLE_SECONDS
+    candidates = [(file_path, 'delfi') for file_path in V3_FILES if os.path.exists(file_path)]
+    candidates += [
+        (file_path, website)
+        for directory, website in WATCHED_DIRECTORIES if os.path.isdir(directory)
+        for file_path in data_import.list_import_files(directory)
+    ]
+
+    pending = []
+    for file_path, website in candidates:
+        if os.path.getmtime(file_path) > settled_before:
+            continue
+        action, content_hash = data_import.plan_file(file_path)
+        if action in data_import.IMPORT_ACTIONS:
+            pending.append((file_path, website))
+        else:
+            data_import.skip_file(file_path, website, action, content_hash)
+
+    pending.sort(key=lambda entry: not data_import.is_article_file(entry[0]))
+    return pending[:max_files]
+
+
+def import_file(file_path, website):
+    if file_path in V3_FILES:
+        V3_FILES[file_path](file_path)
+    else:
+        data_import.process_file(file_path, website)
+
+
+def run_downstream(min_id, max_id, dates, max_active_connections, backend='torch'):
+    """Lemmatize, predict and re-aggregate only the comments with min_id < id <= max_id and the days they fall on."""
+    print(f'Downstream work for comment ids {min_id + 1}..{max_id} on {len(dates)} day(s)')
+    wait_for_capacity(max_active_connections)
+    lemmatize_comments(min_id, max_id)
+
+    wait_for_capacity(max_active_connections)
+    process_comments(min_id, max_id, backend=backend)
+
+    if dates:
+        wait_for_capacity(max_active_connections)
+        calculate_aggressiveness(dates)
+        wait_for_capacity(max_active_connections)
+        compute_aggressive_keywords_by_day(dates)
+        wait_for_capacity(max_active_connections)
+        extract_keywords_from_comments(dates)
+
+
+def run_cycle(max_files, max_active_connections, backend='torch'):
+    """Import one slice of pending files and run the downstream stages for it; return True if anything was done."""
+    session = data_import.session
+    pending = find_pending_files(max_files)
+
+    if pending:
+        # Stored before importing, so the range survives a restart even if the daemon dies mid-import
+        range_id = crud_utils.open_ingest_range(session, crud_utils.get_max_comment_id(session))
+        session.close()
+        for file_path, website in pending:
+            wait_for_capacity(max_active_connections)
+            import_file(file_path, website)
+        crud_utils.close_ingest_range(session, range_id, crud_utils.get_max_comment_id(session))
+        session.close()
+
+    # Ranges whose downstream work failed, here or before a restart, are retried oldest first
+    for range_id, min_id, max_id in crud_utils.get_ingest_ranges(session):
+        dates = crud_utils.get_comment_dates(session, min_id, max_id)
+        session.close()
+        try:
+            run_downstream(min_id, max_id, dates, max_active_connections, backend)
+        except Exception as e:
+            print(f'Downstream work for comment ids {min_id + 1}..{max_id} failed, will retry: {e}')
+            break
+        crud_utils.delete_ingest_range(session, range_id)
+    session.close()
+
+    return bool(pending)
+
+
+def run_daemon(poll_interval, max_files, max_active_connections, once=False, backend='torch'):
+    while True:
+        did_work = run_cycle(max_files, max_active_connections, backend)
+        if once and not did_work:
+            return
+        if not did_work:
+            time.sleep(poll_interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watch the data directories and ingest new or changed dump files.')
+    parser.add_argument('--interval', type=int, default=POLL_INTERVAL, help='seconds between scans when idle')
+    parser.add_argument('--max-files', type=int, default=MAX_FILES_PER_CYCLE,
+                        help='files imported per cycle before running the downstream stages')
+    parser.add_argument('--max-active-connections', type=int, default=MAX_ACTIVE_CONNECTIONS,
+                        help='pause while the database has at least this many active connections')
+    parser.add_argument('--backend', choices=BACKENDS, default='torch', help='emotion prediction backend')
+    parser.add_argument('--once', action='store_true', help='exit once no pending files are left')
+    args = parser.parse_args()
+
+    print('Starting ingestion daemon...')
+    try:
+        run_daemon(args.interval, args.max_files, args.max_active_connections, args.once, args.backend)
+    except KeyboardInterrupt:
+        print('Ingestion daemon stopped.')
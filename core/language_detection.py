@@ -0,0 +1,64 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+_CYRILLIC = re.compile(r'[Ѐ-ӿ]')
+_LATIN    = re.compile(r'[A-Za-zĀ-žā-ž]')
+_REGION_LANG = {'rus': 'ru', 'lat': 'lv'}
+CYRILLIC_THRESHOLD = 0.85
+
+# Code point ranges matching the _CYRILLIC / _LATIN character classes above
+_CYRILLIC_RANGES = [(0x0400, 0x04FF)]
+_LATIN_RANGES = [(0x0041, 0x005A), (0x0061, 0x007A), (0x0100, 0x017E)]
+
+
+def determine_text_language(text_str, region=None):
+    cyrillic = len(_CYRILLIC.findall(text_str))
+    latin    = len(_LATIN.findall(text_str))
+    total    = cyrillic + latin
+    if total == 0:
+        return _REGION_LANG.get(region, 'lv')
+    return 'ru' if cyrillic / total > CYRILLIC_THRESHOLD else _REGION_LANG.get(region, 'lv')
+
+
+def _in_ranges(codes: np.ndarray, ranges) -> np.ndarray:
+    mask = np.zeros(codes.shape, dtype=bool)
+    for low, high in ranges:
+        mask |= (codes >= low) & (codes <= high)
+    return mask
+
+
+def _count_per_text(mask: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Prefix sums instead of np.add.reduceat, which mishandles empty texts
+    cumulative = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    return cumulative[ends] - cumulative[starts]
+
+
+def count_script_characters(texts: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Count Cyrillic and Latin characters of every text in a single pass over the whole column."""
+    texts = texts.fillna('').astype(str)
+    lengths = texts.str.len().to_numpy(dtype=np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    # UTF-32 gives exactly one code unit per Python character, so offsets line up with str lengths
+    joined = ''.join(texts.tolist()).encode('utf-32-le', errors='surrogatepass')
+    codes = np.frombuffer(joined, dtype=np.uint32)
+
+    cyrillic = _count_per_text(_in_ranges(codes, _CYRILLIC_RANGES), starts, ends)
+    latin = _count_per_text(_in_ranges(codes, _LATIN_RANGES), starts, ends)
+    return cyrillic, latin
+
+
+def determine_text_language_batch(texts: pd.Series, regions: pd.Series) -> pd.Series:
+    """Vectorized equivalent of applying determine_text_language to every (text, region) row."""
+    cyrillic, latin = count_script_characters(texts)
+    total = cyrillic + latin
+
+    ratio = np.zeros(len(total), dtype=np.float64)
+    np.divide(cyrillic, total, out=ratio, where=total > 0)
+    is_russian = (total > 0) & (ratio > CYRILLIC_THRESHOLD)
+
+    fallback = regions.map(_REGION_LANG).fillna('lv').to_numpy(dtype=object)
+    return pd.Series(np.where(is_russian, 'ru', fallback), index=texts.index, dtype=object)
@@ -0,0 +1,74 @@
+import argparse
+import time
+from sqlalchemy.orm import sessionmaker
+from core import lemma_vocabulary
+from core.lemmatize_comments import SUPPORTED_LANGUAGES, memo_lemmas
+from db import crud_utils, database
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+MIN_OCCURRENCES = 5  # times a word form must have been lemmatized to enter the memo
+MIN_LEMMA_SHARE = 0.99  # share of those times its most frequent lemma must account for
+SAMPLE_SIZE = 2_000
+MIN_AGREEMENT = 0.98  # share of memo-lemmatized sample comments whose lemmas must match Stanza's
+
+
+def build_lemma_memo(lang: str, sample_size=SAMPLE_SIZE, min_occurrences=MIN_OCCURRENCES,
+                     min_share=MIN_LEMMA_SHARE, min_agreement=MIN_AGREEMENT) -> bool:
+    """Rebuild the language's lemma memo and keep it only if it agrees with Stanza; returns False if refused.
+
+    The most recently lemmatized sample_size comments are held out: the memo is built from the
+    Stanza output of all earlier ones, and every held-out comment it can lemmatize on its own is
+    compared with the lemmas and word forms Stanza stored for it. A refused memo is rolled back,
+    so the previous one (if any) stays in use.
+    """
+    session = SessionLocal()
+    try:
+        sample = crud_utils.get_recent_lemmatized_comments(session, lang, sample_size)
+        if len(sample) < 10:
+            print(f'[{lang}] Not enough lemmatized comments to build and validate a lemma memo, skipping')
+            return False
+        forms = crud_utils.rebuild_lemma_memo(session, lang, min(row.comment_id for row in sample) - 1,
+                                              min_occurrences, min_share)
+        memo = crud_utils.get_lemma_memo(session, lang)
+        sample_lemmas = lemma_vocabulary.decode_rows(session, [row.lemma_ids for row in sample])
+        sample_words = lemma_vocabulary.decode_rows(session, [row.word_ids for row in sample])
+
+        memoized = 0
+        agreed = 0
+        for row, lemmas, words in zip(sample, sample_lemmas, sample_words):
+            result = memo_lemmas(memo, row.comment_text)
+            if result is not None:
+                memoized += 1
+                agreed += result == (lemmas, words)
+        skipped_share = memoized / len(sample)
+        agreement = agreed / memoized if memoized else 1.0
+        print(f'[{lang}] {forms} word forms; {memoized} of {len(sample)} held-out comments ({skipped_share:.1%}) '
+              f'would skip Stanza, {agreement:.2%} of them with the same lemmas as Stanza')
+        if agreement < min_agreement:
+            session.rollback()
+            print(f'[{lang}] lemma memo refused ({agreement:.2%} < {min_agreement:.2%})')
+            return False
+        session.commit()
+        return True
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the word form -> lemma memo from lemmatized_comments and validate it against Stanza.')
+    parser.add_argument('--lang', choices=SUPPORTED_LANGUAGES, nargs='+', default=SUPPORTED_LANGUAGES)
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE,
+                        help='most recently lemmatized comments held out for the agreement check')
+    parser.add_argument('--min-occurrences', type=int, default=MIN_OCCURRENCES)
+    parser.add_argument('--min-share', type=float, default=MIN_LEMMA_SHARE,
+                        help='share of a form\'s occurrences its lemma must have for the form to be unambiguous')
+    parser.add_argument('--min-agreement', type=float, default=MIN_AGREEMENT,
+                        help='refuse the memo when fewer memo-lemmatized comments match Stanza')
+    args = parser.parse_args()
+
+    t_start = time.time()
+    for lang in args.lang:
+        build_lemma_memo(lang, args.sample_size, args.min_occurrences, args.min_share, args.min_agreement)
+    print(f'Finished in {time.time() - t_start:.1f}s')
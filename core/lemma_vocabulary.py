@@ -0,0 +1,61 @@
+import itertools
+
+import numpy as np
+from sqlalchemy import text
+
+from db import crud_utils
+
+
+def flatten_ids(arrays) -> tuple[np.ndarray, np.ndarray]:
+    """All ids of a column of lemma_ids/word_ids arrays as one int32 array, with each array's length.
+
+    None (e.g. word_ids of rows lemmatized before word forms were kept) counts as empty.
+    """
+    lengths = np.fromiter((len(ids) if ids else 0 for ids in arrays), dtype=np.int64, count=len(arrays))
+    values = np.fromiter(itertools.chain.from_iterable(ids for ids in arrays if ids), dtype=np.int32,
+                         count=int(lengths.sum()))
+    return values, lengths
+
+
+def owners(lengths: np.ndarray) -> np.ndarray:
+    """Row of every id of flatten_ids."""
+    return np.repeat(np.arange(len(lengths)), lengths)
+
+
+def offsets(lengths: np.ndarray) -> np.ndarray:
+    """Position of every row's first id in flatten_ids."""
+    return np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+
+
+def lookup(table: np.ndarray, ids: np.ndarray, fill) -> np.ndarray:
+    """table[ids], with fill for ids past the end of the table (tokens numbered after it was built)."""
+    inside = ids < len(table)
+    values = np.full(len(ids), fill, dtype=table.dtype)
+    values[inside] = table[ids[inside]]
+    return values
+
+
+def keyword_weights(session) -> np.ndarray:
+    """Weight of every aggressive keyword by its lemma_vocabulary id, NaN for every other id."""
+    rows = session.execute(text(
+        "SELECT v.id, ak.weight FROM aggressive_keywords ak JOIN lemma_vocabulary v ON v.token = ak.word"
+    )).all()
+    size = max((vocabulary_id for vocabulary_id, _ in rows), default=-1) + 1
+    weights = np.full(size, np.nan)
+    for vocabulary_id, weight in rows:
+        weights[vocabulary_id] = np.nan if weight is None else weight
+    return weights
+
+
+def decode(session, values: np.ndarray) -> np.ndarray:
+    """Tokens of vocabulary ids, as an object array parallel to values."""
+    unique, inverse = np.unique(values, return_inverse=True)
+    tokens = crud_utils.get_vocabulary_tokens(session, unique.tolist())
+    return np.array([tokens[vocabulary_id] for vocabulary_id in unique.tolist()], dtype=object)[inverse]
+
+
+def decode_rows(session, arrays) -> list[list[str]]:
+    """Token lists of a column of lemma_ids/word_ids arrays, with one vocabulary query for all of them."""
+    values, lengths = flatten_ids(arrays)
+    tokens = decode(session, values)
+    return [chunk.tolist() for chunk in np.split(tokens, np.cumsum(lengths)[:-1])] if len(lengths) else []
@@ -1,13 +1,28 @@
+import argparse
+import os
+import re
 import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import stanza
+import torch
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.dialects.postgresql import insert
-from db import database, models
+from tqdm import tqdm
+from core.model_registry import registry
+from db import crud_utils, database
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
 
 BATCH_SIZE = 500
 SUPPORTED_LANGUAGES = ['lv', 'ru']
+# Parallel mode: workers claim fixed id ranges, smaller than prediction shards as Stanza is slower per comment
+SHARD_SIZE = 10_000
+SHARD_LOCK_NAMESPACE = 0x4c454d4d  # first key of the pg advisory lock held while a shard is lemmatized
+# Whitespace-separated chunks the lemma memo splits the way Stanza does: a run of letters with punctuation
+# around it, or punctuation alone. Anything else (digits, hyphens, "t.i.") goes to Stanza.
+MEMO_WORD_CHUNK = re.compile(r'([^\w\s]*)([^\W\d_]+)([^\w\s]*)')
+MEMO_PUNCTUATION_CHUNK = re.compile(r'[^\w\s]+')
 
 
 def get_stanza_pipeline(lang: str) -> stanza.Pipeline:
@@ -37,64 +52,235 @@ def lemmatize_batch(nlp: stanza.Pipeline, comments: list) -> list[dict]:
     return results
 
 
-def lemmatize_comments():
+def memo_lemmas(memo: dict, comment_text: str):
+    """(lemmas, words) of a comment looked up in the lemma memo, or None if it needs Stanza.
+
+    Punctuation-only chunks are dropped, as lemmatize_batch drops lemmas that are not alphabetic.
+    A single letter followed by a period may be an abbreviation Stanza keeps as one token.
+    """
+    lemmas = []
+    words = []
+    for chunk in (comment_text or '').split():
+        match = MEMO_WORD_CHUNK.fullmatch(chunk)
+        if match is None:
+            if MEMO_PUNCTUATION_CHUNK.fullmatch(chunk):
+                continue
+            return None
+        _, letters, trailing = match.groups()
+        if len(letters) == 1 and trailing.startswith('.'):
+            return None
+        word = letters.lower()
+        lemma = memo.get(word)
+        if lemma is None:
+            return None
+        lemmas.append(lemma)
+        words.append(word)
+    return lemmas, words
+
+
+def lemmatize_batch_with_memo(nlp: stanza.Pipeline, memo: dict, comments: list) -> tuple[list[dict], int]:
+    """lemmatize_batch, with comments made up only of memo word forms looked up instead; also returns how
+    many comments skipped Stanza."""
+    results = {}
+    rest = []
+    for comment in comments:
+        memoized = memo_lemmas(memo, comment.comment_text)
+        if memoized is None:
+            rest.append(comment)
+            continue
+        lemmas, words = memoized
+        results[comment.id] = {'comment_id': comment.id, 'lemmas': lemmas, 'lemma_count': len(lemmas), 'words': words}
+    if rest:
+        results.update((row['comment_id'], row) for row in lemmatize_batch(nlp, rest))
+    return [results[comment.id] for comment in comments], len(comments) - len(rest)
+
+
+def get_shared_lemma_memo(lang: str) -> dict:
+    # Loaded once per process; a rebuilt memo is picked up once this one is evicted or the process restarts
+    def load():
+        session = SessionLocal()
+        try:
+            return crud_utils.get_lemma_memo(session, lang)
+        finally:
+            session.close()
+    return registry.get(f'lemma_memo:{lang}', load)
+
+
+def get_shared_stanza_pipeline(lang: str) -> stanza.Pipeline:
+    # Stanza models stay loaded in the registry between calls (e.g. ingest_daemon cycles)
+    return registry.get(f'stanza:{lang}', lambda: get_stanza_pipeline(lang))
+
+
+def lemmatize_range(session, nlp: stanza.Pipeline, lang: str, min_id: int, max_id: int = None,
+                    verbose: bool = True, memo: dict = None) -> tuple[int, int]:
+    """Lemmatize the queued comments of one language with min_id < id <= max_id, a batch per transaction.
+
+    Returns the number of comments lemmatized and how many of them skipped Stanza through the memo.
+    """
+    last_id = min_id
+    total = 0
+    skipped = 0
+    while True:
+        batch = crud_utils.get_queued_comments_batch(
+            session, crud_utils.LEMMATIZE_STAGE, lang, last_id, BATCH_SIZE, max_id
+        )
+
+        if not batch:
+            break
+
+        t0 = time.time()
+        if memo:
+            rows, batch_skipped = lemmatize_batch_with_memo(nlp, memo, batch)
+            skipped += batch_skipped
+        else:
+            rows = lemmatize_batch(nlp, batch)
+        crud_utils.copy_insert_lemmatized_comments(rows, session)
+        crud_utils.dequeue_comments(session, crud_utils.LEMMATIZE_STAGE, [comment.id for comment in batch])
+        session.commit()
+
+        last_id = batch[-1].id
+        total += len(batch)
+        if verbose:
+            print(f'  [{lang}] Processed {total} comments (batch in {time.time() - t0:.1f}s)')
+    return total, skipped
+
+
+def memo_summary(lang: str, total: int, skipped: int) -> str:
+    share = skipped / total if total else 0.0
+    return f'[{lang}] {skipped} of {total} comments ({share:.1%}) skipped Stanza through the lemma memo'
+
+
+def lemmatize_comments(min_id: int = 0, max_id: int = None, use_memo: bool = False):
+    """Lemmatize comments with min_id < id <= max_id (all by default).
+
+    With use_memo, comments made up only of word forms in the language's lemma_memo (built and
+    validated by core.lemma_memo) are looked up instead of going through Stanza.
+    """
     session = SessionLocal()
     try:
         for lang in SUPPORTED_LANGUAGES:
-            total_to_process = (
-                session.query(models.Comment)
-                .outerjoin(
-                    models.LemmatizedComment,
-                    models.LemmatizedComment.comment_id == models.Comment.id
-                )
-                .filter(
-                    models.Comment.comment_lang == lang,
-                    models.LemmatizedComment.comment_id == None,
-                )
-                .count()
+            total_to_process = crud_utils.get_queued_comment_count(
+                session, crud_utils.LEMMATIZE_STAGE, lang, min_id, max_id
             )
             print(f'\n[{lang}] Comments to process: {total_to_process}')
-            print(f'Loading Stanza pipeline for language: {lang}')
-            nlp = get_stanza_pipeline(lang)
-
-            last_id = 0
-            total = 0
-            while True:
-                batch = (
-                    session.query(models.Comment)
-                    .outerjoin(
-                        models.LemmatizedComment,
-                        models.LemmatizedComment.comment_id == models.Comment.id
-                    )
-                    .filter(
-                        models.Comment.comment_lang == lang,
-                        models.Comment.id > last_id,
-                        models.LemmatizedComment.comment_id == None,
-                    )
-                    .order_by(models.Comment.id)
-                    .limit(BATCH_SIZE)
-                    .all()
-                )
-
-                if not batch:
-                    break
-
-                t0 = time.time()
-                rows = lemmatize_batch(nlp, batch)
-                session.execute(insert(models.LemmatizedComment), rows)
-                session.commit()
-
-                last_id = batch[-1].id
-                total += len(batch)
-                print(f'  [{lang}] Processed {total} comments (batch in {time.time() - t0:.1f}s)')
-
+            if total_to_process == 0:
+                continue
+            memo = get_shared_lemma_memo(lang) if use_memo else None
+            if use_memo and not memo:
+                print(f'  [{lang}] No lemma memo, run core.lemma_memo first; lemmatizing with Stanza only')
+            total, skipped = lemmatize_range(session, get_shared_stanza_pipeline(lang), lang, min_id, max_id,
+                                             memo=memo)
             print(f'  [{lang}] Done. Total processed: {total}')
+            if memo:
+                print(f'  {memo_summary(lang, total, skipped)}')
+    finally:
+        session.close()
+
+
+def init_lemmatize_worker(threads):
+    # Forked workers must not reuse the parent's pooled connections
+    database.engine.dispose(close=False)
+    torch.set_num_threads(threads)
+
+
+def lemmatize_shard_worker(lang, shard, min_id=0, max_id=None, use_memo=False):
+    """Lemmatize one id shard; returns (worker pid, comments, comments that skipped Stanza, seconds), or None if
+    another run holds the shard.
+
+    seconds leaves out loading the Stanza pipeline, which happens once per worker and language.
+    """
+    low = max(shard * SHARD_SIZE, min_id)
+    high = (shard + 1) * SHARD_SIZE if max_id is None else min((shard + 1) * SHARD_SIZE, max_id)
+    lock_key = {'namespace': SHARD_LOCK_NAMESPACE + SUPPORTED_LANGUAGES.index(lang), 'shard': shard}
+    # Autocommit so the lock connection does not sit idle in a transaction while the shard runs
+    with database.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock_connection:
+        if not lock_connection.execute(text("SELECT pg_try_advisory_lock(:namespace, :shard)"), lock_key).scalar():
+            return None
+        session = SessionLocal()
+        try:
+            nlp = get_shared_stanza_pipeline(lang)
+            memo = get_shared_lemma_memo(lang) if use_memo else None
+            t0 = time.perf_counter()
+            processed, skipped = lemmatize_range(session, nlp, lang, low, high, verbose=False, memo=memo)
+            return os.getpid(), processed, skipped, time.perf_counter() - t0
+        finally:
+            session.close()
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:namespace, :shard)"), lock_key)
+
+
+def lemmatize_comments_sharded(workers: int, threads_per_worker: int = None, min_id: int = 0, max_id: int = None,
+                               use_memo: bool = False):
+    """Lemmatize on a pool of worker processes, each with its own Stanza pipeline and connection, claiming
+    whole id shards; every worker COPYs its own batches into lemmatized_comments."""
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    session = SessionLocal()
+    try:
+        shards = {
+            lang: crud_utils.get_queued_comment_shards(session, crud_utils.LEMMATIZE_STAGE, lang, SHARD_SIZE,
+                                                       min_id, max_id)
+            for lang in SUPPORTED_LANGUAGES
+        }
     finally:
+        # Return the connection to the pool before forking so workers never inherit a checked-out one
         session.close()
 
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_lemmatize_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        for lang, lang_shards in shards.items():
+            if not lang_shards:
+                print(f'[{lang}] No comments to lemmatize.')
+                continue
+            per_worker = defaultdict(lambda: [0, 0.0])
+            skipped = 0
+            t0 = time.perf_counter()
+            futures = {
+                executor.submit(lemmatize_shard_worker, lang, shard, min_id, max_id, use_memo): (shard, count)
+                for shard, count in lang_shards
+            }
+            with tqdm(total=sum(count for _, count in lang_shards), desc=f'[{lang}]', unit='comment') as progress:
+                for future in as_completed(futures):
+                    shard, count = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Its comments stay queued and are picked up by the next run
+                        tqdm.write(f'[{lang}] shard {shard} failed: {e}')
+                        continue
+                    if result is None:
+                        tqdm.write(f'[{lang}] shard {shard} is being lemmatized by another run, skipped')
+                    else:
+                        pid, processed, shard_skipped, seconds = result
+                        skipped += shard_skipped
+                        per_worker[pid][0] += processed
+                        per_worker[pid][1] += seconds
+                    progress.update(count)
+            wall_seconds = time.perf_counter() - t0
+            total = sum(processed for processed, _ in per_worker.values())
+            print(f'[{lang}] {total} comments in {wall_seconds:.1f}s on {workers} worker(s) x '
+                  f'{threads_per_worker} thread(s): {total / wall_seconds:,.1f} comments/s')
+            for pid, (processed, seconds) in sorted(per_worker.items()):
+                rate = processed / seconds if seconds else 0.0
+                print(f'[{lang}]   worker {pid}: {processed} comments in {seconds:.1f}s ({rate:,.1f} comments/s)')
+            if use_memo:
+                print(memo_summary(lang, total, skipped))
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lemmatize queued lv/ru comments with Stanza.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, each lemmatizing whole id shards with its own Stanza pipeline '
+                             '(1 runs in-process)')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='torch threads per worker (default: CPU count divided by workers)')
+    parser.add_argument('--memo', action='store_true',
+                        help='look up comments made up only of known word forms in lemma_memo (built by '
+                             'core.lemma_memo) instead of running Stanza on them')
+    args = parser.parse_args()
+
     t_start = time.time()
     print('Starting comment lemmatization...')
-    lemmatize_comments()
+    if args.workers > 1:
+        lemmatize_comments_sharded(args.workers, args.threads_per_worker, use_memo=args.memo)
+    else:
+        lemmatize_comments(use_memo=args.memo)
     print(f'\nFinished in {time.time() - t_start:.1f}s')
@@ -1,11 +1,9 @@
-from keybert import KeyBERT
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline, AutoModel
-from sentence_transformers import SentenceTransformer, models
 from path_config import models_path, stopwords_path
+from core.model_registry import registry
 import os
-import torch
 
-print('CUDA available:', torch.cuda.is_available())
+# torch, transformers, sentence_transformers and keybert are imported by the loaders that need them,
+# so importing this module (e.g. for get_model_name) stays cheap
 
 # decode model name from short name
 def get_model_name(short_name: str):
@@ -39,7 +37,19 @@ def get_model_name(short_name: str):
         return None
 
 
-def get_pipeline_for_model(model_shortname: str):
+def get_pipeline_for_model(model_shortname: str, backend: str = 'torch', threads: int = None):
+    if backend in ('onnx', 'onnx-int8'):
+        # onnxruntime is only needed on the prediction boxes, so import it on demand
+        from core.onnx_classifier import get_onnx_pipeline_for_model
+        return get_onnx_pipeline_for_model(model_shortname, quantized=backend == 'onnx-int8', intra_op_threads=threads)
+    if backend == 'multi-head':
+        from core.multi_head import MultiHeadPipeline
+        return MultiHeadPipeline(model_shortname, threads)
+    import torch
+    from transformers import pipeline
+
+    if threads:
+        torch.set_num_threads(threads)
     model_name = get_model_name(model_shortname)
     model, tokenizer = get_classifier_model_and_tokenizer(model_name)
     use_cuda = torch.cuda.is_available()
@@ -54,8 +64,18 @@ def get_pipeline_for_model(model_shortname: str):
         device=0 if use_cuda else -1,
     )
 
+def get_shared_pipeline(model_shortname: str, backend: str = 'torch', threads: int = None):
+    """get_pipeline_for_model, loaded once per process and shared through the model registry."""
+    return registry.get(f'pipeline:{model_shortname}:{backend}',
+                        lambda: get_pipeline_for_model(model_shortname, backend, threads))
+
 def get_classifier_model_and_tokenizer(model_shortname: str):
+    from core.fast_weights import has_fast_weights, load_fast_model, load_fast_tokenizer
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
     model_name = get_model_name(model_shortname)
+    if has_fast_weights(model_name):
+        return load_fast_model(model_name), load_fast_tokenizer(model_name)
     model_directory = models_path()
     model = AutoModelForSequenceClassification.from_pretrained(
         model_name, local_files_only=True, cache_dir=model_directory
@@ -64,7 +84,12 @@ def get_classifier_model_and_tokenizer(model_shortname: str):
     return model, tokenizer
 
 def get_embedding_model_and_tokenizer(model_shortname: str):
+    from core.fast_weights import has_fast_weights, load_fast_model, load_fast_tokenizer
+    from transformers import AutoModel, AutoTokenizer
+
     model_name = get_model_name(model_shortname)
+    if has_fast_weights(model_name):
+        return load_fast_model(model_name, base_model=True, output_hidden_states=True), load_fast_tokenizer(model_name)
     model_directory = models_path()
     model = AutoModel.from_pretrained(
         model_name, local_files_only=True, cache_dir=model_directory, output_hidden_states=True
@@ -72,14 +97,31 @@ def get_embedding_model_and_tokenizer(model_shortname: str):
     tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True, cache_dir=model_directory)
     return model, tokenizer
 
+def get_tokenizer(model_shortname: str):
+    from core.fast_weights import has_fast_weights, load_fast_tokenizer
+    from transformers import AutoTokenizer
+
+    model_name = get_model_name(model_shortname)
+    if has_fast_weights(model_name):
+        return load_fast_tokenizer(model_name)
+    return AutoTokenizer.from_pretrained(model_name, local_files_only=True, cache_dir=models_path())
+
 def get_keybert_model(model_shortname: str):
+    import torch
+    from keybert import KeyBERT
+    from core.fast_weights import FastTransformer, has_fast_weights
+    from sentence_transformers import SentenceTransformer, models
+
     model_name = get_model_name(model_shortname)
     model_directory = models_path()
-    transformer_model = models.Transformer(
-        model_name_or_path=model_name,
-        tokenizer_name_or_path=model_name,
-        cache_dir=model_directory
-    )
+    if has_fast_weights(model_name):
+        transformer_model = FastTransformer(model_name)
+    else:
+        transformer_model = models.Transformer(
+            model_name_or_path=model_name,
+            tokenizer_name_or_path=model_name,
+            cache_dir=model_directory
+        )
     pooling_model = models.Pooling(
         transformer_model.get_word_embedding_dimension(),
         pooling_mode_mean_tokens=True
@@ -91,15 +133,18 @@ def get_keybert_model(model_shortname: str):
 
     return KeyBERT(model=st_model)
 
+def get_shared_keybert_model(model_shortname: str):
+    return registry.get(f'keybert:{model_shortname}', lambda: get_keybert_model(model_shortname))
+
 def get_keybert_model_by_language_and_prediction_type(language: str, prediction_type: str):
     if language == 'lv' and prediction_type == 'normal':
-        return get_keybert_model('lvbert-lv-go-emotions')
+        return get_shared_keybert_model('lvbert-lv-go-emotions')
     elif language == 'lv' and prediction_type == 'ekman':
-        return get_keybert_model('lvbert-lv-emotions-ekman')
+        return get_shared_keybert_model('lvbert-lv-emotions-ekman')
     elif language == 'ru' and prediction_type == 'normal':
-        return get_keybert_model('rubert-base-cased-ru-go-emotions')
+        return get_shared_keybert_model('rubert-base-cased-ru-go-emotions')
     elif language == 'ru' and prediction_type == 'ekman':
-        return get_keybert_model('rubert-base-cased-ru-go-emotions-ekman')
+        return get_shared_keybert_model('rubert-base-cased-ru-go-emotions-ekman')
     else:
         return None
 
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Memory the loaded models may take together before the least recently used ones are dropped
+MODEL_MEMORY_BUDGET_MB = float(os.getenv('MODEL_MEMORY_BUDGET_MB', 8192))
+
+
+def current_rss_mb():
+    # Resident set size of this process (Linux); ru_maxrss only ever grows, so it cannot show per-model cost
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def tensor_size_mb(model, max_depth: int = 4):
+    """Parameter and buffer bytes of the torch modules reachable from model (through attributes, dicts, lists
+    and tuples), or None if it holds none.
+
+    Memory-mapped weights are counted in full, although RSS only grows as their pages are first read.
+    """
+    torch = sys.modules.get('torch')
+    if torch is None:  # nothing has imported torch, so nothing holds tensors
+        return None
+    modules = []
+    seen = set()
+    pending = [(model, 0)]
+    while pending:
+        obj, depth = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, torch.nn.Module):
+            modules.append(obj)
+        elif depth < max_depth:
+            if isinstance(obj, dict):
+                children = obj.values()
+            elif isinstance(obj, (list, tuple)):
+                children = obj
+            else:
+                children = getattr(obj, '__dict__', {}).values()
+            if len(children) <= 1000:  # larger containers hold data (e.g. a lemma memo), not models
+                pending.extend((child, depth + 1) for child in children)
+    if not modules:
+        return None
+    # Keyed by storage, so weights shared between modules are charged once
+    tensors = {
+        tensor.data_ptr(): tensor.numel() * tensor.element_size()
+        for module in modules
+        for tensor in [*module.parameters(), *module.buffers()]
+    }
+    return sum(tensors.values()) / 1024 / 1024
+
+
+class LoadedModel:
+    def __init__(self, model, load_seconds: float, size_mb: float):
+        self.model = model
+        self.load_seconds = load_seconds
+        self.size_mb = size_mb
+        self.uses = 0
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models (pipelines, KeyBERT, Stanza), keyed by a name per model variant.
+
+    A model is loaded on its first ``get`` and shared by every later caller. Each model is charged the
+    size of its tensors, or the growth of the process RSS while it loaded if it holds none (ONNX Runtime
+    sessions, lemma memos). Once the charged total exceeds the budget the least recently used models are
+    dropped (never the one just requested), and a dropped model is loaded again on its next use.
+
+    Dropping a model only frees it once nothing else references it, so callers fetch models with ``get``
+    each time they use them instead of keeping them. Freed memory is not always handed back to the OS,
+    so RSS itself may stay higher.
+    """
+
+    def __init__(self, memory_budget_mb: float = MODEL_MEMORY_BUDGET_MB):
+        self.memory_budget_mb = memory_budget_mb
+        self.models = OrderedDict()
+        self.load_counts = {}
+        self.lock = threading.RLock()  # loaders may themselves fetch shared models
+
+    @property
+    def used_mb(self) -> float:
+        return sum(entry.size_mb for entry in self.models.values())
+
+    def get(self, key: str, loader):
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is None:
+                rss_before = current_rss_mb()
+                t0 = time.perf_counter()
+                model = loader()
+                size_mb = tensor_size_mb(model)
+                if size_mb is None:
+                    size_mb = max(0.0, current_rss_mb() - rss_before)
+                entry = LoadedModel(model, time.perf_counter() - t0, size_mb)
+                self.models[key] = entry
+                self.load_counts[key] = self.load_counts.get(key, 0) + 1
+                print(f'Loaded {key} in {entry.load_seconds:.1f}s (+{entry.size_mb:,.0f} MB; '
+                      f'{self.used_mb:,.0f}/{self.memory_budget_mb:,.0f} MB in use)')
+                self._evict_over_budget(keep=key)
+            self.models.move_to_end(key)
+            entry.uses += 1
+            return entry.model
+
+    def _evict_over_budget(self, keep: str):
+        while self.used_mb > self.memory_budget_mb and len(self.models) > 1:
+            key = next(iter(self.models))
+            if key == keep:
+                break
+            self.evict(key)
+
+    def evict(self, key: str):
+        entry = self.models.pop(key, None)
+        if entry is not None:
+            print(f'Evicted {key} (-{entry.size_mb:,.0f} MB, used {entry.uses} times)')
+
+    def clear(self):
+        for key in list(self.models):
+            self.evict(key)
+
+    def summary(self) -> list[str]:
+        return [
+            f'{key}: loaded {self.load_counts[key]}x, last load {entry.load_seconds:.1f}s, '
+            f'{entry.size_mb:,.0f} MB, used {entry.uses} times'
+            for key, entry in self.models.items()
+        ]
+
+
+registry = ModelRegistry()
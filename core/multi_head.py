@@ -0,0 +1,217 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from sqlalchemy.orm import sessionmaker
+
+from core import load_model
+from core.batch_inference import is_multi_label, logits_to_scores
+from core.token_batching import MAX_LENGTH
+from db import database, models
+from path_config import models_path
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+# Ekman checkpoint whose encoder is shared -> checkpoint the go-emotions ("normal") head comes from
+GO_EMOTIONS_MODELS = {
+    'lvbert-lv-emotions-ekman': 'lvbert-lv-go-emotions',
+    'rubert-base-cased-ru-go-emotions-ekman': 'rubert-base-cased-ru-go-emotions',
+}
+HEADS_FILENAME = 'heads.pt'
+DISTILL_SAMPLE_SIZE = 10_000
+VALIDATION_SHARE = 0.2
+MIN_AGREEMENT = 0.9  # held-out top-label agreement of the go-emotions head with the original model
+DISTILL_EPOCHS = 300
+DISTILL_LEARNING_RATE = 1e-2
+ENCODE_BATCH_SIZE = 64
+
+
+def heads_path(trunk_shortname: str):
+    model_name = load_model.get_model_name(trunk_shortname)
+    return models_path(os.path.join('multi_head', model_name.replace('/', '--'), HEADS_FILENAME))
+
+
+def labels_of(config) -> list:
+    return [config.id2label[i] for i in range(len(config.id2label))]
+
+
+def shares_encoder(trunk, teacher) -> bool:
+    trunk_state = trunk.base_model.state_dict()
+    teacher_state = teacher.base_model.state_dict()
+    return trunk_state.keys() == teacher_state.keys() and all(
+        torch.equal(trunk_state[name], teacher_state[name]) for name in trunk_state
+    )
+
+
+def encode_pooled(model, tokenizer, texts: list) -> torch.Tensor:
+    """Pooled [CLS] output of the encoder, i.e. what a BertForSequenceClassification head sees."""
+    pooled = []
+    with torch.inference_mode():
+        for start in range(0, len(texts), ENCODE_BATCH_SIZE):
+            encoded = tokenizer(texts[start:start + ENCODE_BATCH_SIZE], padding=True, truncation=True,
+                                max_length=MAX_LENGTH, return_tensors='pt')
+            pooled.append(model.base_model(**encoded).pooler_output)
+    return torch.cat(pooled)
+
+
+def teacher_probabilities(model, tokenizer, texts: list) -> torch.Tensor:
+    logits = []
+    with torch.inference_mode():
+        for start in range(0, len(texts), ENCODE_BATCH_SIZE):
+            encoded = tokenizer(texts[start:start + ENCODE_BATCH_SIZE], padding=True, truncation=True,
+                                max_length=MAX_LENGTH, return_tensors='pt')
+            logits.append(model(**encoded).logits)
+    return torch.from_numpy(logits_to_scores(torch.cat(logits).numpy(), is_multi_label(model.config)))
+
+
+def fit_head(features: torch.Tensor, targets: torch.Tensor, multi_label: bool) -> torch.nn.Linear:
+    """Train a linear head on frozen trunk features to reproduce the teacher's label probabilities."""
+    torch.manual_seed(0)
+    head = torch.nn.Linear(features.shape[1], targets.shape[1])
+    optimizer = torch.optim.Adam(head.parameters(), lr=DISTILL_LEARNING_RATE)
+    for _ in range(DISTILL_EPOCHS):
+        optimizer.zero_grad()
+        logits = head(features)
+        if multi_label:
+            loss = torch.nn.functional.binary_cross_entropy_with_logits(logits, targets)
+        else:
+            loss = torch.nn.functional.cross_entropy(logits, targets)
+        loss.backward()
+        optimizer.step()
+    return head
+
+
+def load_distill_texts(lang: str, size: int) -> list:
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(models.Comment.comment_text)
+            .filter(models.Comment.comment_lang == lang, models.Comment.comment_text != None)
+            .order_by(models.Comment.id.desc())
+            .limit(size)
+            .all()
+        )
+    finally:
+        session.close()
+    return [row.comment_text for row in rows]
+
+
+def build_heads(lang: str, trunk_shortname: str, sample_size=DISTILL_SAMPLE_SIZE, min_agreement=MIN_AGREEMENT):
+    """Attach the go-emotions head to the Ekman trunk and save it; returns False if the head is refused.
+
+    If both checkpoints were fine-tuned from the same frozen encoder, the go-emotions classifier is
+    copied as is. Otherwise a linear head is distilled on the Ekman encoder's pooled output from the
+    go-emotions model's probabilities, and kept only if its held-out top-label agreement with that
+    model reaches min_agreement.
+    """
+    teacher_shortname = GO_EMOTIONS_MODELS[trunk_shortname]
+    trunk, tokenizer = load_model.get_classifier_model_and_tokenizer(trunk_shortname)
+    teacher, teacher_tokenizer = load_model.get_classifier_model_and_tokenizer(teacher_shortname)
+    trunk.eval()
+    teacher.eval()
+    multi_label = is_multi_label(teacher.config)
+
+    if shares_encoder(trunk, teacher) and tokenizer.get_vocab() == teacher_tokenizer.get_vocab():
+        print(f'[{lang}] {teacher_shortname} shares the {trunk_shortname} encoder, extracting its head')
+        head = teacher.classifier
+        method, agreement = 'extracted', 1.0
+    else:
+        texts = load_distill_texts(lang, sample_size)
+        if len(texts) < 10:
+            print(f'[{lang}] Not enough comments to distill the go-emotions head, skipping')
+            return False
+        print(f'[{lang}] Distilling the {teacher_shortname} head onto the {trunk_shortname} encoder '
+              f'from {len(texts)} comments...')
+        rng = np.random.default_rng(0)
+        order = rng.permutation(len(texts))
+        split = max(1, int(len(texts) * VALIDATION_SHARE))
+        validation, training = order[:split], order[split:]
+
+        features = encode_pooled(trunk, tokenizer, texts)
+        targets = teacher_probabilities(teacher, teacher_tokenizer, texts)
+        head = fit_head(features[training], targets[training], multi_label)
+        with torch.no_grad():
+            predicted = head(features[validation]).argmax(dim=1)
+        agreement = (predicted == targets[validation].argmax(dim=1)).float().mean().item()
+        method = 'distilled'
+        print(f'[{lang}] held-out top-label agreement with {teacher_shortname}: {agreement:.2%}')
+        if agreement < min_agreement:
+            print(f'[{lang}] head refused ({agreement:.2%} < {min_agreement:.2%})')
+            return False
+
+    path = heads_path(trunk_shortname)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.save({
+        'normal': {
+            'weight': head.weight.detach().clone(),
+            'bias': head.bias.detach().clone(),
+            'labels': labels_of(teacher.config),
+            'multi_label': multi_label,
+            'source_model': load_model.get_model_name(teacher_shortname),
+            'method': method,
+            'agreement': agreement,
+        },
+    }, path)
+    print(f'[{lang}] saved {method} head to {path}')
+    return True
+
+
+class MultiHeadPipeline:
+    """One forward pass through the Ekman encoder, scored by the Ekman head and the saved go-emotions head.
+
+    ``run_heads`` returns label probabilities per head ('ekman', 'normal'); ``labels``, ``tokenizer``
+    and ``run_encoded`` (Ekman scores only) mirror the single-head pipelines.
+    """
+
+    def __init__(self, trunk_shortname: str, threads: int = None):
+        path = heads_path(trunk_shortname)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'No go-emotions head for {trunk_shortname}: run python3 -m core.multi_head')
+        if threads:
+            torch.set_num_threads(threads)
+        self.model, self.tokenizer = load_model.get_classifier_model_and_tokenizer(trunk_shortname)
+        self.model.eval()
+        self.labels = labels_of(self.model.config)
+
+        saved = torch.load(path)['normal']
+        normal_head = torch.nn.Linear(saved['weight'].shape[1], saved['weight'].shape[0])
+        normal_head.load_state_dict({'weight': saved['weight'], 'bias': saved['bias']})
+        self.heads = {
+            'ekman': (self.model.classifier, is_multi_label(self.model.config)),
+            'normal': (normal_head.eval(), saved['multi_label']),
+        }
+        self.head_labels = {'ekman': self.labels, 'normal': saved['labels']}
+
+    def run_heads(self, inputs: dict) -> dict:
+        feed = {
+            name: torch.from_numpy(array) for name, array in inputs.items()
+            if name in self.tokenizer.model_input_names
+        }
+        with torch.inference_mode():
+            pooled = self.model.base_model(**feed).pooler_output
+            return {
+                name: logits_to_scores(head(pooled).float().numpy(), multi_label)
+                for name, (head, multi_label) in self.heads.items()
+            }
+
+    def run_encoded(self, inputs: dict) -> np.ndarray:
+        return self.run_heads(inputs)['ekman']
+
+
+if __name__ == '__main__':
+    from core.predict_comments import PREDICTION_MODELS
+
+    parser = argparse.ArgumentParser(description='Build go-emotions heads that share the Ekman encoder.')
+    parser.add_argument('--lang', choices=list(PREDICTION_MODELS), nargs='+', default=list(PREDICTION_MODELS))
+    parser.add_argument('--sample-size', type=int, default=DISTILL_SAMPLE_SIZE,
+                        help='comments used to distill (and validate) the head')
+    parser.add_argument('--min-agreement', type=float, default=MIN_AGREEMENT,
+                        help='held-out top-label agreement with the go-emotions model needed to keep the head')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    for lang in args.lang:
+        build_heads(lang, PREDICTION_MODELS[lang], args.sample_size, args.min_agreement)
+    print(f'Done in {time.time() - start_time:.1f}s')
@@ -0,0 +1,151 @@
+import json
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import QuantType, quant_pre_process, quantize_dynamic
+import torch
+from transformers import AutoConfig, AutoTokenizer
+
+from core import load_model
+from core.batch_inference import format_predictions, is_multi_label, logits_to_scores
+from path_config import models_path
+
+ONNX_OPSET = 17
+ONNX_FILENAME = 'model.onnx'
+INT8_FILENAME = 'model.int8.onnx'
+# Written by core.quantize_models: the accuracy gate result for the int8 variant
+QUANTIZATION_REPORT = 'quantization.json'
+MAX_LENGTH = 512
+# Classifiers served by the ONNX backend; exported once into models/onnx/
+ONNX_MODELS = [
+    'lvbert-lv-emotions-ekman',
+    'rubert-base-cased-ru-go-emotions-ekman',
+    'lvbert-lv-go-emotions',
+    'rubert-base-cased-ru-go-emotions',
+]
+
+
+def onnx_model_dir(model_shortname: str):
+    model_name = load_model.get_model_name(model_shortname)
+    return models_path(os.path.join('onnx', model_name.replace('/', '--')))
+
+
+def export_classifier_to_onnx(model_shortname: str, overwrite=False):
+    """Export the cached PyTorch classifier with its tokenizer and config; returns the export directory."""
+    export_dir = onnx_model_dir(model_shortname)
+    onnx_file = os.path.join(export_dir, ONNX_FILENAME)
+    if os.path.exists(onnx_file) and not overwrite:
+        return export_dir
+
+    model, tokenizer = load_model.get_classifier_model_and_tokenizer(model_shortname)
+    model.eval()
+    model.config.return_dict = False
+    os.makedirs(export_dir, exist_ok=True)
+
+    sample = tokenizer(['Sveiki', 'Привет, как дела?'], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), onnx_file,
+            input_names=input_names, output_names=['logits'], dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET, do_constant_folding=True, dynamo=False,
+        )
+    tokenizer.save_pretrained(export_dir)
+    model.config.save_pretrained(export_dir)
+    return export_dir
+
+
+def quantize_classifier(model_shortname: str, overwrite=False):
+    """Build the dynamic int8 variant next to the fp32 export; returns its path."""
+    export_dir = export_classifier_to_onnx(model_shortname)
+    int8_file = os.path.join(export_dir, INT8_FILENAME)
+    if os.path.exists(int8_file) and not overwrite:
+        return int8_file
+    # Shape inference and graph fusion first, so more MatMuls are picked up by the quantizer
+    preprocessed_file = os.path.join(export_dir, 'model.preprocessed.onnx')
+    quant_pre_process(os.path.join(export_dir, ONNX_FILENAME), preprocessed_file, skip_symbolic_shape=True)
+    # Weights become int8 ahead of time, activations are quantized per batch at run time
+    quantize_dynamic(preprocessed_file, int8_file, weight_type=QuantType.QInt8)
+    os.remove(preprocessed_file)
+    return int8_file
+
+
+def read_quantization_report(model_shortname: str):
+    report_file = os.path.join(onnx_model_dir(model_shortname), QUANTIZATION_REPORT)
+    if not os.path.exists(report_file):
+        return None
+    with open(report_file) as file:
+        return json.load(file)
+
+
+def write_quantization_report(model_shortname: str, report: dict):
+    with open(os.path.join(onnx_model_dir(model_shortname), QUANTIZATION_REPORT), 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+class OnnxTextClassifier:
+    """ONNX Runtime stand-in for a ``text-classification`` pipeline with ``top_k=None``.
+
+    Calling it with a list of texts returns, per text, every label with its score sorted from
+    most to least likely, the same structure the transformers pipeline produces, so callers
+    such as ``predict_comments.process_predictions`` work with either backend.
+    """
+
+    def __init__(self, model_dir, max_length=MAX_LENGTH, intra_op_threads=None, onnx_filename=ONNX_FILENAME):
+        self.config = AutoConfig.from_pretrained(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+        self.labels = [self.config.id2label[i] for i in range(len(self.config.id2label))]
+        self.multi_label = is_multi_label(self.config)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, onnx_filename), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def run_encoded(self, inputs: dict) -> np.ndarray:
+        """Label probabilities for already tokenized and padded int64 inputs."""
+        logits = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        return logits_to_scores(logits, self.multi_label)
+
+    def predict_scores(self, texts: list, batch_size=32, truncation=True) -> np.ndarray:
+        """Label probabilities as a (len(texts), num_labels) float32 array."""
+        scores = np.empty((len(texts), len(self.labels)), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=truncation,
+                max_length=self.max_length, return_tensors='np',
+            )
+            batch_scores = self.run_encoded({name: encoded[name].astype(np.int64) for name in self.input_names})
+            scores[start:start + len(batch_scores)] = batch_scores
+        return scores
+
+    def __call__(self, texts: list, batch_size=32, truncation=True):
+        return format_predictions(self.predict_scores(texts, batch_size, truncation), self.labels)
+
+
+def get_onnx_pipeline_for_model(model_shortname: str, quantized=False, intra_op_threads=None):
+    export_dir = export_classifier_to_onnx(model_shortname)
+    if not quantized:
+        return OnnxTextClassifier(export_dir, intra_op_threads=intra_op_threads)
+
+    report = read_quantization_report(model_shortname)
+    if not report or not report['accepted'] or not os.path.exists(os.path.join(export_dir, INT8_FILENAME)):
+        print(f'No validated int8 model for {model_shortname} (run core.quantize_models), using fp32 ONNX')
+        return OnnxTextClassifier(export_dir, intra_op_threads=intra_op_threads)
+    return OnnxTextClassifier(export_dir, intra_op_threads=intra_op_threads, onnx_filename=INT8_FILENAME)
+
+
+if __name__ == '__main__':
+    for shortname in ONNX_MODELS:
+        t_start = time.time()
+        print(f'Exporting {shortname} to ONNX...')
+        print(f'  -> {export_classifier_to_onnx(shortname)} ({time.time() - t_start:.1f}s)')
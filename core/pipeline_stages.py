@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+QUEUE_POLL_SECONDS = 0.2
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when another stage failed, so every thread unwinds instead of blocking."""
+
+
+class StageTimer:
+    """How long a stage spent working, waiting for input from upstream and waiting for room downstream."""
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.waiting_input = 0.0
+        self.waiting_output = 0.0
+        self.items = 0
+
+    @contextmanager
+    def working(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.busy += time.perf_counter() - t0
+
+    @property
+    def stalled(self):
+        return self.waiting_input + self.waiting_output
+
+    def summary(self) -> str:
+        return (f'{self.name:<8} busy {self.busy:7.1f}s, stalled {self.stalled:7.1f}s '
+                f'(waiting for input {self.waiting_input:.1f}s, for output {self.waiting_output:.1f}s)')
+
+
+class StagedPipeline:
+    """Runs producer/consumer stages on threads connected by bounded queues.
+
+    Each stage reads with ``get`` and writes with ``put``; ``None`` marks the end of a stream. A
+    stage that raises stops the others, and ``finish`` re-raises its exception in the caller.
+    Bounded queues keep at most ``queue_size`` items between two stages, so a slow stage holds
+    back the ones before it instead of letting memory grow.
+    """
+
+    def __init__(self, queue_size=2):
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.errors = []
+        self.threads = []
+
+    def new_queue(self):
+        return queue.Queue(maxsize=self.queue_size)
+
+    def get(self, source: queue.Queue, timer: StageTimer):
+        t0 = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return source.get(timeout=QUEUE_POLL_SECONDS)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        raise PipelineStopped()
+        finally:
+            timer.waiting_input += time.perf_counter() - t0
+
+    def put(self, target: queue.Queue, item, timer: StageTimer):
+        t0 = time.perf_counter()
+        try:
+            while True:
+                try:
+                    target.put(item, timeout=QUEUE_POLL_SECONDS)
+                    return
+                except queue.Full:
+                    if self.stop.is_set():
+                        raise PipelineStopped()
+        finally:
+            timer.waiting_output += time.perf_counter() - t0
+
+    def start(self, name, target, *args):
+        thread = threading.Thread(target=self._run, args=(target, args), name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _run(self, target, args):
+        try:
+            target(*args)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop.set()
+
+    def abort(self):
+        """Stop every stage after a failure in the calling thread."""
+        self.stop.set()
+        self._join()
+
+    def finish(self):
+        self._join()
+        if self.errors:
+            raise self.errors[0]
+
+    def _join(self):
+        for thread in self.threads:
+            thread.join()
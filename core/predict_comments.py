@@ -1,81 +1,321 @@
+import argparse
+import os
 import time
-import warnings
-import torch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 from tqdm import tqdm
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 from db import models, crud_utils, database
 from core import load_model
-
-warnings.filterwarnings("ignore", message="You seem to be using the pipelines sequentially on GPU")
+from core.batch_inference import encode_chunk, format_predictions, prediction_labels, score_batch
+from core.pipeline_stages import PipelineStopped, StageTimer, StagedPipeline
+from core.prediction_cache import CacheStats, PredictionChunk, prediction_model_id
+from core.token_batching import BatchStats
+from core.token_store import decode_token_ids, token_dtype, tokenizer_key
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
 session = SessionLocal()
 
 CHUNK_SIZE = 10_000
-PIPELINE_BATCH_SIZE = 128
+# Padded tokens (batch size x longest comment) per model call, instead of a fixed comment count
+MAX_BATCH_TOKENS = 16_384
+MAX_BATCH_SIZE = 256
+QUEUE_SIZE = 2  # chunks buffered between two pipeline stages
+# Sharded mode: comment ids are split into fixed ranges so concurrent runs agree on shard boundaries
+SHARD_SIZE = 50_000
+SHARD_LOCK_NAMESPACE = 0x50524544  # first key of the pg advisory lock held while a shard is predicted
+show_progress = True
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'multi-head')
+PREDICTION_MODELS = {
+    'lv': 'lvbert-lv-emotions-ekman',
+    'ru': 'rubert-base-cased-ru-go-emotions-ekman',
+}
 
 def process_predictions(prediction):
     emotion_dict = {emotion['label']: round(emotion['score'], 5) for emotion in prediction}
     max_emotion = max(emotion_dict, key=emotion_dict.get)
     return emotion_dict, max_emotion, emotion_dict[max_emotion]
 
-def process_language(pipeline, lang, website=None):
-    total = crud_utils.get_unpredicted_comment_count_by_lang(session, lang, website)
-    if total == 0:
-        print(f'[{lang}] No unpredicted comments.')
-        return 0
+def emotion_dicts(scores, labels):
+    return [process_predictions(prediction)[0] for prediction in format_predictions(scores, labels)]
+
+def pipeline_heads(pipeline):
+    """Labels of every head the pipeline scores; single-head pipelines only have the Ekman one.
+
+    Heads are named after the predicted_comments columns they fill and their prediction_label_sets
+    row: 'ekman' and 'normal' (go-emotions).
+    """
+    if hasattr(pipeline, 'head_labels'):
+        return pipeline.head_labels
+    return {'ekman': prediction_labels(pipeline)}
+
+def score_heads(pipeline, inputs):
+    if hasattr(pipeline, 'run_heads'):
+        return pipeline.run_heads(inputs)
+    return {'ekman': score_batch(pipeline, inputs)}
 
-    last_id = 0
-    processed = 0
+def predict_texts(pipeline, texts, max_batch_tokens=MAX_BATCH_TOKENS):
+    """Run the pipeline over token-budget batches and return the predictions in the order of texts."""
+    scores = np.empty((len(texts), len(prediction_labels(pipeline))), dtype=np.float32)
+    for batch in encode_chunk(pipeline.tokenizer, texts, max_batch_tokens, MAX_BATCH_SIZE):
+        scores[batch.indices] = score_batch(pipeline, batch.inputs)
+    return format_predictions(scores, prediction_labels(pipeline))
 
-    with tqdm(total=total, desc=f'[{lang}]', unit='comment') as progress:
+def fetch_stage(stages, lang, website, min_id, max_id, model_id, token_key, output, timer):
+    fetch_session = SessionLocal()
+    try:
+        last_id = min_id
         while True:
-            batch = crud_utils.get_unpredicted_comments_batch_by_lang(session, lang, last_id, CHUNK_SIZE, website)
-            if not batch:
+            with timer.working():
+                rows = crud_utils.get_unpredicted_comment_rows_by_lang(
+                    fetch_session, lang, last_id, CHUNK_SIZE, website, max_id, token_key
+                )
+                if rows:
+                    chunk = PredictionChunk(rows)
+                    cached = {}
+                    if model_id and chunk.cacheable:
+                        cached = crud_utils.get_cached_predictions(fetch_session, model_id, list(chunk.cacheable))
+                    chunk.plan(cached)
+                fetch_session.commit()
+            if not rows:
                 break
+            last_id = rows[-1].id
+            timer.items += len(rows)
+            stages.put(output, chunk, timer)
+    finally:
+        fetch_session.close()
+    stages.put(output, None, timer)
 
-            last_id = batch[-1].id
-
-            order = sorted(range(len(batch)), key=lambda i: len(batch[i].comment_text or ''))
-            sorted_batch = [batch[i] for i in order]
-            texts = [c.comment_text for c in sorted_batch]
-
-            with torch.inference_mode():
-                results = pipeline(texts, batch_size=PIPELINE_BATCH_SIZE, truncation=True)
-
-            objects = []
-            for comment, prediction in zip(sorted_batch, results):
-                emotion_dict, max_emotion, max_score = process_predictions(prediction)
-                objects.append({
-                    'comment_id': comment.id,
-                    'comment_timestamp': comment.timestamp,
-                    'article_id': comment.article_id,
-                    'text': comment.comment_text,
-                    'text_lang': lang,
-                    'website': comment.website,
-                    'ekman_prediction_json': emotion_dict,
-                    'ekman_prediction_emotion': max_emotion,
-                    'ekman_prediction_score': max_score,
-                })
-
-            session.bulk_insert_mappings(models.PredictedComment, objects)
-            session.commit()
-            processed += len(objects)
-            progress.update(len(batch))
-
-    print(f'[{lang}] done — {processed} comments processed.')
+def tokenize_stage(stages, tokenizer, max_batch_tokens, source, output, timer):
+    dtype = token_dtype(tokenizer)
+    while (chunk := stages.get(source, timer)) is not None:
+        with timer.working():
+            token_ids = [None if data is None else decode_token_ids(data, dtype) for data in chunk.infer_token_ids]
+            chunk.batches = encode_chunk(tokenizer, chunk.infer_texts, max_batch_tokens, MAX_BATCH_SIZE,
+                                         token_ids=token_ids)
+        timer.items += len(chunk.infer_texts)
+        stages.put(output, chunk, timer)
+    stages.put(output, None, timer)
+
+def write_stage(stages, lang, heads, model_id, source, timer, progress):
+    # Single-head cache entries are the Ekman emotion dict itself, multi-head ones map head -> emotion dict
+    single_head = list(heads) == ['ekman']
+    write_session = SessionLocal()
+    try:
+        label_orders = {
+            head: crud_utils.get_prediction_label_order(write_session, head, labels) for head, labels in heads.items()
+        }
+        write_session.commit()
+        while (chunk := stages.get(source, timer)) is not None:
+            with timer.working():
+                head_dicts = {head: emotion_dicts(chunk.scores[head], labels) for head, labels in heads.items()}
+                inferred = {
+                    text_hash: {head: head_dicts[head][i] for head in heads}
+                    for i, text_hash in enumerate(chunk.infer_hashes)
+                }
+                cached = {
+                    text_hash: {'ekman': prediction} if single_head else prediction
+                    for text_hash, prediction in chunk.cached.items()
+                }
+                predictions = {**cached, **inferred}
+                objects = []
+                for row, text_hash in zip(chunk.rows, chunk.hashes):
+                    obj = {
+                        'comment_id': row.id,
+                        'comment_timestamp': row.timestamp,
+                        'article_id': row.article_id,
+                        'text': row.comment_text,
+                        'text_lang': lang,
+                        'website': row.website,
+                    }
+                    for head, emotion_dict in predictions[text_hash].items():
+                        max_emotion = max(emotion_dict, key=emotion_dict.get)
+                        obj[f'{head}_scores'] = [emotion_dict[label] for label in label_orders[head]]
+                        obj[f'{head}_prediction_emotion'] = max_emotion
+                        obj[f'{head}_prediction_score'] = emotion_dict[max_emotion]
+                    objects.append(obj)
+                write_session.bulk_insert_mappings(models.PredictedComment, objects)
+                crud_utils.dequeue_comments(write_session, crud_utils.PREDICT_STAGE, [row.id for row in chunk.rows])
+                write_session.commit()
+                if model_id:
+                    # Own short transaction, so cache key locks are not held while the predictions are written
+                    crud_utils.insert_cached_predictions(write_session, model_id, {
+                        text_hash: prediction['ekman'] if single_head else prediction
+                        for text_hash, prediction in inferred.items() if text_hash in chunk.cacheable
+                    })
+                    write_session.commit()
+            timer.items += len(objects)
+            progress.update(len(objects))
+    finally:
+        write_session.close()
+
+def process_language(pipeline, lang, website=None, min_id=0, max_id=None, max_batch_tokens=MAX_BATCH_TOKENS,
+                     model_id=None, stats=None, stored_tokens=True, timers=None):
+    """Predict unpredicted comments of one language with fetching, tokenization, inference and writing overlapped.
+
+    The fetch, tokenize and write stages run on their own threads (with their own sessions) around
+    inference on the calling thread, connected by queues of at most QUEUE_SIZE chunks. A multi-head
+    pipeline fills the columns of every head it scores from one encoder pass. With a
+    model_id, short texts are looked up in and added to the prediction cache, and only texts
+    neither cached nor repeated earlier in the chunk reach the model. Texts with tokens stored by
+    core.token_store for the pipeline's tokenizer skip tokenization unless stored_tokens is False.
+    Pass a BatchStats as stats to keep the per-batch figures of the run, and a dict as timers to
+    receive the StageTimer of each stage.
+    """
+    total = crud_utils.get_unpredicted_comment_count_by_lang(session, lang, website, min_id, max_id)
+    session.close()
+    if total == 0:
+        if show_progress:
+            print(f'[{lang}] No unpredicted comments.')
+        return 0
+
+    heads = pipeline_heads(pipeline)
+    stats = BatchStats() if stats is None else stats
+    cache_stats = CacheStats()
+    token_key = tokenizer_key(pipeline.tokenizer) if stored_tokens else None
+    pretokenized = 0
+    timers = {} if timers is None else timers
+    timers.update({name: StageTimer(name) for name in ('fetch', 'tokenize', 'infer', 'write')})
+    stages = StagedPipeline(QUEUE_SIZE)
+    fetched, tokenized, inferred = stages.new_queue(), stages.new_queue(), stages.new_queue()
+
+    with tqdm(total=total, desc=f'[{lang}]', unit='comment', disable=not show_progress) as progress:
+        stages.start('fetch', fetch_stage, stages, lang, website, min_id, max_id, model_id, token_key, fetched,
+                     timers['fetch'])
+        stages.start('tokenize', tokenize_stage, stages, pipeline.tokenizer, max_batch_tokens, fetched, tokenized,
+                     timers['tokenize'])
+        stages.start('write', write_stage, stages, lang, heads, model_id, inferred, timers['write'], progress)
+        try:
+            infer_timer = timers['infer']
+            while (chunk := stages.get(tokenized, infer_timer)) is not None:
+                chunk.scores = {
+                    head: np.empty((len(chunk.infer_texts), len(labels)), dtype=np.float32)
+                    for head, labels in heads.items()
+                }
+                for batch in chunk.batches:
+                    t0 = time.perf_counter()
+                    with infer_timer.working():
+                        for head, scores in score_heads(pipeline, batch.inputs).items():
+                            chunk.scores[head][batch.indices] = scores
+                    seconds = time.perf_counter() - t0
+                    stats.add(batch.lengths, seconds)
+                    progress.set_postfix(batch=len(batch.indices), waste=f'{BatchStats.padding_waste(batch.lengths):.0%}',
+                                         tok_s=f'{sum(batch.lengths) / seconds:,.0f}' if seconds else '-')
+                infer_timer.items += len(chunk.infer_texts)
+                pretokenized += sum(data is not None for data in chunk.infer_token_ids)
+                cache_stats.add(chunk)
+                stages.put(inferred, chunk, infer_timer)
+            stages.put(inferred, None, infer_timer)
+        except PipelineStopped:
+            pass  # another stage failed; finish() raises its error
+        except BaseException:
+            stages.abort()
+            raise
+        stages.finish()
+
+    processed = timers['write'].items
+    if show_progress:
+        print(f'[{lang}] done — {processed} comments processed.')
+        print(f'[{lang}] {stats.summary()}')
+        print(f'[{lang}] {cache_stats.summary(stats.seconds)}')
+        if token_key:
+            print(f'[{lang}] stored tokens: {pretokenized} of {cache_stats.inferred} inferred texts')
+        for timer in timers.values():
+            print(f'[{lang}] {timer.summary()}')
     return processed
 
-def process_comments():
-    pipelines = {
-        'lv': load_model.get_pipeline_for_model('lvbert-lv-emotions-ekman'),
-        'ru': load_model.get_pipeline_for_model('rubert-base-cased-ru-go-emotions-ekman'),
+worker_settings = {}
+worker_pipelines = {}
+
+def init_prediction_worker(backend, threads, max_batch_tokens):
+    # Forked workers must not reuse the parent's pooled connections
+    global show_progress
+    show_progress = False
+    database.engine.dispose(close=False)
+    worker_settings.update(backend=backend, threads=threads, max_batch_tokens=max_batch_tokens)
+
+def get_worker_pipeline(lang):
+    # One model per worker at a time: languages are predicted one after another
+    if lang not in worker_pipelines:
+        worker_pipelines.clear()
+        worker_pipelines[lang] = load_model.get_pipeline_for_model(
+            PREDICTION_MODELS[lang], worker_settings['backend'], worker_settings['threads']
+        )
+    return worker_pipelines[lang]
+
+def predict_shard_worker(lang, shard, website=None, min_id=0, max_id=None):
+    """Predict one id shard; returns the number of comments written, or None if another run holds the shard."""
+    low = max(shard * SHARD_SIZE, min_id)
+    high = (shard + 1) * SHARD_SIZE if max_id is None else min((shard + 1) * SHARD_SIZE, max_id)
+    lock_key = {'namespace': SHARD_LOCK_NAMESPACE + list(PREDICTION_MODELS).index(lang), 'shard': shard}
+    # Autocommit so the lock connection does not sit idle in a transaction while the shard runs
+    with database.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock_connection:
+        if not lock_connection.execute(text("SELECT pg_try_advisory_lock(:namespace, :shard)"), lock_key).scalar():
+            return None
+        try:
+            model_id = prediction_model_id(PREDICTION_MODELS[lang], worker_settings['backend'])
+            return process_language(get_worker_pipeline(lang), lang, website, low, high,
+                                    worker_settings['max_batch_tokens'], model_id)
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:namespace, :shard)"), lock_key)
+
+def process_comments_sharded(workers, threads_per_worker=None, backend='torch', max_batch_tokens=MAX_BATCH_TOKENS,
+                             min_id=0, max_id=None, website='delfi'):
+    """Predict on a pool of worker processes, each loading its own model and claiming whole id shards."""
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    shards = {
+        lang: crud_utils.get_unpredicted_comment_shards_by_lang(session, lang, SHARD_SIZE, website, min_id, max_id)
+        for lang in PREDICTION_MODELS
     }
-    for lang, pipeline in pipelines.items():
-        process_language(pipeline, lang, website='delfi')
+    # Return the parent's connection to the pool before forking so workers never inherit a checked-out one
+    session.close()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_prediction_worker,
+                             initargs=(backend, threads_per_worker, max_batch_tokens)) as executor:
+        for lang, lang_shards in shards.items():
+            futures = {
+                executor.submit(predict_shard_worker, lang, shard, website, min_id, max_id): (shard, count)
+                for shard, count in lang_shards
+            }
+            with tqdm(total=sum(count for _, count in lang_shards), desc=f'[{lang}]', unit='comment') as progress:
+                for future in as_completed(futures):
+                    shard, count = futures[future]
+                    try:
+                        processed = future.result()
+                    except Exception as e:
+                        # Its comments stay unpredicted and are picked up by the next run
+                        tqdm.write(f'[{lang}] shard {shard} failed: {e}')
+                        continue
+                    if processed is None:
+                        tqdm.write(f'[{lang}] shard {shard} is being predicted by another run, skipped')
+                    progress.update(count)
+
+def process_comments(min_id=0, max_id=None, backend='torch', max_batch_tokens=MAX_BATCH_TOKENS):
+    for lang, model in PREDICTION_MODELS.items():
+        # Fetched per language and not kept, so the model registry can evict a pipeline once it is done
+        process_language(load_model.get_shared_pipeline(model, backend), lang, website='delfi',
+                         min_id=min_id, max_id=max_id, max_batch_tokens=max_batch_tokens,
+                         model_id=prediction_model_id(model, backend))
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict Ekman (and with multi-head, go-emotions) emotions for unpredicted comments.')
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help='inference backend; onnx runs the exported models on ONNX Runtime (CPU), '
+                             'onnx-int8 their validated int8 variants, multi-head also fills the go-emotions '
+                             'columns from the Ekman encoder pass (heads built by core.multi_head)')
+    parser.add_argument('--max-batch-tokens', type=int, default=MAX_BATCH_TOKENS,
+                        help='padded tokens per model call; batches hold many short or few long comments')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, each predicting whole id shards with its own model (1 runs in-process)')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='intra-op threads per worker (default: CPU count divided by workers)')
+    args = parser.parse_args()
+
     start_time = time.time()
-    print('Processing comments...')
-    process_comments()
+    print(f'Processing comments ({args.backend} backend)...')
+    if args.workers > 1:
+        process_comments_sharded(args.workers, args.threads_per_worker, args.backend, args.max_batch_tokens)
+    else:
+        process_comments(backend=args.backend, max_batch_tokens=args.max_batch_tokens)
     print(f'Done in {time.time() - start_time:.1f}s')
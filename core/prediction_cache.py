@@ -0,0 +1,82 @@
+import hashlib
+import uuid
+
+# Only short texts are cached: they are the ones that repeat ("Kauns!", emoji, copy-pasted spam)
+CACHE_MAX_CHARS = 280
+
+
+def normalize_text(text) -> str:
+    # The BERT tokenizers split on any whitespace run, so collapsing it never changes the model input
+    return ' '.join((text or '').split())
+
+
+def text_hash(normalized: str) -> str:
+    return str(uuid.UUID(hashlib.md5(normalized.encode('utf-8')).hexdigest()))
+
+
+def prediction_model_id(model_shortname: str, backend: str) -> str:
+    # fp32 PyTorch and ONNX agree to ~1e-7, so they share cache entries; int8 scores do not.
+    # Multi-head entries hold the predictions of every head, so they are kept apart as well.
+    variant = {'onnx-int8': 'int8', 'multi-head': 'multihead'}.get(backend, 'fp32')
+    return f"{model_shortname}:{variant}"
+
+
+class PredictionChunk:
+    """A fetched chunk of comments, split into the unique texts the model must see and rows answered without it.
+
+    Rows whose normalized text is in the cache take the cached prediction, and repeats of a text
+    within the chunk share the prediction of its first occurrence, so ``infer_texts`` holds each
+    remaining text exactly once.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        normalized = [normalize_text(row.comment_text) for row in rows]
+        self.hashes = [text_hash(text) for text in normalized]
+        self.cacheable = {h for h, text in zip(self.hashes, normalized) if len(text) <= CACHE_MAX_CHARS}
+        self.cached = {}
+        self.infer_hashes = []
+        self.infer_texts = []
+        self.infer_token_ids = []  # stored tokens of each infer text (see core.token_store), or None
+        self.batches = None
+        self.scores = None
+
+    def plan(self, cached: dict):
+        self.cached = cached
+        seen = set(cached)
+        for row, h in zip(self.rows, self.hashes):
+            if h not in seen:
+                seen.add(h)
+                self.infer_hashes.append(h)
+                self.infer_texts.append(row.comment_text)
+                self.infer_token_ids.append(getattr(row, 'token_ids', None))
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(h in self.cached for h in self.hashes)
+
+    @property
+    def duplicates(self) -> int:
+        return len(self.rows) - self.cache_hits - len(self.infer_texts)
+
+
+class CacheStats:
+    def __init__(self):
+        self.rows = 0
+        self.hits = 0
+        self.duplicates = 0
+        self.inferred = 0
+
+    def add(self, chunk: PredictionChunk):
+        self.rows += len(chunk.rows)
+        self.hits += chunk.cache_hits
+        self.duplicates += chunk.duplicates
+        self.inferred += len(chunk.infer_texts)
+
+    def summary(self, infer_seconds: float) -> str:
+        skipped = self.hits + self.duplicates
+        # Skipped rows are costed at this run's average inference time per text
+        saved = infer_seconds / self.inferred * skipped if self.inferred else 0.0
+        hit_rate = self.hits / self.rows if self.rows else 0.0
+        return (f'cache: {self.hits} hits ({hit_rate:.1%}), {self.duplicates} repeats within a chunk, '
+                f'{self.inferred} inferred; ~{saved:.1f}s of inference saved')
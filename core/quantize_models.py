@@ -0,0 +1,109 @@
+import argparse
+import gc
+import os
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from core import load_model
+from core.model_registry import current_rss_mb
+from core.onnx_classifier import (
+    INT8_FILENAME, OnnxTextClassifier, export_classifier_to_onnx, quantize_classifier, write_quantization_report,
+)
+from core.predict_comments import PREDICTION_MODELS, predict_texts
+from db import database, models
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+SAMPLE_SIZE = 2_000
+MIN_AGREEMENT = 0.97  # share of sampled comments whose top emotion must match the stored prediction
+
+
+def load_validation_sample(lang: str, size: int):
+    """Random already-predicted comments of one language as (texts, stored top emotions)."""
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(models.PredictedComment.text, models.PredictedComment.ekman_prediction_emotion)
+            .filter(
+                models.PredictedComment.text_lang == lang,
+                models.PredictedComment.text != None,
+                models.PredictedComment.ekman_prediction_emotion != None,
+            )
+            .order_by(func.random())
+            .limit(size)
+            .all()
+        )
+    finally:
+        session.close()
+    return [row.text for row in rows], [row.ekman_prediction_emotion for row in rows]
+
+
+def evaluate_variant(name, load, texts, expected):
+    """Load one model variant and report its memory, throughput and agreement with the stored labels."""
+    gc.collect()
+    rss_before = current_rss_mb()
+    t0 = time.perf_counter()
+    pipeline = load()
+    load_seconds = time.perf_counter() - t0
+    load_mb = current_rss_mb() - rss_before
+
+    t0 = time.perf_counter()
+    results = predict_texts(pipeline, texts)
+    seconds = time.perf_counter() - t0
+    agreement = sum(result[0]['label'] == label for result, label in zip(results, expected)) / len(expected)
+
+    print(f'  {name:<10} load {load_seconds:5.1f}s {load_mb:8.1f} MB | '
+          f'{len(texts) / seconds:8.1f} comments/s | agreement {agreement:.2%}')
+    del pipeline
+    return {'load_mb': round(load_mb, 1), 'comments_per_sec': round(len(texts) / seconds, 1), 'agreement': agreement}
+
+
+def quantize_and_validate(lang, model_shortname, sample_size, min_agreement, overwrite=False):
+    texts, expected = load_validation_sample(lang, sample_size)
+    if not texts:
+        print(f'[{lang}] No predicted comments to validate against, skipping {model_shortname}')
+        return None
+
+    print(f'[{lang}] {model_shortname}: validating on {len(texts)} predicted comments')
+    export_dir = export_classifier_to_onnx(model_shortname)
+    int8_file = quantize_classifier(model_shortname, overwrite)
+    variants = {
+        'torch': lambda: load_model.get_pipeline_for_model(model_shortname, 'torch'),
+        'onnx': lambda: OnnxTextClassifier(export_dir),
+        'onnx-int8': lambda: OnnxTextClassifier(export_dir, onnx_filename=INT8_FILENAME),
+    }
+    results = {name: evaluate_variant(name, load, texts, expected) for name, load in variants.items()}
+
+    agreement = results['onnx-int8']['agreement']
+    accepted = agreement >= min_agreement
+    write_quantization_report(model_shortname, {
+        'accepted': accepted,
+        'agreement': agreement,
+        'min_agreement': min_agreement,
+        'sample_size': len(texts),
+        'variants': results,
+    })
+    if accepted:
+        print(f'  int8 accepted ({agreement:.2%} >= {min_agreement:.2%})')
+    else:
+        os.remove(int8_file)
+        print(f'  int8 refused ({agreement:.2%} < {min_agreement:.2%}), the fp32 ONNX model stays in use')
+    return accepted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build int8 variants of the emotion classifiers and validate them.')
+    parser.add_argument('--lang', choices=list(PREDICTION_MODELS), nargs='+', default=list(PREDICTION_MODELS))
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE,
+                        help='predicted comments per language used for validation')
+    parser.add_argument('--min-agreement', type=float, default=MIN_AGREEMENT,
+                        help='minimum top-emotion agreement with stored predictions to accept the int8 model')
+    parser.add_argument('--overwrite', action='store_true', help='rebuild the int8 model even if one exists')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    for lang in args.lang:
+        quantize_and_validate(lang, PREDICTION_MODELS[lang], args.sample_size, args.min_agreement, args.overwrite)
+    print(f'Done in {time.time() - start_time:.1f}s')
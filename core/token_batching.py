@@ -0,0 +1,67 @@
+import numpy as np
+
+MAX_LENGTH = 512
+
+
+def plan_token_batches(lengths: list, max_batch_tokens: int, max_batch_size: int) -> list[list[int]]:
+    """Group text indices by token length so no batch exceeds max_batch_tokens once padded.
+
+    Indices are taken shortest first and a batch is closed as soon as one more text would push
+    ``batch size * longest length`` (the padded size the model actually computes on) over the
+    budget, so short comments travel in large batches and long ones in small batches.
+    """
+    batches = []
+    current = []
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Ascending order: the new text is always the longest in the batch
+        if current and ((len(current) + 1) * lengths[index] > max_batch_tokens or len(current) == max_batch_size):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchStats:
+    """Running padding and throughput figures of token-budget batches."""
+
+    def __init__(self):
+        self.batches = 0
+        self.texts = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.seconds = 0.0
+        self.batch_seconds = []
+
+    def add(self, batch_lengths: list, seconds: float):
+        self.batches += 1
+        self.texts += len(batch_lengths)
+        self.tokens += sum(batch_lengths)
+        self.padded_tokens += max(batch_lengths) * len(batch_lengths)
+        self.seconds += seconds
+        self.batch_seconds.append(seconds)
+
+    @staticmethod
+    def padding_waste(batch_lengths: list) -> float:
+        padded = max(batch_lengths) * len(batch_lengths)
+        return 1 - sum(batch_lengths) / padded
+
+    @property
+    def total_padding_waste(self) -> float:
+        return 1 - self.tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Seconds per model call at the given percentile (0-100) over all batches so far."""
+        return float(np.percentile(self.batch_seconds, percentile)) if self.batch_seconds else 0.0
+
+    def summary(self) -> str:
+        texts_per_sec = self.texts / self.seconds if self.seconds else 0.0
+        average_size = self.texts / self.batches if self.batches else 0.0
+        return (f'{self.batches} batches (avg {average_size:.1f} comments), '
+                f'padding waste {self.total_padding_waste:.1%}, '
+                f'{texts_per_sec:,.1f} comments/s, {self.tokens_per_sec:,.0f} tokens/s')
@@ -0,0 +1,102 @@
+import argparse
+import hashlib
+import json
+import time
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+from tqdm import tqdm
+
+from core import load_model
+from core.token_batching import MAX_LENGTH
+from db import crud_utils, database
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+BATCH_SIZE = 10_000
+
+
+def tokenizer_key(tokenizer) -> str:
+    """Name under which comment_tokens keeps this tokenizer's output.
+
+    A hash of what decides the token ids (vocabulary, normalizer, pre-tokenizer, special tokens) and
+    of the truncation length, so checkpoints fine-tuned from one base model (e.g. the lvbert Ekman and
+    go-emotions models) share stored tokens, and a changed tokenizer never reads stale ones.
+    """
+    if tokenizer.is_fast:
+        state = json.loads(tokenizer.backend_tokenizer.to_str())
+        # Truncation and padding are call-time settings the tokenizer remembers from its last call
+        state.pop('truncation', None)
+        state.pop('padding', None)
+    else:
+        state = {'class': type(tokenizer).__name__, 'vocab': sorted(tokenizer.get_vocab().items()),
+                 'lowercase': getattr(tokenizer, 'do_lower_case', None)}
+    digest = hashlib.md5(json.dumps(state, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f'{digest[:16]}:{MAX_LENGTH}'
+
+
+def token_dtype(tokenizer) -> np.dtype:
+    return np.dtype('<u2') if len(tokenizer) <= 2 ** 16 else np.dtype('<i4')
+
+
+def tokenize_texts(tokenizer, texts: list) -> list:
+    # Exactly the ids batch_inference.encode_chunk feeds the model
+    return tokenizer(texts, truncation=True, max_length=MAX_LENGTH)['input_ids']
+
+
+def encode_token_ids(ids, dtype: np.dtype) -> bytes:
+    return np.asarray(ids, dtype=dtype).tobytes()
+
+
+def decode_token_ids(data: bytes, dtype: np.dtype) -> np.ndarray:
+    return np.frombuffer(data, dtype=dtype)
+
+
+def store_language_tokens(session, tokenizer, lang: str) -> int:
+    key = tokenizer_key(tokenizer)
+    dtype = token_dtype(tokenizer)
+    total = crud_utils.get_untokenized_comment_count(session, key, lang)
+    stored = 0
+    last_id = 0
+    with tqdm(total=total, desc=f'[{lang}] {key}', unit='comment') as progress:
+        while True:
+            rows = crud_utils.get_untokenized_comments_batch(session, key, lang, last_id, BATCH_SIZE)
+            if not rows:
+                break
+            ids = tokenize_texts(tokenizer, [row.comment_text or '' for row in rows])
+            crud_utils.insert_comment_tokens(session, key, {
+                row.id: encode_token_ids(token_ids, dtype) for row, token_ids in zip(rows, ids)
+            })
+            session.commit()
+            last_id = rows[-1].id
+            stored += len(rows)
+            progress.update(len(rows))
+    return stored
+
+
+def store_comment_tokens(langs=None):
+    """Tokenize every comment not yet stored under the tokenizer of its language's prediction model.
+
+    Optional: predict_comments reads stored tokens where they exist and tokenizes the rest itself.
+    """
+    from core.predict_comments import PREDICTION_MODELS
+
+    session = SessionLocal()
+    try:
+        for lang in langs or PREDICTION_MODELS:
+            tokenizer = load_model.get_tokenizer(PREDICTION_MODELS[lang])
+            stored = store_language_tokens(session, tokenizer, lang)
+            print(f'[{lang}] {stored} comments tokenized')
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Store the token ids of comments so model runs skip tokenization.')
+    parser.add_argument('--lang', choices=['lv', 'ru'], nargs='+', default=None)
+    args = parser.parse_args()
+
+    t_start = time.time()
+    print('Storing comment tokens...')
+    store_comment_tokens(args.lang)
+    print(f'Finished in {time.time() - t_start:.1f}s')
@@ -0,0 +1,103 @@
+import csv
+import gzip
+import hashlib
+import io
+import os
+import resource
+import time
+from itertools import islice
+
+import pandas as pd
+from tqdm import tqdm
+
+READ_CHUNK_LINES = 100_000
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def open_stream(raw, file_path):
+    return gzip.open(raw, 'rb') if file_path.endswith('.gz') else raw
+
+
+def file_content_hash(file_path):
+    """SHA-256 of the (decompressed) file content, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as raw:
+        stream = open_stream(raw, file_path)
+        for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TsvReader:
+    """Single-pass chunked reader for the headerless .txt / .txt.gz TSV dumps.
+
+    Lines are read in blocks of ``chunk_lines`` and each block is parsed into a typed DataFrame,
+    so memory stays bounded by one block. Progress comes from bytes consumed on disk instead of a
+    line pre-count, and ``offset`` is the exact (decompressed) stream position after the last
+    yielded chunk, which can be passed back as ``start_offset`` to resume. A full read from the
+    start also yields ``content_hash``, the same value as ``file_content_hash``, at no extra IO.
+    """
+
+    def __init__(self, file_path, dtypes: dict, chunk_lines=READ_CHUNK_LINES, start_offset=0, desc=None,
+                 progress=True):
+        self.file_path = file_path
+        self.dtypes = dtypes
+        self.chunk_lines = chunk_lines
+        self.start_offset = start_offset
+        self.desc = desc
+        self.progress = progress
+        self.total_bytes = os.path.getsize(file_path)
+        self.offset = start_offset
+        self.bytes_read = 0
+        self.rows = 0
+        self.elapsed = 0.0
+        self.finished = False
+        self._digest = hashlib.sha256() if start_offset == 0 else None
+
+    @property
+    def content_hash(self):
+        if not self.finished or self._digest is None:
+            return None
+        return self._digest.hexdigest()
+
+    @property
+    def mb_per_sec(self):
+        return self.bytes_read / 1024 / 1024 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def _parse_block(self, block: bytes) -> pd.DataFrame:
+        return pd.read_csv(
+            io.BytesIO(block), sep='\t', header=None, names=list(self.dtypes), dtype=self.dtypes,
+            on_bad_lines='skip', quoting=csv.QUOTE_NONE, encoding='utf-8',
+        )
+
+    def __iter__(self):
+        start_time = time.time()
+        with open(self.file_path, 'rb') as raw:
+            stream = open_stream(raw, self.file_path)
+            if self.start_offset:
+                stream.seek(self.start_offset)
+            start_position = raw.tell()
+            with tqdm(total=self.total_bytes, initial=start_position, desc=self.desc, disable=not self.progress,
+                      unit='B', unit_scale=True, unit_divisor=1024) as progress:
+                while True:
+                    lines = list(islice(stream, self.chunk_lines))
+                    if not lines:
+                        break
+                    block = b''.join(lines)
+                    if self._digest is not None:
+                        self._digest.update(block)
+                    chunk = self._parse_block(block)
+
+                    self.offset += len(block)
+                    self.rows += len(chunk)
+                    self.bytes_read = raw.tell() - start_position
+                    self.elapsed = time.time() - start_time
+                    progress.update(raw.tell() - progress.n)
+                    yield chunk
+        self.elapsed = time.time() - start_time
+        self.finished = True
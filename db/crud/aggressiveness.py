@@ -84,8 +84,9 @@ def get_aggressiveness_by_period_precomputed(session: Session, request_date: dat
             SELECT ak.word, ak.language, ak.weight, COUNT(*) AS count
             FROM lemmatized_comments lc
             JOIN comments rc ON rc.id = lc.comment_id
-            CROSS JOIN LATERAL jsonb_array_elements_text(lc.lemmas) AS lemma
-            JOIN aggressive_keywords ak ON ak.word = lemma
+            CROSS JOIN LATERAL unnest(lc.lemma_ids) AS lemma_id
+            JOIN lemma_vocabulary v ON v.id = lemma_id
+            JOIN aggressive_keywords ak ON ak.word = v.token
             WHERE DATE_TRUNC('day', rc.timestamp) = :request_date
               AND rc.comment_lang = :lang
             GROUP BY ak.word, ak.language, ak.weight
@@ -97,8 +98,9 @@ def get_aggressiveness_by_period_precomputed(session: Session, request_date: dat
             SELECT ak.word, ak.language, COUNT(*) AS count
             FROM lemmatized_comments lc
             JOIN comments rc ON rc.id = lc.comment_id
-            CROSS JOIN LATERAL jsonb_array_elements_text(lc.lemmas) AS lemma
-            JOIN aggressive_keywords ak ON ak.word = lemma
+            CROSS JOIN LATERAL unnest(lc.lemma_ids) AS lemma_id
+            JOIN lemma_vocabulary v ON v.id = lemma_id
+            JOIN aggressive_keywords ak ON ak.word = v.token
             WHERE DATE_TRUNC('day', rc.timestamp) = :request_date
               AND rc.comment_lang IN ('lv', 'ru')
             GROUP BY ak.word, ak.language, ak.weight
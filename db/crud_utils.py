@@ -1,5 +1,8 @@
+import datetime
+import io
+
 import pandas as pd
-from sqlalchemy import or_
+from sqlalchemy import Date, Integer, and_, cast, func, null, or_, text
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from . import models
@@ -16,9 +19,161 @@ def bulk_insert_articles(df: pd.DataFrame, db: Session):
     db.commit()
 
 def bulk_insert_comments(df: pd.DataFrame, db: Session):
-    comments_data = df.to_dict(orient='records')
-    db.execute(insert(models.Comment), comments_data)
-    db.commit()
+    # Same natural-key conflict skipping as the COPY loader
+    return copy_insert_comments(df, db)
+
+# Stages that take their work from comment_work_queue, and the languages they process
+PREDICT_STAGE = 'predict'
+LEMMATIZE_STAGE = 'lemmatize'
+WORK_QUEUE_STAGES = (PREDICT_STAGE, LEMMATIZE_STAGE)
+WORK_QUEUE_LANGUAGES = ('lv', 'ru')
+# core.predict_comments only predicts these websites; queueing others would leave their rows queued forever
+PREDICT_WEBSITES = ('delfi',)
+
+# Data-modifying CTE run with every comment insert, so new comments are queued in the same statement
+ENQUEUE_INSERTED_COMMENTS_SQL = (
+    "INSERT INTO comment_work_queue (stage, comment_id, comment_lang, website) "
+    "SELECT stage, inserted.id, inserted.comment_lang, inserted.website "
+    "FROM inserted CROSS JOIN unnest(CAST(:stages AS text[])) AS stage "
+    "WHERE inserted.comment_lang = ANY(CAST(:languages AS text[])) "
+    "AND (stage <> :predict_stage OR inserted.website = ANY(CAST(:predict_websites AS text[])))"
+)
+
+# Deterministic identity of a comment across overlapping dumps (delfi, delfi-new, v3).
+# NULL and '' hash alike; to_char keeps the key independent of the session's DateStyle.
+COMMENT_NATURAL_KEY_SQL = (
+    "md5(concat_ws(chr(31), coalesce(website, ''), coalesce(article_id::text, ''), "
+    "coalesce(to_char(\"timestamp\", 'YYYY-MM-DD HH24:MI:SS.US'), ''), "
+    "coalesce(user_nickname, ''), coalesce(comment_text, '')))::uuid"
+)
+
+def _prepare_copy_frame(df: pd.DataFrame, model) -> pd.DataFrame:
+    table_columns = model.__table__.columns
+    frame = df[[name for name in df.columns if name in table_columns]]
+    # NaN turns integer columns into floats, which COPY would reject as "123.0"
+    for name in frame.columns:
+        if isinstance(table_columns[name].type, Integer) and pd.api.types.is_float_dtype(frame[name]):
+            frame = frame.assign(**{name: frame[name].astype('Int64')})
+    return frame
+
+def _column_list(columns) -> str:
+    return ', '.join(f'"{name}"' for name in columns)
+
+def _csv_column(column: pd.Series) -> list:
+    values = column.astype(str)
+    if not (pd.api.types.is_numeric_dtype(column) or pd.api.types.is_datetime64_any_dtype(column)):
+        # COPY csv reads only an unquoted empty field as NULL, so quoted text (even '' or '\N') stays text
+        values = '"' + values.str.replace('"', '""', regex=False) + '"'
+    return values.mask(column.isna(), '').tolist()
+
+def _copy_frame(db: Session, frame: pd.DataFrame, table_name: str):
+    columns = [_csv_column(frame[name]) for name in frame.columns]
+    buffer = io.StringIO(''.join(','.join(row) + '\n' for row in zip(*columns)))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table_name} ({_column_list(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def _copy_insert_on_conflict(db: Session, frame: pd.DataFrame, table_name: str, conflict_column: str,
+                             computed_columns: dict = None, on_inserted: str = None, params: dict = None) -> int:
+    """COPY into a temp staging table, then INSERT ... SELECT ... ON CONFLICT DO NOTHING into the target.
+
+    on_inserted is an extra statement over the actually inserted rows, available as ``inserted``.
+    """
+    computed_columns = computed_columns or {}
+    staging_table = f'{table_name}_staging'
+    columns = _column_list(frame.columns)
+    # Several chunks may share one transaction, so the staging table is reused and emptied after each
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} ON COMMIT DROP AS "
+        f"SELECT {columns} FROM {table_name} WITH NO DATA"
+    ))
+    _copy_frame(db, frame, staging_table)
+    target_columns = _column_list(list(frame.columns) + list(computed_columns))
+    select_columns = ', '.join([columns] + list(computed_columns.values()))
+    insert_sql = (
+        f"INSERT INTO {table_name} ({target_columns}) "
+        f"SELECT {select_columns} FROM {staging_table} "
+        f"ON CONFLICT ({conflict_column}) DO NOTHING"
+    )
+    if on_inserted:
+        inserted = db.execute(text(
+            f"WITH inserted AS ({insert_sql} RETURNING *), followup AS ({on_inserted}) "
+            f"SELECT count(*) FROM inserted"
+        ), params or {}).scalar()
+    else:
+        inserted = db.execute(text(insert_sql)).rowcount
+    db.execute(text(f"TRUNCATE {staging_table}"))
+    return inserted
+
+def copy_insert_comments(df: pd.DataFrame, db: Session, commit: bool = True) -> int:
+    frame = _prepare_copy_frame(df, models.Comment)
+    inserted = _copy_insert_on_conflict(db, frame, models.Comment.__tablename__, 'natural_key',
+                                        {'natural_key': COMMENT_NATURAL_KEY_SQL},
+                                        ENQUEUE_INSERTED_COMMENTS_SQL,
+                                        {'stages': list(WORK_QUEUE_STAGES), 'languages': list(WORK_QUEUE_LANGUAGES),
+                                         'predict_stage': PREDICT_STAGE, 'predict_websites': list(PREDICT_WEBSITES)})
+    if commit:
+        db.commit()
+    return inserted
+
+def copy_insert_articles(df: pd.DataFrame, db: Session, commit: bool = True) -> int:
+    frame = _prepare_copy_frame(df, models.Article)
+    inserted = _copy_insert_on_conflict(db, frame, models.Article.__tablename__, 'article_id')
+    if commit:
+        db.commit()
+    return inserted
+
+def get_vocabulary_ids(db: Session, tokens) -> dict:
+    """token -> lemma_vocabulary id, numbering the tokens not seen before; does not commit db.
+
+    New tokens are committed right away in their own short transaction, in sorted order, so concurrent
+    lemmatization workers neither hold vocabulary locks for a whole batch nor take them in opposite orders.
+    """
+    tokens = sorted(set(tokens))
+    if not tokens:
+        return {}
+    with db.get_bind().begin() as connection:
+        # Only missing tokens are inserted, so conflicts (which still use up sequence values) stay rare
+        connection.execute(text(
+            "INSERT INTO lemma_vocabulary (token) "
+            "SELECT candidate.token FROM unnest(CAST(:tokens AS text[])) WITH ORDINALITY AS candidate(token, position) "
+            "WHERE NOT EXISTS (SELECT 1 FROM lemma_vocabulary v WHERE v.token = candidate.token) "
+            "ORDER BY candidate.position "
+            "ON CONFLICT (token) DO NOTHING"
+        ), {'tokens': tokens})
+    return find_vocabulary_ids(db, tokens)
+
+def find_vocabulary_ids(db: Session, tokens) -> dict:
+    """token -> lemma_vocabulary id for the given tokens that are in the vocabulary."""
+    tokens = list(set(tokens))
+    if not tokens:
+        return {}
+    rows = db.execute(text("SELECT token, id FROM lemma_vocabulary WHERE token = ANY(:tokens)"), {'tokens': tokens})
+    return dict(rows.all())
+
+def get_vocabulary_tokens(db: Session, ids) -> dict:
+    """lemma_vocabulary id -> token for the given ids."""
+    ids = [int(token_id) for token_id in set(ids)]
+    if not ids:
+        return {}
+    return dict(db.execute(text("SELECT id, token FROM lemma_vocabulary WHERE id = ANY(:ids)"), {'ids': ids}).all())
+
+def _copy_int_array(values: list) -> str:
+    return '{' + ','.join(map(str, values)) + '}'
+
+def copy_insert_lemmatized_comments(rows: list, db: Session) -> int:
+    """COPY lemmatize_batch results into lemmatized_comments as vocabulary id arrays, skipping comments already
+    there; does not commit."""
+    vocabulary = get_vocabulary_ids(db, [token for row in rows for token in row['lemmas'] + row['words']])
+    frame = pd.DataFrame({
+        'comment_id': [row['comment_id'] for row in rows],
+        'lemma_ids': [_copy_int_array([vocabulary[lemma] for lemma in row['lemmas']]) for row in rows],
+        'lemma_count': [row['lemma_count'] for row in rows],
+        'word_ids': [_copy_int_array([vocabulary[word] for word in row['words']]) for row in rows],
+    })
+    return _copy_insert_on_conflict(db, frame, models.LemmatizedComment.__tablename__, 'comment_id')
 
 def get_article(db: Session, article_id: int):
     return db.query(models.Article).filter(models.Article.article_id == article_id).first()
@@ -29,6 +184,52 @@ def check_article_exists(db: Session, article_id: int):
 def get_comment_count(db: Session):
     return db.query(models.Comment).count()
 
+def get_max_comment_id(db: Session) -> int:
+    return db.query(func.coalesce(func.max(models.Comment.id), 0)).scalar()
+
+def get_comment_dates(db: Session, min_id: int, max_id: int) -> list:
+    return [row[0] for row in db.query(cast(models.Comment.timestamp, Date)).filter(
+        models.Comment.id > min_id,
+        models.Comment.id <= max_id,
+        models.Comment.timestamp.isnot(None),
+    ).distinct().all()]
+
+def open_ingest_range(db: Session, min_id: int) -> int:
+    """Record that comments after min_id are being imported, before importing them."""
+    pending = models.IngestPendingRange(min_id=min_id)
+    db.add(pending)
+    db.commit()
+    return pending.id
+
+def close_ingest_range(db: Session, range_id: int, max_id: int):
+    """Set the range's last comment id once its files are imported; drop it if nothing was imported."""
+    query = db.query(models.IngestPendingRange).filter(models.IngestPendingRange.id == range_id)
+    pending = query.one()
+    if max_id > pending.min_id:
+        pending.max_id = max_id
+    else:
+        query.delete(synchronize_session=False)
+    db.commit()
+
+def get_ingest_ranges(db: Session) -> list:
+    """Pending ranges, oldest first. A range still open from an interrupted import is closed at the current
+    maximum comment id, since its comments were committed file by file."""
+    max_id = get_max_comment_id(db)
+    for pending in db.query(models.IngestPendingRange).filter(models.IngestPendingRange.max_id.is_(None)).all():
+        close_ingest_range(db, pending.id, max_id)
+    return db.query(models.IngestPendingRange.id, models.IngestPendingRange.min_id,
+                    models.IngestPendingRange.max_id).order_by(models.IngestPendingRange.id).all()
+
+def delete_ingest_range(db: Session, range_id: int):
+    db.query(models.IngestPendingRange).filter(models.IngestPendingRange.id == range_id).delete()
+    db.commit()
+
+def get_active_connection_count(db: Session) -> int:
+    return db.execute(text(
+        "SELECT count(*) FROM pg_stat_activity "
+        "WHERE datname = current_database() AND state <> 'idle' AND pid <> pg_backend_pid()"
+    )).scalar()
+
 def get_comment(db: Session, comment_id: int):
     return db.query(models.Comment).filter(models.Comment.id == comment_id).first()
 
@@ -53,39 +254,185 @@ def get_unprecited_comment_count(db: Session):
         article_exists_subquery
     ).count())
 
-def get_unpredicted_comment_count_by_lang(db: Session, lang: str, website: str = None):
-    article_exists_subquery = db.query(models.Article.article_id).filter(
-        models.Article.article_id == models.Comment.article_id
-    ).exists()
-
-    query = db.query(models.Comment).filter(
-        models.Comment.comment_lang == lang,
-        ~models.Comment.predicted_comments.any(),
-        article_exists_subquery
+def _work_queue_query(db: Session, entities, stage: str, lang: str, last_id: int, website: str = None,
+                      max_id: int = None):
+    # An index range scan over the stage's queue rows instead of an anti-join against its output table
+    queue = models.CommentWorkQueue
+    query = db.query(*entities).select_from(queue).join(models.Comment, models.Comment.id == queue.comment_id).filter(
+        queue.stage == stage,
+        queue.comment_lang == lang,
+        queue.comment_id > last_id,
     )
 
     if website:
-        query = query.filter(models.Comment.website == website)
+        query = query.filter(queue.website == website)
+    if max_id is not None:
+        query = query.filter(queue.comment_id <= max_id)
+    return query
+
+def get_queued_comment_count(db: Session, stage: str, lang: str, min_id: int = 0, max_id: int = None):
+    return _work_queue_query(db, [func.count()], stage, lang, min_id, max_id=max_id).scalar()
+
+def get_queued_comments_batch(db: Session, stage: str, lang: str, last_id: int, batch_size: int, max_id: int = None):
+    query = _work_queue_query(db, [models.Comment], stage, lang, last_id, max_id=max_id)
+    return query.order_by(models.CommentWorkQueue.comment_id).limit(batch_size).all()
 
-    return query.count()
+def get_queued_comment_shards(db: Session, stage: str, lang: str, shard_size: int, min_id: int = 0, max_id: int = None):
+    """(shard, queued count) for every non-empty id range [shard * shard_size + 1, (shard + 1) * shard_size]."""
+    shard = ((models.CommentWorkQueue.comment_id - 1) // shard_size).label('shard')
+    query = _work_queue_query(db, [shard, func.count()], stage, lang, min_id, max_id=max_id)
+    return query.group_by(shard).order_by(shard).all()
+
+def dequeue_comments(db: Session, stage: str, comment_ids: list):
+    """Mark comments as processed by stage; does not commit, so it lands with the stage's output."""
+    db.execute(
+        text("DELETE FROM comment_work_queue WHERE stage = :stage AND comment_id = ANY(:ids)"),
+        {'stage': stage, 'ids': list(comment_ids)},
+    )
 
-def get_unpredicted_comments_batch_by_lang(db: Session, lang: str, last_id: int, batch_size: int, website: str = None):
+def _unpredicted_comments_query(db: Session, entities, lang: str, last_id: int, website: str = None,
+                                max_id: int = None):
+    # Comments whose article is not imported yet stay queued until it is
     article_exists_subquery = db.query(models.Article.article_id).filter(
         models.Article.article_id == models.Comment.article_id
     ).exists()
+    return _work_queue_query(db, entities, PREDICT_STAGE, lang, last_id, website, max_id).filter(
+        article_exists_subquery
+    )
+
+def get_unpredicted_comment_count_by_lang(db: Session, lang: str, website: str = None,
+                                          min_id: int = 0, max_id: int = None):
+    return _unpredicted_comments_query(db, [func.count()], lang, min_id, website, max_id).scalar()
+
+def get_unpredicted_comments_batch_by_lang(db: Session, lang: str, last_id: int, batch_size: int, website: str = None,
+                                           max_id: int = None):
+    query = _unpredicted_comments_query(db, [models.Comment], lang, last_id, website, max_id)
+    return query.order_by(models.CommentWorkQueue.comment_id).limit(batch_size).all()
+
+def get_unpredicted_comment_rows_by_lang(db: Session, lang: str, last_id: int, batch_size: int, website: str = None,
+                                         max_id: int = None, tokenizer: str = None):
+    """Like get_unpredicted_comments_batch_by_lang, but as plain (id, timestamp, article_id, comment_text, website,
+    token_ids) rows instead of ORM objects, which are cheaper to load and safe to hand to other threads.
+
+    token_ids holds the comment's stored tokens under the given tokenizer key, and is None without one
+    or for comments core.token_store has not tokenized yet.
+    """
+    tokens = models.CommentTokens
+    columns = [models.Comment.id, models.Comment.timestamp, models.Comment.article_id,
+               models.Comment.comment_text, models.Comment.website,
+               (tokens.token_ids if tokenizer else null()).label('token_ids')]
+    query = _unpredicted_comments_query(db, columns, lang, last_id, website, max_id)
+    if tokenizer:
+        query = query.outerjoin(tokens, and_(tokens.tokenizer == tokenizer, tokens.comment_id == models.Comment.id))
+    return query.order_by(models.CommentWorkQueue.comment_id).limit(batch_size).all()
+
+def get_unpredicted_comment_shards_by_lang(db: Session, lang: str, shard_size: int, website: str = None,
+                                           min_id: int = 0, max_id: int = None):
+    """(shard, unpredicted count) for every non-empty id range [shard * shard_size + 1, (shard + 1) * shard_size]."""
+    shard = ((models.CommentWorkQueue.comment_id - 1) // shard_size).label('shard')
+    query = _unpredicted_comments_query(db, [shard, func.count()], lang, min_id, website, max_id)
+    return query.group_by(shard).order_by(shard).all()
+
+def get_cached_predictions(db: Session, model_id: str, text_hashes: list) -> dict:
+    rows = db.query(models.PredictionCache.text_hash, models.PredictionCache.prediction_json).filter(
+        models.PredictionCache.model_id == model_id,
+        models.PredictionCache.text_hash.in_(text_hashes),
+    ).all()
+    return {row.text_hash: row.prediction_json for row in rows}
+
+def insert_cached_predictions(db: Session, model_id: str, predictions: dict):
+    """Add text_hash -> prediction_json entries; does not commit.
+
+    Sharded workers often predict the same short texts, so rows go in text_hash order: concurrent writers
+    then lock the cache keys in the same order instead of deadlocking.
+    """
+    if not predictions:
+        return
+    db.execute(
+        insert(models.PredictionCache).on_conflict_do_nothing(index_elements=['model_id', 'text_hash']),
+        [{'model_id': model_id, 'text_hash': text_hash, 'prediction_json': predictions[text_hash]}
+         for text_hash in sorted(predictions)],
+    )
+
+def get_prediction_label_order(db: Session, name: str, labels: list) -> list:
+    """Label order of the *_scores arrays of a label set, recording labels as that order if the set is new."""
+    db.execute(
+        insert(models.PredictionLabelSet).on_conflict_do_nothing(index_elements=['name']),
+        {'name': name, 'labels': list(labels)},
+    )
+    stored = db.query(models.PredictionLabelSet.labels).filter(models.PredictionLabelSet.name == name).scalar()
+    if sorted(stored) != sorted(labels):
+        raise ValueError(f"Model labels {sorted(labels)} do not match the stored '{name}' label set {stored}")
+    return stored
 
-    query = db.query(models.Comment).filter(
+def _untokenized_comments_query(db: Session, entities, tokenizer: str, lang: str, last_id: int):
+    tokenized = db.query(models.CommentTokens.comment_id).filter(
+        models.CommentTokens.tokenizer == tokenizer,
+        models.CommentTokens.comment_id == models.Comment.id,
+    ).exists()
+    return db.query(*entities).filter(
         models.Comment.comment_lang == lang,
         models.Comment.id > last_id,
-        ~models.Comment.predicted_comments.any(),
-        article_exists_subquery
+        ~tokenized,
     )
 
-    if website:
-        query = query.filter(models.Comment.website == website)
+def get_untokenized_comment_count(db: Session, tokenizer: str, lang: str):
+    return _untokenized_comments_query(db, [func.count()], tokenizer, lang, 0).scalar()
 
+def get_untokenized_comments_batch(db: Session, tokenizer: str, lang: str, last_id: int, batch_size: int):
+    """(id, comment_text) rows of comments without stored tokens under the tokenizer key, in id order."""
+    query = _untokenized_comments_query(db, [models.Comment.id, models.Comment.comment_text], tokenizer, lang, last_id)
     return query.order_by(models.Comment.id).limit(batch_size).all()
 
+def insert_comment_tokens(db: Session, tokenizer: str, token_ids: dict):
+    """Store comment_id -> encoded token ids under the tokenizer key; does not commit."""
+    if not token_ids:
+        return
+    db.execute(
+        insert(models.CommentTokens).on_conflict_do_nothing(index_elements=['tokenizer', 'comment_id']),
+        [{'tokenizer': tokenizer, 'comment_id': comment_id, 'token_ids': data}
+         for comment_id, data in token_ids.items()],
+    )
+
+def rebuild_lemma_memo(db: Session, lang: str, max_comment_id: int, min_occurrences: int, min_share: float) -> int:
+    """Replace the language's lemma_memo with the forms of lemmatized comments up to max_comment_id whose most
+    frequent lemma has at least min_share of min_occurrences or more occurrences; does not commit."""
+    db.execute(text("DELETE FROM lemma_memo WHERE language = :lang"), {'lang': lang})
+    # ROWS FROM zips word_ids[i] with lemma_ids[i]
+    return db.execute(text(
+        "INSERT INTO lemma_memo (language, word_form, lemma, occurrences, lemma_share) "
+        "SELECT :lang, word.token, lemma.token, total, share FROM ("
+        "  SELECT word_id, lemma_id, sum(n) OVER (PARTITION BY word_id) AS total, "
+        "    n / sum(n) OVER (PARTITION BY word_id) AS share, "
+        "    row_number() OVER (PARTITION BY word_id ORDER BY n DESC, lemma_id) AS rank "
+        "  FROM ("
+        "    SELECT pair.word_id, pair.lemma_id, count(*)::real AS n "
+        "    FROM lemmatized_comments lc JOIN comments c ON c.id = lc.comment_id "
+        "    CROSS JOIN LATERAL ROWS FROM (unnest(lc.word_ids), unnest(lc.lemma_ids)) AS pair(word_id, lemma_id) "
+        "    WHERE c.comment_lang = :lang AND lc.comment_id <= :max_id "
+        "      AND pair.word_id IS NOT NULL AND pair.lemma_id IS NOT NULL "
+        "    GROUP BY 1, 2"
+        "  ) counts"
+        ") ranked "
+        "JOIN lemma_vocabulary word ON word.id = ranked.word_id "
+        "JOIN lemma_vocabulary lemma ON lemma.id = ranked.lemma_id "
+        "WHERE rank = 1 AND total >= :min_occurrences AND share >= :min_share"
+    ), {'lang': lang, 'max_id': max_comment_id, 'min_occurrences': min_occurrences, 'min_share': min_share}).rowcount
+
+def get_lemma_memo(db: Session, lang: str) -> dict:
+    rows = db.query(models.LemmaMemo.word_form, models.LemmaMemo.lemma).filter(models.LemmaMemo.language == lang).all()
+    return dict(rows)
+
+def get_recent_lemmatized_comments(db: Session, lang: str, limit: int):
+    """(comment_id, comment_text, lemma_ids, word_ids) of the most recently lemmatized comments of a language."""
+    return db.query(
+        models.LemmatizedComment.comment_id, models.Comment.comment_text,
+        models.LemmatizedComment.lemma_ids, models.LemmatizedComment.word_ids,
+    ).join(models.Comment, models.Comment.id == models.LemmatizedComment.comment_id).filter(
+        models.Comment.comment_lang == lang,
+        models.LemmatizedComment.word_ids.isnot(None),
+    ).order_by(models.LemmatizedComment.comment_id.desc()).limit(limit).all()
+
 def get_raw_unpredicted_comments_by_batch(db: Session, last_id: int = 0, batch_size: int = 100):
     article_exists_subquery = db.query(models.Article.article_id).filter(
         models.Article.article_id == models.Comment.article_id
@@ -104,8 +451,10 @@ def create_comment(db: Session, comment: models.Comment):
     db.refresh(comment)
     return comment
 
-def create_log_comments_import(db: Session, file_name: str, status: str, notes: str, website: str):
-    log = models.LogCommentsImport(file_name=file_name, status=status, notes=notes, website=website)
+def create_log_comments_import(db: Session, file_name: str, status: str, notes: str, website: str,
+                               mb_per_sec: float = None, peak_rss_mb: float = None):
+    log = models.LogCommentsImport(file_name=file_name, status=status, notes=notes, website=website,
+                                   mb_per_sec=mb_per_sec, peak_rss_mb=peak_rss_mb)
     db.add(log)
     db.commit()
     db.refresh(log)
@@ -114,8 +463,10 @@ def create_log_comments_import(db: Session, file_name: str, status: str, notes:
 def check_log_comments_import_exists(db: Session, file_name: str):
     return db.query(models.LogCommentsImport).filter(models.LogCommentsImport.file_name == file_name).first() is not None
 
-def create_log_articles_import(db: Session, file_name: str, status: str, notes: str, website: str):
-    log = models.LogArticlesImport(file_name=file_name, status=status, notes=notes, website=website)
+def create_log_articles_import(db: Session, file_name: str, status: str, notes: str, website: str,
+                               mb_per_sec: float = None, peak_rss_mb: float = None):
+    log = models.LogArticlesImport(file_name=file_name, status=status, notes=notes, website=website,
+                                   mb_per_sec=mb_per_sec, peak_rss_mb=peak_rss_mb)
     db.add(log)
     db.commit()
     db.refresh(log)
@@ -135,3 +486,45 @@ def get_processed_comment_files(db: Session, website: str = None) -> list[str]:
     if website:
         query = query.where(models.LogCommentsImport.website == website)
     return [log.file_name for log in query.all()]
+
+def create_import_checkpoint(db: Session, tracking_table: str, file_name: str, chunk_index: int, chunk_size: int,
+                             row_count: int, byte_offset: int):
+    # Commits together with any uncommitted chunk insert on the same session
+    checkpoint = models.ImportCheckpoint(
+        tracking_table=tracking_table, file_name=file_name,
+        chunk_index=chunk_index, chunk_size=chunk_size, row_count=row_count, byte_offset=byte_offset,
+    )
+    db.add(checkpoint)
+    db.commit()
+    return checkpoint
+
+def get_import_checkpoints(db: Session, tracking_table: str, file_name: str) -> list[models.ImportCheckpoint]:
+    return (db.query(models.ImportCheckpoint)
+            .filter(models.ImportCheckpoint.tracking_table == tracking_table,
+                    models.ImportCheckpoint.file_name == file_name)
+            .order_by(models.ImportCheckpoint.chunk_index)
+            .all())
+
+def delete_import_checkpoints(db: Session, tracking_table: str, file_name: str):
+    db.query(models.ImportCheckpoint).filter(
+        models.ImportCheckpoint.tracking_table == tracking_table,
+        models.ImportCheckpoint.file_name == file_name,
+    ).delete()
+
+def get_import_manifest(db: Session) -> dict:
+    # Plain rows rather than ORM objects, so entries stay readable after commits and session.close()
+    rows = db.query(
+        models.ImportManifest.path,
+        models.ImportManifest.size,
+        models.ImportManifest.mtime,
+        models.ImportManifest.content_hash,
+    ).all()
+    return {row.path: row for row in rows}
+
+def record_import_manifest(db: Session, path: str, website: str, size: int, mtime: float, content_hash: str):
+    # Not committed here, so the entry lands in the same commit as the file's data and log row
+    values = dict(path=path, website=website, size=size, mtime=mtime, content_hash=content_hash,
+                  imported_at=datetime.datetime.now())
+    db.execute(insert(models.ImportManifest).values(**values).on_conflict_do_update(
+        index_elements=['path'], set_={key: value for key, value in values.items() if key != 'path'}
+    ))
@@ -0,0 +1,19 @@
+BEGIN;
+
+-- ============================================================
+-- IMPORT LOG METRICS
+-- (written by the streaming TSV reader in core/data_import.py)
+-- ============================================================
+ALTER TABLE log_articles_imports ADD COLUMN mb_per_sec DOUBLE PRECISION;
+ALTER TABLE log_articles_imports ADD COLUMN peak_rss_mb DOUBLE PRECISION;
+ALTER TABLE log_comments_imports ADD COLUMN mb_per_sec DOUBLE PRECISION;
+ALTER TABLE log_comments_imports ADD COLUMN peak_rss_mb DOUBLE PRECISION;
+
+-- ============================================================
+-- BYTE-OFFSET RESUME FOR CHUNK CHECKPOINTS
+-- (import_checkpoints is created by init_db.py; older checkpoints
+--  have no offset and cannot be resumed)
+-- ============================================================
+ALTER TABLE import_checkpoints ADD COLUMN IF NOT EXISTS byte_offset BIGINT;
+
+COMMIT;
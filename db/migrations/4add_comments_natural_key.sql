@@ -0,0 +1,13 @@
+BEGIN;
+
+-- ============================================================
+-- NATURAL KEY FOR COMMENTS
+-- Filled for new rows by crud_utils.copy_insert_comments.
+-- Existing rows are backfilled and de-duplicated by
+--   python3 -m core.deduplicate_comments
+-- which also creates the unique index uq_comments_natural_key
+-- that the importer's ON CONFLICT (natural_key) relies on.
+-- ============================================================
+ALTER TABLE comments ADD COLUMN natural_key UUID;
+
+COMMIT;
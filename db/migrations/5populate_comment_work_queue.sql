@@ -0,0 +1,33 @@
+BEGIN;
+
+-- ============================================================
+-- COMMENT WORK QUEUE
+-- Run after init_db.py has created comment_work_queue.
+-- New comments are queued by crud_utils.copy_insert_comments;
+-- this queues the existing lv/ru comments that have not been
+-- predicted or lemmatized yet. Only delfi comments are predicted
+-- (crud_utils.PREDICT_WEBSITES), so only they are queued for it;
+-- re-running it also drops other websites' predict rows queued
+-- before that.
+-- ============================================================
+DELETE FROM comment_work_queue
+WHERE stage = 'predict' AND website IS DISTINCT FROM 'delfi';
+
+INSERT INTO comment_work_queue (stage, comment_id, comment_lang, website)
+SELECT 'predict', c.id, c.comment_lang, c.website
+FROM comments c
+WHERE c.comment_lang IN ('lv', 'ru')
+  AND c.website = 'delfi'
+  AND NOT EXISTS (SELECT 1 FROM predicted_comments pc WHERE pc.comment_id = c.id)
+ON CONFLICT DO NOTHING;
+
+INSERT INTO comment_work_queue (stage, comment_id, comment_lang, website)
+SELECT 'lemmatize', c.id, c.comment_lang, c.website
+FROM comments c
+WHERE c.comment_lang IN ('lv', 'ru')
+  AND NOT EXISTS (SELECT 1 FROM lemmatized_comments lc WHERE lc.comment_id = c.id)
+ON CONFLICT DO NOTHING;
+
+COMMIT;
+
+ANALYZE comment_work_queue;
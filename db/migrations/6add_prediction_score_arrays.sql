@@ -0,0 +1,13 @@
+BEGIN;
+
+-- ============================================================
+-- PREDICTION SCORE ARRAYS
+-- Per-label probabilities as real[] in the label order kept in
+-- prediction_label_sets (created by init_db.py). New predictions
+-- only fill these; existing rows are converted from the JSON by
+--   python3 -m core.backfill_prediction_scores [--clear-json]
+-- ============================================================
+ALTER TABLE predicted_comments ADD COLUMN normal_scores real[];
+ALTER TABLE predicted_comments ADD COLUMN ekman_scores real[];
+
+COMMIT;
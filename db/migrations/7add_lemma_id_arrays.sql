@@ -0,0 +1,13 @@
+BEGIN;
+
+-- ============================================================
+-- LEMMA ID ARRAYS
+-- Lemmas and word forms as int4[] of lemma_vocabulary ids
+-- (created by init_db.py) instead of JSONB string arrays. New
+-- lemmatizations only fill these; existing rows are converted by
+--   python3 -m core.backfill_lemma_ids [--clear-json]
+-- ============================================================
+ALTER TABLE lemmatized_comments ADD COLUMN lemma_ids integer[];
+ALTER TABLE lemmatized_comments ADD COLUMN word_ids integer[];
+
+COMMIT;
@@ -1,7 +1,7 @@
 import datetime
-from sqlalchemy import Column, Index, Integer, String, ForeignKey, TIMESTAMP, Float, Boolean
+from sqlalchemy import BigInteger, Column, Index, Integer, LargeBinary, String, ForeignKey, TIMESTAMP, Float, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, REAL, UUID
 
 from .base import Base
 
@@ -9,6 +9,7 @@ class Comment(Base):
     __tablename__ = "comments"
     __table_args__ = (
         Index('idx_comments_lang_website_id', 'comment_lang', 'website', 'id'),
+        Index('uq_comments_natural_key', 'natural_key', unique=True),
     )
 
     id = Column(Integer, primary_key=True)
@@ -20,6 +21,7 @@ class Comment(Base):
     comment_text = Column(String)
     comment_lang = Column(String, index=True)
     website = Column(String, index=True)
+    natural_key = Column(UUID(as_uuid=False))  # md5 of (website, article_id, timestamp, user_nickname, comment_text), see crud_utils.COMMENT_NATURAL_KEY_SQL
 
     predicted_comments = relationship("PredictedComment", back_populates="comment")
 
@@ -55,6 +57,9 @@ class PredictedComment(Base):
     ekman_prediction_json = Column(JSONB)
     ekman_prediction_emotion = Column(String, index=True)
     ekman_prediction_score = Column(Float)
+    # Per-label probabilities in the order of the 'normal'/'ekman' rows of prediction_label_sets
+    normal_scores = Column(ARRAY(REAL))
+    ekman_scores = Column(ARRAY(REAL))
 
     comment = relationship("Comment", back_populates="predicted_comments")
     article = relationship("Article", back_populates="predicted_comments")
@@ -68,6 +73,8 @@ class LogArticlesImport(Base):
     status = Column(String, index=True)
     notes = Column(String)
     website = Column(String)
+    mb_per_sec = Column(Float)
+    peak_rss_mb = Column(Float)
 
 class LogCommentsImport(Base):
     __tablename__ = "log_comments_imports"
@@ -78,6 +85,86 @@ class LogCommentsImport(Base):
     status = Column(String, index=True)
     notes = Column(String)
     website = Column(String)
+    mb_per_sec = Column(Float)
+    peak_rss_mb = Column(Float)
+
+class ImportManifest(Base):
+    __tablename__ = "import_manifest"
+
+    id = Column(Integer, primary_key=True)
+    path = Column(String, unique=True, index=True)  # relative to the data directory
+    website = Column(String, index=True)
+    size = Column(BigInteger)
+    mtime = Column(Float)
+    content_hash = Column(String)  # sha256 of the decompressed content
+    imported_at = Column(TIMESTAMP, default=datetime.datetime.now)
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+    __table_args__ = (
+        UniqueConstraint('tracking_table', 'file_name', 'chunk_index', name='uq_import_checkpoints_file_chunk'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tracking_table = Column(String)  # log table the finished file is recorded in
+    file_name = Column(String, index=True)
+    chunk_index = Column(Integer)
+    chunk_size = Column(Integer)
+    row_count = Column(Integer)
+    byte_offset = Column(BigInteger)  # stream position right after this chunk; resume point for the next run
+    committed_at = Column(TIMESTAMP, default=datetime.datetime.now)
+
+class IngestPendingRange(Base):
+    # Comment id ranges imported by core.ingest_daemon whose downstream work has not finished, so a restarted
+    # daemon still runs it; max_id stays NULL while the range's files are being imported
+    __tablename__ = "ingest_pending_ranges"
+
+    id = Column(Integer, primary_key=True)
+    min_id = Column(Integer)  # exclusive
+    max_id = Column(Integer)  # inclusive
+    created_at = Column(TIMESTAMP, default=datetime.datetime.now)
+
+class PredictionCache(Base):
+    __tablename__ = "prediction_cache"
+    __table_args__ = (
+        UniqueConstraint('model_id', 'text_hash', name='uq_prediction_cache_model_text'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    model_id = Column(String)  # model name plus precision, e.g. lvbert-lv-emotions-ekman:fp32
+    text_hash = Column(UUID(as_uuid=False))  # md5 of the whitespace-normalized comment text
+    prediction_json = Column(JSONB)
+    created_at = Column(TIMESTAMP, default=datetime.datetime.now)
+
+class PredictionLabelSet(Base):
+    # Label order of the predicted_comments *_scores arrays, fixed by the first run that writes the set
+    __tablename__ = "prediction_label_sets"
+
+    name = Column(String, primary_key=True)  # 'ekman' or 'normal' (go-emotions)
+    labels = Column(ARRAY(String))
+
+class CommentWorkQueue(Base):
+    # One row per comment a stage ('predict', 'lemmatize') has yet to process. Rows are added when the
+    # comment is imported and removed in the transaction that stores the stage's output.
+    __tablename__ = "comment_work_queue"
+    __table_args__ = (
+        Index('idx_comment_work_queue_stage_lang_id', 'stage', 'comment_lang', 'comment_id'),
+        Index('idx_comment_work_queue_stage_lang_website_id', 'stage', 'comment_lang', 'website', 'comment_id'),
+    )
+
+    stage = Column(String, primary_key=True)
+    comment_id = Column(Integer, ForeignKey('comments.id'), primary_key=True)
+    comment_lang = Column(String)
+    website = Column(String)
+
+class CommentTokens(Base):
+    # Token ids of a comment's text under one tokenizer, written by core.token_store so model runs skip
+    # tokenization. token_ids is a little-endian uint16 array (int32 for vocabularies over 65,536 entries).
+    __tablename__ = "comment_tokens"
+
+    tokenizer = Column(String, primary_key=True)  # core.token_store.tokenizer_key
+    comment_id = Column(Integer, ForeignKey('comments.id'), primary_key=True)
+    token_ids = Column(LargeBinary)
 
 class EmotionKeywordsByDay(Base):
     __tablename__ = "emotion_keywords_by_day"
@@ -118,9 +205,31 @@ class LemmatizedComment(Base):
 
     id = Column(Integer, primary_key=True)
     comment_id = Column(Integer, ForeignKey('comments.id'), unique=True, index=True)
-    lemmas = Column(JSONB)
+    lemmas = Column(JSONB)  # legacy, see lemma_ids
     lemma_count = Column(Integer)
-    words = Column(JSONB)  # original word forms, parallel to lemmas: words[i] is the surface form of lemmas[i]
+    words = Column(JSONB)  # legacy, see word_ids
+    # lemma_vocabulary ids of the lemmas and of their original word forms, parallel: word_ids[i] is the
+    # surface form of lemma_ids[i]
+    lemma_ids = Column(ARRAY(Integer))
+    word_ids = Column(ARRAY(Integer))
+
+class LemmaVocabulary(Base):
+    # Every lemma and lowercased word form of lemmatized_comments, numbered once
+    __tablename__ = "lemma_vocabulary"
+
+    id = Column(Integer, primary_key=True)
+    token = Column(String, unique=True)
+
+class LemmaMemo(Base):
+    # Word forms that Stanza (almost) always lemmatizes the same way, built by core.lemma_memo from
+    # lemmatized_comments; comments made up only of these forms skip Stanza
+    __tablename__ = "lemma_memo"
+
+    language = Column(String, primary_key=True)
+    word_form = Column(String, primary_key=True)  # lowercased, as in lemmatized_comments.word_ids
+    lemma = Column(String)
+    occurrences = Column(Integer)
+    lemma_share = Column(REAL)  # share of the form's occurrences lemmatized as lemma
 
 class AggressivenessByDay(Base):
     __tablename__ = "aggressiveness_by_day"
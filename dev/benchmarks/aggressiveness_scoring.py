@@ -0,0 +1,101 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.calculate_aggressiveness_by_day import WEBSITES, aggregate_month, score_comments
+
+
+def generate_month(comments: int, vocabulary_size: int, keywords: int, seed: int = 42):
+    """A month of lemmatized comments as lemma id arrays, with Zipf-distributed lemmas and lognormal lengths,
+    and the weights of keywords random vocabulary ids."""
+    rng = np.random.default_rng(seed)
+    lengths = np.minimum(rng.lognormal(2.5, 1.0, comments).astype(np.int64) + 1, 400)
+    lemma_ids = (rng.zipf(1.3, int(lengths.sum())) - 1) % vocabulary_size
+    start = datetime.date(2024, 1, 1)
+    df = pd.DataFrame({
+        'lemma_ids': [chunk.tolist() for chunk in np.split(lemma_ids, np.cumsum(lengths)[:-1])],
+        'lemma_count': lengths,
+        'comment_date': [start + datetime.timedelta(days=int(day)) for day in rng.integers(0, 31, comments)],
+        'website': rng.choice(WEBSITES, comments),
+    })
+    weights = np.full(vocabulary_size, np.nan)
+    weights[rng.choice(vocabulary_size, keywords, replace=False)] = rng.uniform(0.1, 3.0, keywords)
+    return df, weights
+
+
+def score_lemmas(aggressive_weights, lemma_ids):
+    """The per-comment scorer before vectorized scoring."""
+    if not lemma_ids:
+        return 0, 0.0
+    count = 0
+    wsum = 0.0
+    for lemma_id in lemma_ids:
+        w = aggressive_weights.get(lemma_id)
+        if w is not None:
+            count += 1
+            wsum += w
+    return count, wsum
+
+
+def rowwise_records(df, weights):
+    """calculate_aggressiveness before vectorized scoring: a pd.Series per comment from df['lemma_ids'].apply."""
+    aggressive_weights = {int(vocabulary_id): float(weights[vocabulary_id])
+                          for vocabulary_id in np.flatnonzero(~np.isnan(weights))}
+    df = df.copy()
+    t0 = time.perf_counter()
+    scorer = lambda lemma_ids: pd.Series(score_lemmas(aggressive_weights, lemma_ids))
+    df[['agg_count', 'agg_weight']] = df['lemma_ids'].apply(scorer)
+    return aggregate_month(df, 'lv', set()), time.perf_counter() - t0
+
+
+def vectorized_records(df, weights):
+    df = df.copy()
+    t0 = time.perf_counter()
+    df['agg_count'], df['agg_weight'] = score_comments(weights, df['lemma_ids'])
+    return aggregate_month(df, 'lv', set()), time.perf_counter() - t0
+
+
+def totals(records) -> dict:
+    return {
+        (record['date'], record['website']): (record['aggressive_word_count'], record['aggressive_word_weight_sum'])
+        for record in records
+    }
+
+
+def run_benchmark(comments: int, vocabulary_size: int, keywords: int, repeat: int):
+    df, weights = generate_month(comments, vocabulary_size, keywords)
+    print(f'Generated {comments} comments ({df["lemma_count"].sum()} lemmas), {keywords} keywords '
+          f'in a vocabulary of {vocabulary_size}')
+
+    rowwise_times = []
+    vectorized_times = []
+    for _ in range(repeat):
+        expected, seconds = rowwise_records(df, weights)
+        rowwise_times.append(seconds)
+        actual, seconds = vectorized_records(df, weights)
+        vectorized_times.append(seconds)
+
+    expected, actual = totals(expected), totals(actual)
+    mismatches = sum(expected[key] != actual.get(key) for key in expected) + len(actual.keys() - expected.keys())
+    rowwise_best = min(rowwise_times)
+    vectorized_best = min(vectorized_times)
+    print(f'apply(scorer): {rowwise_best:.3f}s ({comments / rowwise_best:,.0f} comments/s)')
+    print(f'vectorized:    {vectorized_best:.3f}s ({comments / vectorized_best:,.0f} comments/s)')
+    print(f'speedup {rowwise_best / vectorized_best:.1f}x; '
+          f'{mismatches} of {len(expected)} (date, website) counts/weight sums differ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare row-wise apply scoring of aggressive lemmas with the vectorized scoring over flat '
+                    'lemma id arrays, on a generated month of comments.')
+    parser.add_argument('--comments', type=int, default=200_000)
+    parser.add_argument('--vocabulary-size', type=int, default=50_000)
+    parser.add_argument('--keywords', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions (best run is reported)')
+    args = parser.parse_args()
+
+    run_benchmark(args.comments, args.vocabulary_size, args.keywords, args.repeat)
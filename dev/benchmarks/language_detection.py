@@ -0,0 +1,72 @@
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from core.language_detection import determine_text_language, determine_text_language_batch
+
+LV_ALPHABET = 'aābcčdeēfgģhiījkķlļmnņoprsštuūvzžAĀBCČDEĒFGĢHIĪJKĶLĻMNŅOPRSŠTUŪVZŽ'
+RU_ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+NEUTRAL = '0123456789 .,!?:;-()"😀👍🔥'
+REGIONS = ['lat', 'rus', 'eng', None]
+
+
+def _random_word(rng: random.Random, alphabet: str) -> str:
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+
+
+def _random_text(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.05:
+        return ''.join(rng.choice(NEUTRAL) for _ in range(rng.randint(0, 6)))
+    # Skewed word counts: most comments are short, a few are very long
+    word_count = min(int(rng.lognormvariate(2.5, 1.0)) + 1, 400)
+    ru_share = rng.choice([0.0, 0.0, 1.0, 1.0, 0.8, 0.9, 0.5])
+    words = [
+        _random_word(rng, RU_ALPHABET if rng.random() < ru_share else LV_ALPHABET)
+        for _ in range(word_count)
+    ]
+    return ' '.join(words)
+
+
+def generate_corpus(size: int, seed: int = 42) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'region': [rng.choice(REGIONS) for _ in range(size)],
+        'comment_text': [_random_text(rng) for _ in range(size)],
+    })
+
+
+def run_benchmark(size: int, repeat: int):
+    df = generate_corpus(size)
+    print(f'Generated {len(df)} comments ({df["comment_text"].str.len().sum()} characters)')
+
+    apply_times = []
+    batch_times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        expected = df.apply(lambda row: determine_text_language(row['comment_text'], row['region']), axis=1)
+        apply_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        actual = determine_text_language_batch(df['comment_text'], df['region'])
+        batch_times.append(time.perf_counter() - t0)
+
+    mismatches = int((expected != actual).sum())
+    apply_best = min(apply_times)
+    batch_best = min(batch_times)
+    print(f'apply(axis=1): {apply_best:.3f}s ({size / apply_best:,.0f} rows/s)')
+    print(f'batch:         {batch_best:.3f}s ({size / batch_best:,.0f} rows/s)')
+    print(f'speedup:       {apply_best / batch_best:.1f}x')
+    print(f'mismatches:    {mismatches}')
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare row-wise and vectorized comment language detection.')
+    parser.add_argument('--size', type=int, default=100_000, help='number of generated comments')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions (best run is reported)')
+    args = parser.parse_args()
+    run_benchmark(args.size, args.repeat)
@@ -0,0 +1,95 @@
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from core import lemma_vocabulary
+from db import crud_utils, database
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+BOTH = "lemmas IS NOT NULL AND lemma_ids IS NOT NULL"
+
+
+def column_sizes(session):
+    """Rows holding both representations, the bytes they take on disk and as text on the wire."""
+    return session.execute(text(
+        "SELECT count(*), "
+        "coalesce(sum(pg_column_size(lemmas) + coalesce(pg_column_size(words), 0)), 0), "
+        "coalesce(sum(pg_column_size(lemma_ids) + coalesce(pg_column_size(word_ids), 0)), 0), "
+        "coalesce(sum(octet_length(lemmas::text)), 0), coalesce(sum(octet_length(lemma_ids::text)), 0) "
+        f"FROM lemmatized_comments WHERE {BOTH}"
+    )).one()
+
+
+def count_json_lemmas(session, lang: str) -> Counter:
+    """The frequency job before lemma ids: a Counter over every comment's JSON lemmas."""
+    counter = Counter()
+    for (lemmas,) in session.execute(text(
+        "SELECT lc.lemmas FROM lemmatized_comments lc JOIN comments c ON c.id = lc.comment_id "
+        f"WHERE c.comment_lang = :lang AND {BOTH}"
+    ), {'lang': lang}):
+        if lemmas:
+            counter.update(lemmas)
+    return counter
+
+
+def count_lemma_ids(session, lang: str) -> np.ndarray:
+    rows = session.execute(text(
+        "SELECT lc.lemma_ids FROM lemmatized_comments lc JOIN comments c ON c.id = lc.comment_id "
+        f"WHERE c.comment_lang = :lang AND {BOTH}"
+    ), {'lang': lang}).scalars().all()
+    lemma_ids, _ = lemma_vocabulary.flatten_ids(rows)
+    return np.bincount(lemma_ids)
+
+
+def best_time(function, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def run_benchmark(langs, repeat: int):
+    session = SessionLocal()
+    try:
+        rows, json_bytes, array_bytes, json_text, array_text = column_sizes(session)
+        if not rows:
+            print('No rows with both JSON and lemma ids; run core.backfill_lemma_ids (without --clear-json) first')
+            return
+        vocabulary_bytes, vocabulary_size = session.execute(text(
+            "SELECT pg_total_relation_size('lemma_vocabulary'), count(*) FROM lemma_vocabulary"
+        )).one()
+        print(f'{rows} lemmatized comments, {vocabulary_size} vocabulary tokens')
+        print(f'  JSON lemmas + words:  {json_bytes / 2**20:10.2f} MB ({json_bytes / rows:6.1f} bytes/row)')
+        print(f'  lemma_ids + word_ids: {array_bytes / 2**20:10.2f} MB ({array_bytes / rows:6.1f} bytes/row, '
+              f'{json_bytes / array_bytes:.1f}x smaller) + {vocabulary_bytes / 2**20:.2f} MB lemma_vocabulary')
+        print(f'  lemmas sent as text:  {json_text / 2**20:10.2f} MB JSON vs {array_text / 2**20:.2f} MB ids '
+              f'({json_text / max(array_text, 1):.1f}x less)')
+
+        for lang in langs:
+            json_time, counter = best_time(lambda: count_json_lemmas(session, lang), repeat)
+            ids_time, counts = best_time(lambda: count_lemma_ids(session, lang), repeat)
+            tokens = crud_utils.get_vocabulary_tokens(session, np.flatnonzero(counts).tolist())
+            same = {tokens[vocabulary_id]: int(counts[vocabulary_id]) for vocabulary_id in tokens} == dict(counter)
+            print(f'  [{lang}] lemma frequencies from JSON: {json_time * 1000:9.1f} ms')
+            print(f'  [{lang}] lemma frequencies from ids:  {ids_time * 1000:9.1f} ms '
+                  f'({json_time / ids_time:.1f}x, {"same" if same else "DIFFERENT"} counts)')
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare size, transfer volume and frequency counting speed of JSON and integer[] lemmas '
+                    'in lemmatized_comments.')
+    parser.add_argument('--lang', choices=['lv', 'ru'], nargs='+', default=['lv', 'ru'])
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions (best run is reported)')
+    args = parser.parse_args()
+
+    run_benchmark(args.lang, args.repeat)
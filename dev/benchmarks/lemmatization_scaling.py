@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from core.lemmatize_comments import SUPPORTED_LANGUAGES, get_shared_stanza_pipeline, init_lemmatize_worker, lemmatize_batch
+from dev.benchmarks.prediction_backends import load_texts
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+worker_lang = {}
+
+
+def init_benchmark_worker(threads, lang):
+    init_lemmatize_worker(threads)
+    worker_lang['lang'] = lang
+    # Load Stanza up front so pipeline loading is not part of the timed run
+    get_shared_stanza_pipeline(lang)
+
+
+def lemmatize_texts_worker(texts):
+    comments = [SimpleNamespace(id=i, comment_text=comment_text) for i, comment_text in enumerate(texts)]
+    lemmatize_batch(get_shared_stanza_pipeline(worker_lang['lang']), comments)
+    return len(texts)
+
+
+def run_workers(lang, texts, workers, threads, batch_size):
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_benchmark_worker,
+                             initargs=(threads, lang)) as executor:
+        # One trivial task per worker so every process has finished initializing before timing starts
+        list(executor.map(lemmatize_texts_worker, [texts[:1]] * workers))
+        t0 = time.perf_counter()
+        lemmatized = sum(executor.map(lemmatize_texts_worker, batches))
+        return lemmatized, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure Stanza lemmatization throughput over 1/2/4/8 worker processes.')
+    parser.add_argument('--lang', choices=SUPPORTED_LANGUAGES, default='lv')
+    parser.add_argument('--limit', type=int, default=4_000, help='comments taken from the database')
+    parser.add_argument('--batch-size', type=int, default=500, help='comments per task handed to a worker')
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKER_COUNTS)
+    parser.add_argument('--cores', type=int, default=os.cpu_count(),
+                        help='cores shared by the workers; each gets cores // workers threads')
+    args = parser.parse_args()
+
+    texts = load_texts(args.lang, args.limit)
+    print(f'{len(texts)} {args.lang} comments, {args.cores} cores')
+    baseline = None
+    for workers in args.workers:
+        threads = max(1, args.cores // workers)
+        lemmatized, seconds = run_workers(args.lang, texts, workers, threads, args.batch_size)
+        rate = lemmatized / seconds
+        baseline = baseline or rate
+        print(f'  {workers} worker(s) x {threads} thread(s): {rate:10,.1f} comments/s | '
+              f'speedup {rate / baseline:4.2f}x | efficiency {rate / baseline / workers:.0%}')
@@ -0,0 +1,85 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+VARIANTS = ['from_pretrained', 'mmap']
+DEFAULT_MODELS = ['lvbert-lv-emotions-ekman', 'rubert-base-cased-ru-go-emotions-ekman']
+
+
+def memory_mb() -> dict:
+    # Rss counts mapped file pages other processes can share; Anonymous is this process's private copy
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Anonymous'):
+                values[name.lower()] = int(rest.split()[0]) / 1024
+    return values
+
+
+def run_child(variant: str, model: str):
+    """Load one model in this (fresh) process and print the timings as JSON."""
+    t_start = time.perf_counter()
+    import torch
+    from core import load_model
+    from core.fast_weights import load_fast_model
+    from path_config import models_path
+    from transformers import AutoModelForSequenceClassification
+    import_seconds = time.perf_counter() - t_start
+
+    model_name = load_model.get_model_name(model) or model
+    t0 = time.perf_counter()
+    if variant == 'mmap':
+        classifier = load_fast_model(model_name)
+    else:
+        classifier = AutoModelForSequenceClassification.from_pretrained(
+            model_name, local_files_only=True, cache_dir=models_path()
+        ).eval()
+    load_seconds = time.perf_counter() - t0
+
+    # The first forward pass touches every weight, so lazily mapped pages are paid for here
+    t0 = time.perf_counter()
+    with torch.inference_mode():
+        classifier(input_ids=torch.ones((8, 64), dtype=torch.long))
+    first_batch_seconds = time.perf_counter() - t0
+    print(json.dumps({
+        'import_seconds': import_seconds,
+        'load_seconds': load_seconds,
+        'first_batch_seconds': first_batch_seconds,
+        **memory_mb(),
+    }))
+
+
+def measure(variant: str, model: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-m', 'dev.benchmarks.model_cold_start', '--child', variant, '--model', model],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare cold-start time of from_pretrained and the mmap-able weights of download_models.py.')
+    parser.add_argument('--model', nargs='+', default=DEFAULT_MODELS, help='model short names or names')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh processes per variant (median is reported)')
+    parser.add_argument('--child', choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.model[0])
+        sys.exit()
+
+    for model in args.model:
+        print(model)
+        for variant in VARIANTS:
+            result = measure(variant, model, args.repeat)
+            print(f"  {variant:15} load {result['load_seconds']:6.2f}s | first batch {result['first_batch_seconds']:5.2f}s"
+                  f" | imports {result['import_seconds']:5.2f}s | RSS {result['rss']:6,.0f} MB, "
+                  f"private {result['anonymous']:6,.0f} MB")
@@ -0,0 +1,71 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+from sqlalchemy.orm import sessionmaker
+
+from core import load_model
+from core.predict_comments import PREDICTION_MODELS
+from db import database, models
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+
+def load_texts(lang: str, limit: int) -> list[str]:
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(models.Comment.comment_text)
+            .filter(models.Comment.comment_lang == lang, models.Comment.comment_text != None)
+            .order_by(models.Comment.id)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        session.close()
+    # Same length ordering predict_comments uses, so padding per batch is comparable
+    return sorted((row.comment_text for row in rows), key=len)
+
+
+def time_pipeline(pipeline, texts, batch_size, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with torch.inference_mode():
+            results = pipeline(texts, batch_size=batch_size, truncation=True)
+        timings.append(time.perf_counter() - t0)
+    return results, min(timings)
+
+
+def run_benchmark(model_shortname, texts, batch_size, repeat):
+    print(f'{model_shortname}: {len(texts)} comments, batch size {batch_size}')
+    reference, torch_time = time_pipeline(load_model.get_pipeline_for_model(model_shortname, 'torch'),
+                                          texts, batch_size, repeat)
+    candidate, onnx_time = time_pipeline(load_model.get_pipeline_for_model(model_shortname, 'onnx'),
+                                         texts, batch_size, repeat)
+
+    agreement = np.mean([ref[0]['label'] == cand[0]['label'] for ref, cand in zip(reference, candidate)])
+    max_score_diff = max(
+        abs({e['label']: e['score'] for e in ref}[e['label']] - e['score'])
+        for ref, cand in zip(reference, candidate) for e in cand
+    )
+    print(f'  torch: {len(texts) / torch_time:,.1f} comments/s')
+    print(f'  onnx:  {len(texts) / onnx_time:,.1f} comments/s ({torch_time / onnx_time:.2f}x)')
+    print(f'  top-label agreement: {agreement:.2%}, max score difference: {max_score_diff:.5f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare PyTorch and ONNX Runtime emotion classifiers on CPU.')
+    parser.add_argument('--lang', choices=list(PREDICTION_MODELS), nargs='+', default=list(PREDICTION_MODELS))
+    parser.add_argument('--limit', type=int, default=2_000, help='comments per language, taken from the database')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=1, help='timing repetitions (best run is reported)')
+    args = parser.parse_args()
+
+    for lang in args.lang:
+        texts = load_texts(lang, args.limit)
+        if not texts:
+            print(f'[{lang}] no comments in the database, skipping')
+            continue
+        run_benchmark(PREDICTION_MODELS[lang], texts, args.batch_size, args.repeat)
@@ -0,0 +1,56 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from core import predict_comments
+from core.predict_comments import PREDICTION_MODELS, get_worker_pipeline, init_prediction_worker, predict_texts
+from dev.benchmarks.prediction_backends import load_texts
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def init_benchmark_worker(backend, threads, max_batch_tokens, lang):
+    init_prediction_worker(backend, threads, max_batch_tokens)
+    # Load the model up front so model loading is not part of the timed run
+    get_worker_pipeline(lang)
+
+
+def predict_texts_worker(lang, texts):
+    predict_texts(get_worker_pipeline(lang), texts, predict_comments.worker_settings['max_batch_tokens'])
+    return len(texts)
+
+
+def run_workers(lang, texts, workers, threads, backend, shard_size, max_batch_tokens):
+    shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_benchmark_worker,
+                             initargs=(backend, threads, max_batch_tokens, lang)) as executor:
+        # One trivial task per worker so every process has finished initializing before timing starts
+        list(executor.map(predict_texts_worker, [lang] * workers, [texts[:1]] * workers))
+        t0 = time.perf_counter()
+        predicted = sum(executor.map(predict_texts_worker, [lang] * len(shards), shards))
+        return predicted, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure prediction throughput over 1/2/4/8 worker processes.')
+    parser.add_argument('--lang', choices=list(PREDICTION_MODELS), default='lv')
+    parser.add_argument('--backend', choices=predict_comments.BACKENDS, default='onnx')
+    parser.add_argument('--limit', type=int, default=4_000, help='comments taken from the database')
+    parser.add_argument('--shard-size', type=int, default=250, help='comments per task handed to a worker')
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKER_COUNTS)
+    parser.add_argument('--cores', type=int, default=os.cpu_count(),
+                        help='cores shared by the workers; each gets cores // workers threads')
+    args = parser.parse_args()
+
+    texts = load_texts(args.lang, args.limit)
+    print(f'{len(texts)} {args.lang} comments, {args.backend} backend, {args.cores} cores')
+    baseline = None
+    for workers in args.workers:
+        threads = max(1, args.cores // workers)
+        predicted, seconds = run_workers(args.lang, texts, workers, threads, args.backend, args.shard_size,
+                                         predict_comments.MAX_BATCH_TOKENS)
+        rate = predicted / seconds
+        baseline = baseline or rate
+        print(f'  {workers} worker(s) x {threads} thread(s): {rate:10,.1f} comments/s | '
+              f'speedup {rate / baseline:4.2f}x | efficiency {rate / baseline / workers:.0%}')
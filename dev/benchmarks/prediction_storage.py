@@ -0,0 +1,69 @@
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from db import database
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+
+def column_sizes(session, name: str):
+    """Rows holding both representations, and the bytes their JSON and their score arrays take."""
+    return session.execute(text(
+        f"SELECT count(*), coalesce(sum(pg_column_size({name}_prediction_json)), 0), "
+        f"coalesce(sum(pg_column_size({name}_scores)), 0) FROM predicted_comments "
+        f"WHERE {name}_prediction_json IS NOT NULL AND {name}_scores IS NOT NULL"
+    )).one()
+
+
+def best_time(session, sql: str, params: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        session.execute(text(sql), params).all()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def run_benchmark(name: str, repeat: int):
+    session = SessionLocal()
+    try:
+        labels = session.execute(
+            text("SELECT labels FROM prediction_label_sets WHERE name = :name"), {'name': name}
+        ).scalar()
+        rows, json_bytes, array_bytes = column_sizes(session, name)
+        if not labels or not rows:
+            print(f'[{name}] no rows with both JSON and score arrays; run core.backfill_prediction_scores first')
+            return
+        print(f'[{name}] {rows} rows, {len(labels)} labels')
+        print(f'  JSON:   {json_bytes / 2**20:10.2f} MB ({json_bytes / rows:6.1f} bytes/row)')
+        print(f'  arrays: {array_bytes / 2**20:10.2f} MB ({array_bytes / rows:6.1f} bytes/row, '
+              f'{json_bytes / array_bytes:.1f}x smaller)')
+
+        # Mean score of every label per day, the typical dashboard aggregation
+        where = f"WHERE {name}_prediction_json IS NOT NULL AND {name}_scores IS NOT NULL"
+        json_sql = ', '.join(f"avg(CAST({name}_prediction_json ->> :label_{i} AS real))" for i in range(len(labels)))
+        array_sql = ', '.join(f"avg({name}_scores[{i + 1}])" for i in range(len(labels)))
+        params = {f'label_{i}': label for i, label in enumerate(labels)}
+        day = "date_trunc('day', comment_timestamp)"
+        json_time = best_time(session, f"SELECT {day}, {json_sql} FROM predicted_comments {where} GROUP BY 1",
+                              params, repeat)
+        array_time = best_time(session, f"SELECT {day}, {array_sql} FROM predicted_comments {where} GROUP BY 1",
+                               {}, repeat)
+        print(f'  mean scores per day from JSON:   {json_time * 1000:9.1f} ms')
+        print(f'  mean scores per day from arrays: {array_time * 1000:9.1f} ms ({json_time / array_time:.1f}x)')
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare size and aggregation speed of JSON and real[] prediction scores in predicted_comments.')
+    parser.add_argument('--label-set', choices=['ekman', 'normal'], nargs='+', default=['ekman', 'normal'])
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions (best run is reported)')
+    args = parser.parse_args()
+
+    for name in args.label_set:
+        run_benchmark(name, args.repeat)
@@ -0,0 +1,228 @@
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.orm import Session
+
+from core.predict_comments import BACKENDS, PREDICTION_MODELS
+from db import crud_utils
+from db.base import Base
+
+SCHEMA_PREFIX = 'bench_prediction'
+ARTICLE_COUNT = 50
+
+# Frequent words of news comments, so the tokenizers see real subwords rather than random letters
+LV_WORDS = (
+    'un ir ka par to nav bet kas ar no uz vai tas tā ja arī jau tikai vēl būs valdība latvija cilvēki '
+    'nauda laiks gads darbs valsts pilsēta skola cenas nodokļi vēlēšanas partija deputāti saeima policija '
+    'ārsti slimnīca pensija alga bērni ģimene krievija ukraina karš drošība tiesa likums skandāls kauns '
+    'labi slikti pareizi muļķības patiesība meli paldies jāuzmanās domāju saprotu zinu redzu gribu nevar '
+    'vajag jādara jāmaksā strādāt dzīvot braukt runāt klausīties balsot mainīt pārāk ļoti vienmēr nekad'
+).split()
+RU_WORDS = (
+    'и в не на что это как но все так же по ты он она они мы вы был будет уже еще только даже '
+    'правительство латвия люди деньги время год работа страна город школа цены налоги выборы партия '
+    'депутаты сейм полиция врачи больница пенсия зарплата дети семья россия украина война безопасность '
+    'суд закон скандал позор хорошо плохо правильно ерунда правда ложь спасибо думаю понимаю знаю вижу '
+    'хочу нельзя надо платить работать жить ехать говорить слушать голосовать менять слишком очень всегда'
+).split()
+PUNCTUATION = ['.', '.', '!', '?', ',', '...', '!!!']
+EMOJI = ['😀', '👍', '🔥', '😡', '🤦']
+
+
+def _random_comment(rng: random.Random, words: list) -> str:
+    # Lognormal word counts: most comments are a short sentence, a few run to several hundred words
+    word_count = min(int(rng.lognormvariate(2.7, 1.0)) + 1, 400)
+    parts = []
+    for _ in range(word_count):
+        word = rng.choice(words)
+        if rng.random() < 0.08:
+            word = word.capitalize()
+        parts.append(word)
+        if rng.random() < 0.07:
+            parts[-1] += rng.choice(PUNCTUATION)
+    comment = ' '.join(parts)
+    if rng.random() < 0.05:
+        comment += ' ' + rng.choice(EMOJI)
+    return comment
+
+
+def generate_corpus(size: int, seed: int = 42) -> pd.DataFrame:
+    """size comments per language, with distinct authors so none collapse on the natural key."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    rows = []
+    for lang, words in (('lv', LV_WORDS), ('ru', RU_WORDS)):
+        for i in range(size):
+            rows.append({
+                'region': lang,
+                'article_id': rng.randint(1, ARTICLE_COUNT),
+                'user_nickname': f'{lang}-{i}',
+                'timestamp': start + datetime.timedelta(seconds=rng.randint(0, 365 * 86_400)),
+                'comment_text': _random_comment(rng, words),
+                'comment_lang': lang,
+                'website': 'delfi',
+            })
+    return pd.DataFrame(rows)
+
+
+def schema_url(database_url: str, schema: str) -> str:
+    url = make_url(database_url).update_query_dict({'options': f'-csearch_path={schema}'})
+    return url.render_as_string(hide_password=False)
+
+
+def create_benchmark_schema(database_url: str, schema: str, corpus: pd.DataFrame):
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text(f'CREATE SCHEMA {schema}'))
+    engine.dispose()
+
+    engine = create_engine(schema_url(database_url, schema))
+    Base.metadata.create_all(engine)
+    articles = pd.DataFrame({
+        'article_id': range(1, ARTICLE_COUNT + 1),
+        'headline': [f'article {i}' for i in range(1, ARTICLE_COUNT + 1)],
+        'website': 'delfi',
+    })
+    with Session(engine) as session:
+        crud_utils.copy_insert_articles(articles, session)
+        crud_utils.copy_insert_comments(corpus, session)
+    engine.dispose()
+
+
+def drop_benchmark_schema(database_url: str, schema: str):
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS {schema} CASCADE'))
+    engine.dispose()
+
+
+def reset_predictions(database_url: str):
+    # Every configuration predicts the whole corpus again
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text('TRUNCATE predicted_comments'))
+        connection.execute(text(
+            "INSERT INTO comment_work_queue (stage, comment_id, comment_lang, website) "
+            "SELECT :stage, id, comment_lang, website FROM comments ON CONFLICT DO NOTHING"
+        ), {'stage': crud_utils.PREDICT_STAGE})
+    engine.dispose()
+
+
+def run_configuration(lang, backend, threads, max_batch_tokens, max_batch_size):
+    """Runs in a fresh process whose DATABASE_URL points at the benchmark schema."""
+    from core import load_model, predict_comments
+    from core.token_batching import BatchStats
+
+    predict_comments.show_progress = False
+    predict_comments.MAX_BATCH_SIZE = max_batch_size
+    pipeline = load_model.get_pipeline_for_model(PREDICTION_MODELS[lang], backend, threads)
+    stats = BatchStats()
+    t0 = time.perf_counter()
+    # No model_id: the prediction cache would turn repeated runs into lookups
+    processed = predict_comments.process_language(pipeline, lang, website='delfi',
+                                                  max_batch_tokens=max_batch_tokens, stats=stats)
+    seconds = time.perf_counter() - t0
+    return {
+        'lang': lang,
+        'backend': backend,
+        'threads': threads,
+        'max_batch_tokens': max_batch_tokens,
+        'max_batch_size': max_batch_size,
+        'comments': processed,
+        'seconds': round(seconds, 3),
+        'comments_per_sec': round(processed / seconds, 2) if seconds else 0.0,
+        'batches': stats.batches,
+        'batch_p50_ms': round(stats.latency_percentile(50) * 1000, 2),
+        'batch_p99_ms': round(stats.latency_percentile(99) * 1000, 2),
+        'padding_waste': round(stats.total_padding_waste, 4),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_suite(database_url, corpus, langs, backends, thread_counts, token_budgets, batch_sizes, keep_schema=False):
+    schema = f'{SCHEMA_PREFIX}_{os.getpid()}'
+    bench_url = schema_url(database_url, schema)
+    print(f'Loading {len(corpus)} synthetic comments into schema {schema}...')
+    create_benchmark_schema(database_url, schema, corpus)
+
+    # Spawned children import db.database afresh, so their engine binds to the benchmark schema
+    os.environ['DATABASE_URL'] = bench_url
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for lang, backend, threads, max_batch_tokens, max_batch_size in itertools.product(
+                langs, backends, thread_counts, token_budgets, batch_sizes):
+            reset_predictions(bench_url)
+            # One process per configuration keeps peak RSS and thread settings from leaking between runs
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_configuration, lang, backend, threads, max_batch_tokens,
+                                         max_batch_size).result()
+            results.append(result)
+            print(f"  [{lang}] {backend:9} {threads:2} thread(s), {max_batch_tokens:6} tokens/batch, "
+                  f"<= {max_batch_size} comments: {result['comments_per_sec']:9,.1f} comments/s | "
+                  f"batch p50 {result['batch_p50_ms']:8.1f} ms, p99 {result['batch_p99_ms']:8.1f} ms | "
+                  f"peak RSS {result['peak_rss_mb']:,.0f} MB")
+    finally:
+        os.environ['DATABASE_URL'] = database_url
+        if keep_schema:
+            print(f'Kept schema {schema}')
+        else:
+            drop_benchmark_schema(database_url, schema)
+    return results
+
+
+def corpus_summary(corpus: pd.DataFrame, seed: int) -> dict:
+    lengths = corpus['comment_text'].str.len()
+    return {
+        'seed': seed,
+        'comments': corpus['comment_lang'].value_counts().to_dict(),
+        'chars_p50': float(np.percentile(lengths, 50)),
+        'chars_p99': float(np.percentile(lengths, 99)),
+        'chars_max': int(lengths.max()),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure predict_comments throughput on a synthetic lv/ru corpus in a throwaway schema.')
+    parser.add_argument('--size', type=int, default=2_000, help='generated comments per language')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--lang', choices=list(PREDICTION_MODELS), nargs='+', default=list(PREDICTION_MODELS))
+    parser.add_argument('--backend', choices=BACKENDS, nargs='+', default=['torch', 'onnx'])
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument('--max-batch-tokens', type=int, nargs='+', default=[4_096, 16_384])
+    parser.add_argument('--max-batch-size', type=int, nargs='+', default=[256],
+                        help='cap on comments per batch, on top of the token budget')
+    parser.add_argument('--output', default='prediction_benchmark.json', help='JSON report path')
+    parser.add_argument('--keep-schema', action='store_true', help='leave the benchmark schema for inspection')
+    args = parser.parse_args()
+
+    database_url = os.environ['DATABASE_URL']
+    corpus = generate_corpus(args.size, args.seed)
+    started_at = datetime.datetime.now()
+    results = run_suite(database_url, corpus, args.lang, args.backend, args.threads, args.max_batch_tokens,
+                        args.max_batch_size, args.keep_schema)
+
+    import torch
+    report = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'cpu_count': os.cpu_count(),
+        'torch_version': torch.__version__,
+        'corpus': corpus_summary(corpus, args.seed),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Report written to {args.output}')
@@ -0,0 +1,110 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from core.predict_comments import PREDICTION_MODELS
+from dev.benchmarks.prediction_suite import (
+    create_benchmark_schema, drop_benchmark_schema, generate_corpus, reset_predictions, schema_url,
+)
+
+SCHEMA_PREFIX = 'bench_tokens'
+
+
+def stored_scores(database_url: str, lang: str) -> dict:
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT comment_id, ekman_scores FROM predicted_comments WHERE text_lang = :lang"
+        ), {'lang': lang}).all()
+    engine.dispose()
+    return {comment_id: np.array(scores) for comment_id, scores in rows}
+
+
+def run_language(database_url: str, lang: str, backend: str, threads: int) -> dict:
+    """Runs in a fresh process whose DATABASE_URL points at the benchmark schema."""
+    from core import load_model, predict_comments, token_store
+    from db import database
+
+    predict_comments.show_progress = False
+    pipeline = load_model.get_pipeline_for_model(PREDICTION_MODELS[lang], backend, threads)
+
+    session = token_store.SessionLocal()
+    t0 = time.perf_counter()
+    token_store.store_language_tokens(session, pipeline.tokenizer, lang)
+    store_seconds = time.perf_counter() - t0
+    session.close()
+
+    result = {'lang': lang, 'backend': backend, 'store_seconds': store_seconds}
+    scores = {}
+    for stored_tokens in (False, True):
+        reset_predictions(database_url)
+        timers = {}
+        t0 = time.perf_counter()
+        # No model_id: the prediction cache would turn the second run into lookups
+        processed = predict_comments.process_language(pipeline, lang, website='delfi', stored_tokens=stored_tokens,
+                                                      timers=timers)
+        variant = 'stored' if stored_tokens else 'tokenized'
+        result[variant] = {
+            'comments': processed,
+            'seconds': time.perf_counter() - t0,
+            'tokenize_seconds': timers['tokenize'].busy,
+        }
+        scores[variant] = stored_scores(database_url, lang)
+    database.engine.dispose()
+    result['max_score_difference'] = max(
+        (float(np.abs(scores['tokenized'][comment_id] - stored).max()) for comment_id, stored in scores['stored'].items()),
+        default=0.0,
+    )
+    return result
+
+
+def run_benchmark(database_url, size, seed, langs, backend, threads, keep_schema=False):
+    schema = f'{SCHEMA_PREFIX}_{os.getpid()}'
+    bench_url = schema_url(database_url, schema)
+    print(f'Loading {2 * size} synthetic comments into schema {schema}...')
+    create_benchmark_schema(database_url, schema, generate_corpus(size, seed))
+
+    # Spawned children import db.database afresh, so their engine binds to the benchmark schema
+    os.environ['DATABASE_URL'] = bench_url
+    context = multiprocessing.get_context('spawn')
+    try:
+        for lang in langs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_language, bench_url, lang, backend, threads).result()
+            tokenized, stored = result['tokenized'], result['stored']
+            saved = tokenized['tokenize_seconds'] - stored['tokenize_seconds']
+            print(f"[{lang}] storing tokens once: {result['store_seconds']:.1f}s")
+            for variant in ('tokenized', 'stored'):
+                run = result[variant]
+                print(f"  {variant:9} {run['comments']} comments in {run['seconds']:7.1f}s "
+                      f"({run['comments'] / run['seconds']:8,.1f} comments/s), "
+                      f"tokenize stage busy {run['tokenize_seconds']:6.2f}s")
+            print(f"  tokenization saved per re-prediction: {saved:.2f}s; "
+                  f"max score difference {result['max_score_difference']:.1e}")
+    finally:
+        os.environ['DATABASE_URL'] = database_url
+        if keep_schema:
+            print(f'Kept schema {schema}')
+        else:
+            drop_benchmark_schema(database_url, schema)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare a full re-prediction that tokenizes comment texts with one reading core.token_store '
+                    'tokens, on a synthetic corpus in a throwaway schema.')
+    parser.add_argument('--size', type=int, default=5_000, help='generated comments per language')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--lang', choices=list(PREDICTION_MODELS), nargs='+', default=list(PREDICTION_MODELS))
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'onnx-int8'], default='torch')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--keep-schema', action='store_true', help='leave the benchmark schema for inspection')
+    args = parser.parse_args()
+
+    run_benchmark(os.environ['DATABASE_URL'], args.size, args.seed, args.lang, args.backend, args.threads,
+                  args.keep_schema)
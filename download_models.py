@@ -2,6 +2,7 @@ import os
 import requests
 import stanza
 from transformers import AutoModel, AutoTokenizer
+from core.fast_weights import save_fast_weights
 
 def download_huggingface_model(model_name, cache_dir):
     print(f"Checking for model: {model_name} in {cache_dir}")
@@ -46,6 +47,10 @@ if __name__ == '__main__':
     for model_name in model_names:
         download_huggingface_model(model_name, cache_dir="./models")
 
+    # Save mmap-able copies of the weights, which load_model prefers for fast start-up
+    for model_name in model_names:
+        save_fast_weights(model_name, cache_dir="./models")
+
     # Download FastText lid.176.bin model
     fasttext_url = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.bin"
     download_fasttext_model(fasttext_url, cache_dir="./models")